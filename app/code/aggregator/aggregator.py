@@ -1,9 +1,16 @@
-from typing import Dict, Any
+import logging
+from typing import Dict, Any, Iterator, List, Optional
 from nvflare.apis.shareable import Shareable
 from nvflare.apis.fl_context import FLContext
 from nvflare.app_common.abstract.aggregator import Aggregator
 from nvflare.apis.fl_constant import ReservedKey
-from .calculate_global_values import calculate_global_values
+from utils.result_store import save_results_to_store
+from utils.significance_filter import significance_filter_settings, split_by_significance
+from .calculate_global_values import calculate_global_values, finalize_global_values, select_cross_validated_alphas
+from .calculate_global_bootstrap import calculate_global_bootstrap_intervals, finalize_bootstrap_intervals
+from .relay_aggregation import RelayTree
+from .contribution_store import SiteContributionStore, parameters_hash
+from .global_block_spool import GlobalBlockSpool
 
 class SrrAggregator(Aggregator):
     """
@@ -13,12 +20,68 @@ class SrrAggregator(Aggregator):
     This class can be customized if specific aggregation logic is needed.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        result_store_path: str = "",
+        relay_group_size: int = 0,
+        max_relays: int = 0,
+        contribution_store_path: str = "",
+    ):
         """
         Initializes the SrrAggregator with a dictionary to store results from multiple sites.
+
+        :param result_store_path: Optional path of a SQLite result store on the server.
+                                  When set, the global result is also indexed there.
+        :param relay_group_size: Number of sites pre-combined by each relay process in hierarchical
+                                 mode. 0 (the default) aggregates all sites directly.
+        :param max_relays: Number of relay processes in hierarchical mode. 0 uses one per CPU.
+        :param contribution_store_path: Optional directory where the contribution of every site is
+                                        persisted, keyed by site, data fingerprint and parameters.
+                                        Follow-up jobs then only rerun changed or new sites.
         """
         super().__init__()
         self.site_results: Dict[str, Dict[str, Any]] = {}  # Store results as a dictionary
+        self.site_bootstrap: Dict[str, Dict[str, Any]] = {}  # Per-resample coefficients, when bootstrapping
+        self._result_store_path = result_store_path
+        self._relay_tree = RelayTree(relay_group_size, max_relays or None) if relay_group_size > 0 else None
+        self._contribution_store = SiteContributionStore(contribution_store_path) if contribution_store_path else None
+        self.site_fingerprints: Dict[str, str] = {}  # Data fingerprints reported by the sites in this job
+        self._spool = GlobalBlockSpool()  # Global blocks held back until their p-values are corrected
+
+    @property
+    def has_contribution_store(self) -> bool:
+        return self._contribution_store is not None
+
+    def accept_fingerprint(self, site_fingerprint: Shareable, fl_ctx: FLContext) -> bool:
+        """
+        Accepts the data fingerprint of a site, used to look up its stored contribution.
+
+        :param site_fingerprint: The fingerprint received from the client site.
+        :param fl_ctx: The federated learning context for this run.
+        :return: Boolean indicating if the fingerprint was accepted.
+        """
+        site_name = site_fingerprint.get_peer_prop(key=ReservedKey.IDENTITY_NAME, default=None)
+        self.site_fingerprints[site_name] = site_fingerprint["fingerprint"]
+        return True
+
+    def reuse_stored_contributions(self, fl_ctx: FLContext) -> List[str]:
+        """
+        Accepts the stored contributions of every site whose data and parameters are unchanged.
+
+        :param fl_ctx: The federated learning context for this run.
+        :return: The sites without a stored contribution, which have to run the regression.
+        """
+        parameters_digest = parameters_hash(fl_ctx.get_prop("COMPUTATION_PARAMETERS"))
+        changed_sites = []
+        for site_name, fingerprint in self.site_fingerprints.items():
+            contribution = self._contribution_store.load(site_name, fingerprint, parameters_digest)
+            if contribution is None:
+                changed_sites.append(site_name)
+            else:
+                self._accept_site_result(site_name, *contribution)
+        logging.info(f"Reusing stored contributions of {len(self.site_fingerprints) - len(changed_sites)} sites; "
+                     f"{len(changed_sites)} sites changed or are new")
+        return changed_sites
 
     def accept(self, site_result: Shareable, fl_ctx: FLContext) -> bool:
         """
@@ -33,11 +96,35 @@ class SrrAggregator(Aggregator):
         """
         site_name = site_result.get_peer_prop(
             key=ReservedKey.IDENTITY_NAME, default=None)
-        
-        # Store the result for the site using its identity name as the key
-        self.site_results[site_name] = site_result["result"]
+
+        # Persist the contribution of the site for follow-up jobs
+        if self._contribution_store is not None and site_name in self.site_fingerprints:
+            self._contribution_store.save(
+                site_name, self.site_fingerprints[site_name],
+                parameters_hash(fl_ctx.get_prop("COMPUTATION_PARAMETERS")),
+                site_result["result"], site_result.get("bootstrap"))
+
+        self._accept_site_result(site_name, site_result["result"], site_result.get("bootstrap"))
         return True
 
+    def _accept_site_result(self, site_name: str, result: Dict[str, Any], bootstrap: Optional[Dict[str, Any]]) -> None:
+        """
+        Stores the result (and bootstrap replicates) of a site for aggregation.
+
+        :param site_name: Identity name of the site.
+        :param result: Regression results of the site.
+        :param bootstrap: Per-resample coefficients of the site, if it bootstrapped.
+        """
+        # In hierarchical mode, the site's group is pre-combined by a relay process
+        if self._relay_tree is not None:
+            self._relay_tree.add(site_name, result, bootstrap)
+            return
+
+        # Store the result for the site using its identity name as the key
+        self.site_results[site_name] = result
+        if bootstrap is not None:
+            self.site_bootstrap[site_name] = bootstrap
+
     def aggregate(self, fl_ctx: FLContext) -> Shareable:
         """
         Aggregates the results from all accepted client sites and produces a global result.
@@ -48,10 +135,104 @@ class SrrAggregator(Aggregator):
         :param fl_ctx: The federated learning context for this run.
         :return: A Shareable object containing the aggregated global result.
         """
-        # Retrieve the computation parameters (e.g., covariates) for the aggregation
-        covariates_headers = fl_ctx.get_prop("COMPUTATION_PARAMETERS")["Covariates"]
+        computation_parameters = fl_ctx.get_prop("COMPUTATION_PARAMETERS")
+        return self._global_message(self._global_result(computation_parameters), computation_parameters, fl_ctx)
+
+    def spool_block(self, fl_ctx: FLContext) -> None:
+        """
+        Aggregates the current dependent block of the site results and holds the global
+        block back, as its p-values can only be corrected once every block is aggregated.
 
-        # Create a new Shareable to store the aggregated result
+        :param fl_ctx: The federated learning context for this run.
+        """
+        computation_parameters = fl_ctx.get_prop("COMPUTATION_PARAMETERS")
+        self._spool.add(self._global_result(computation_parameters, correct_multiple_comparisons=False))
+
+    def spooled_blocks(self, fl_ctx: FLContext) -> Iterator[Shareable]:
+        """
+        Yields the spooled global blocks in order, with p-values corrected over all dependents.
+
+        :param fl_ctx: The federated learning context for this run.
+        :return: A Shareable object per block, as returned by aggregate.
+        """
+        computation_parameters = fl_ctx.get_prop("COMPUTATION_PARAMETERS")
+        for block in self._spool.corrected_blocks():
+            yield self._global_message(block, computation_parameters, fl_ctx)
+
+    def discard_spooled_blocks(self) -> None:
+        """Discards the global blocks that were not sent, e.g. after an abort."""
+        self._spool.close()
+
+    def _global_result(self, computation_parameters: Dict[str, Any],
+                       correct_multiple_comparisons: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Combines the accepted site results (of one dependent block) into the global result.
+
+        :param computation_parameters: The computation parameters of the run.
+        :param correct_multiple_comparisons: Add p-values corrected over the dependents; only
+                                             meaningful when the site results hold every dependent.
+        :return: The global regression results, keyed by dependent.
+        """
+        covariates_headers = computation_parameters.get("Covariates", [])
+        intervals = None
+        if self._relay_tree is not None:
+            # The root merges only the partial aggregates of the relays
+            partial, partial_bootstrap = self._relay_tree.merge()
+            result = finalize_global_values(
+                partial, covariates_headers, correct_multiple_comparisons=correct_multiple_comparisons)
+            if partial_bootstrap is not None:
+                intervals = finalize_bootstrap_intervals(partial_bootstrap, self._confidence_level(computation_parameters))
+        elif not self.site_results:
+            # Every site failed, aborted or timed out
+            logging.error("No site results were accepted; the global result is empty")
+            result = {}
+        else:
+            result = calculate_global_values(
+                self.site_results, covariates_headers, correct_multiple_comparisons=correct_multiple_comparisons)
+            if self.site_bootstrap and set(self.site_bootstrap) == set(self.site_results):
+                intervals = calculate_global_bootstrap_intervals(
+                    self.site_results, self.site_bootstrap, self._confidence_level(computation_parameters))
+
+        # Replace the site intervals with global bootstrap intervals when every site bootstrapped
+        if intervals is not None:
+            for dependent_var, (lower, upper) in intervals.items():
+                result[dependent_var]["CI Lower"] = lower
+                result[dependent_var]["CI Upper"] = upper
+
+        # Use the ridge fit at the alpha chosen by the pooled cross-validation errors of the sites
+        if computation_parameters.get("CrossValidation"):
+            select_cross_validated_alphas(result, computation_parameters["CrossValidation"]["Alphas"])
+
+        # Results may arrive in dependent blocks; the next block starts from an empty state
+        self.site_results = {}
+        self.site_bootstrap = {}
+        return result
+
+    def _global_message(self, result: Dict[str, Dict[str, Any]], computation_parameters: Dict[str, Any],
+                        fl_ctx: FLContext) -> Shareable:
+        """
+        Creates the message of a global result (block) for the sites.
+
+        :param result: The global regression results, keyed by dependent.
+        :param computation_parameters: The computation parameters of the run.
+        :param fl_ctx: The federated learning context for this run.
+        :return: A Shareable object containing the global result.
+        """
         outgoing_shareable = Shareable()
-        outgoing_shareable["result"] = calculate_global_values(self.site_results, covariates_headers)
+        outgoing_shareable["result"] = result
+
+        # Optionally keep full detail only for the significant dependents; the others are sent
+        # (and stored by the sites) in compact columnar form
+        significance_filter = significance_filter_settings(computation_parameters)
+        if significance_filter is not None:
+            outgoing_shareable["result"], outgoing_shareable["compact_result"] = split_by_significance(
+                outgoing_shareable["result"], *significance_filter)
+
+        # Optionally index the global result on the server as well
+        if self._result_store_path:
+            save_results_to_store(outgoing_shareable["result"], self._result_store_path, fl_ctx.get_job_id())
         return outgoing_shareable
+
+    @staticmethod
+    def _confidence_level(computation_parameters: Dict[str, Any]) -> float:
+        return float(computation_parameters["Bootstrap"].get("ConfidenceLevel", 0.95))
@@ -0,0 +1,64 @@
+import numpy as np
+
+def calculate_global_bootstrap_intervals(site_results, site_bootstrap, confidence_level):
+    """
+    Global bootstrap percentile intervals of the coefficients.
+
+    Site resamples are drawn independently per site, so replicate b of the global
+    estimate combines replicate b of every site with the same subject weights
+    used for the global coefficients. The percentile interval is then taken over
+    the global replicates.
+
+    :param site_results: Regression results of each site, keyed by site name.
+    :param site_bootstrap: Per-resample coefficients of each site (resamples x covariates,
+                           without the intercept), keyed by site name and dependent.
+    :param confidence_level: Coverage of the percentile intervals.
+    :return: (lower, upper) bounds, including NaN for the intercept, keyed by dependent.
+    """
+    return finalize_bootstrap_intervals(calculate_partial_bootstrap(site_results, site_bootstrap), confidence_level)
+
+def calculate_partial_bootstrap(site_results, site_bootstrap):
+    """
+    Subject-weighted sums of the per-resample coefficients of a group of sites.
+
+    :return: (weighted sum of the replicates, number of subjects), keyed by dependent.
+    """
+    partial = {}
+
+    for dependent_var in site_results[next(iter(site_results))].keys():
+        weighted_sum_replicates = None
+        total_subjects = 0
+
+        for site, results in site_results.items():
+            n_subjects = results[dependent_var]["Degrees of Freedom"] + 1
+            total_subjects += n_subjects
+            replicates = np.asarray(site_bootstrap[site][dependent_var], dtype=np.float64) * n_subjects
+            if weighted_sum_replicates is None:
+                weighted_sum_replicates = replicates
+            else:
+                weighted_sum_replicates += replicates
+
+        partial[dependent_var] = (weighted_sum_replicates, total_subjects)
+
+    return partial
+
+def merge_partial_bootstraps(partials):
+    """Merge the partial bootstrap sums of disjoint groups of sites."""
+    return {
+        dependent_var: (
+            sum(partial[dependent_var][0] for partial in partials),
+            sum(partial[dependent_var][1] for partial in partials),
+        )
+        for dependent_var in partials[0].keys()
+    }
+
+def finalize_bootstrap_intervals(partial, confidence_level):
+    """Percentile intervals of the global replicates of a partial bootstrap covering every site."""
+    tail = (1 - confidence_level) / 2 * 100
+    intervals = {}
+
+    for dependent_var, (weighted_sum_replicates, total_subjects) in partial.items():
+        lower, upper = np.percentile(weighted_sum_replicates / total_subjects, [tail, 100 - tail], axis=0)
+        intervals[dependent_var] = ([float('nan')] + lower.tolist(), [float('nan')] + upper.tolist())
+
+    return intervals
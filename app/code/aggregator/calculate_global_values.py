@@ -1,42 +1,71 @@
 import numpy as np
 
-def calculate_global_values(site_results, covariates_headers):
-    global_results = {}
+# Optional per-variable statistics that are aggregated like the p-values when every site reports them
+OPTIONAL_WEIGHTED_STATISTICS = ["Permutation P-Values", "FWER P-Values", "CV Coefficients"]
+# Optional statistics that are summed over the sites when every site reports them
+OPTIONAL_SUMMED_STATISTICS = ["CV Errors", "CV Sum of Squared Errors"]
+# Per-variable statistics that are averaged with the number of subjects as weights
+WEIGHTED_STATISTICS = ["Coefficients", "t-Statistics", "P-Values"]
+# Global p-values corrected for the number of dependents tested, per variable
+FDR_P_VALUES = "FDR P-Values"
+BONFERRONI_P_VALUES = "Bonferroni P-Values"
+
+def calculate_global_values(site_results, covariates_headers, correct_multiple_comparisons=True):
+    return finalize_global_values(
+        calculate_partial_aggregate(site_results), covariates_headers, correct_multiple_comparisons)
+
+def calculate_partial_aggregate(site_results):
+    """
+    Pre-combine the results of a group of sites into a partial aggregate.
+
+    A partial aggregate keeps, per dependent, the subject-weighted sums of the averaged
+    statistics and the plain sums of the additive ones, so partial aggregates of disjoint
+    groups can be merged in any order (see merge_partial_aggregates) and finalized once.
+    Undefined (NaN) values of an averaged statistic, e.g. the t-statistic of a covariate
+    that is constant at a site, are left out: every averaged statistic keeps its own
+    subject totals ("Weights"), so it is averaged over the sites where it is defined.
+
+    :param site_results: Regression results of each site in the group, keyed by site name.
+    :return: The partial aggregate, keyed by dependent.
+    """
+    partial = {}
 
     for dependent_var in site_results[next(iter(site_results))].keys():
         # Initialize accumulators for weighted averaging
-        weighted_sum_coefficients = None
-        weighted_sum_t_stats = None
-        weighted_sum_p_values = None
+        weighted_sums = {key: 0.0 for key in WEIGHTED_STATISTICS}
+        weights = {}
         weighted_sum_r_squared = 0.0
         total_degrees_of_freedom = 0
         total_sse = 0.0
         total_subjects = 0
+        optional_statistics = {}
+        variables = None
 
         for site, results in site_results.items():
             stats = results[dependent_var]
+            variables = _check_variables(variables, stats["Variables"], dependent_var)
             n_subjects = stats["Degrees of Freedom"] + 1  # Degrees of Freedom + 1 to get the original number of subjects
 
             # Update the total number of subjects
             total_subjects += n_subjects
 
-            # Weighted aggregation of coefficients
-            if weighted_sum_coefficients is None:
-                weighted_sum_coefficients = np.array(stats["Coefficients"]) * n_subjects
-            else:
-                weighted_sum_coefficients += np.array(stats["Coefficients"]) * n_subjects
-
-            # Weighted aggregation of t-stats
-            if weighted_sum_t_stats is None:
-                weighted_sum_t_stats = np.array(stats["t-Statistics"]) * n_subjects
-            else:
-                weighted_sum_t_stats += np.array(stats["t-Statistics"]) * n_subjects
+            # Weighted aggregation of coefficients, t-stats and p-values
+            for key in WEIGHTED_STATISTICS:
+                weighted_sum, weight = _weighted(stats[key], n_subjects)
+                weighted_sums[key] = weighted_sums[key] + weighted_sum
+                weights[key] = weights.get(key, 0.0) + weight
 
-            # Weighted aggregation of p-values
-            if weighted_sum_p_values is None:
-                weighted_sum_p_values = np.array(stats["P-Values"]) * n_subjects
-            else:
-                weighted_sum_p_values += np.array(stats["P-Values"]) * n_subjects
+            # Weighted aggregation of optional statistics, counting the sites that report them
+            for key in OPTIONAL_WEIGHTED_STATISTICS:
+                if key in stats:
+                    previous_sum, n_sites = optional_statistics.get(key, (0.0, 0))
+                    weighted_sum, weight = _weighted(stats[key], n_subjects)
+                    optional_statistics[key] = (previous_sum + weighted_sum, n_sites + 1)
+                    weights[key] = weights.get(key, 0.0) + weight
+            for key in OPTIONAL_SUMMED_STATISTICS:
+                if key in stats:
+                    summed, n_sites = optional_statistics.get(key, (0.0, 0))
+                    optional_statistics[key] = (summed + np.array(stats[key]), n_sites + 1)
 
             # Weighted sum of R-squared
             weighted_sum_r_squared += stats["R-Squared"] * n_subjects
@@ -45,21 +74,204 @@ def calculate_global_values(site_results, covariates_headers):
             total_degrees_of_freedom += stats["Degrees of Freedom"]
             total_sse += stats["Sum of Squared Errors"]
 
-        # Compute weighted averages
-        avg_coefficients = weighted_sum_coefficients / total_subjects
-        avg_t_stats = weighted_sum_t_stats / total_subjects
-        avg_p_values = weighted_sum_p_values / total_subjects
-        avg_r_squared = weighted_sum_r_squared / total_subjects
+        partial[dependent_var] = {
+            **weighted_sums,
+            "R-Squared": weighted_sum_r_squared,
+            "Degrees of Freedom": total_degrees_of_freedom,
+            "Sum of Squared Errors": total_sse,
+            "Subjects": total_subjects,
+            "Weights": weights,
+            "Sites": len(site_results),
+            "Optional": optional_statistics,
+            "Variables": variables,
+        }
+
+    return partial
+
+def merge_partial_aggregates(partials):
+    """
+    Merge the partial aggregates of disjoint groups of sites into one partial aggregate.
+
+    :param partials: Partial aggregates from calculate_partial_aggregate or earlier merges.
+    :return: The merged partial aggregate, keyed by dependent; empty without partials.
+    """
+    merged = {}
+    if not partials:
+        return merged
+
+    for dependent_var in partials[0].keys():
+        parts = [partial[dependent_var] for partial in partials]
+        combined = {key: sum(part[key] for part in parts) for key in WEIGHTED_STATISTICS}
+        for key in ["R-Squared", "Degrees of Freedom", "Sum of Squared Errors", "Subjects", "Sites"]:
+            combined[key] = sum(part[key] for part in parts)
+
+        optional_statistics = {}
+        for part in parts:
+            for key, (weighted_sum, n_sites) in part["Optional"].items():
+                previous_sum, previous_sites = optional_statistics.get(key, (0.0, 0))
+                optional_statistics[key] = (previous_sum + weighted_sum, previous_sites + n_sites)
+        combined["Optional"] = optional_statistics
+        weights = {}
+        for part in parts:
+            for key, weight in part["Weights"].items():
+                weights[key] = weights.get(key, 0.0) + weight
+        combined["Weights"] = weights
+        variables = None
+        for part in parts:
+            variables = _check_variables(variables, part["Variables"], dependent_var)
+        combined["Variables"] = variables
+        merged[dependent_var] = combined
+
+    return merged
+
+def finalize_global_values(partial, covariates_headers, correct_multiple_comparisons=True):
+    """
+    Turn a partial aggregate over all sites into the global results.
+
+    :param partial: Partial aggregate covering every site.
+    :param covariates_headers: Names of the covariates. The design columns reported by the
+                               sites take precedence, e.g. those built from a model formula.
+    :param correct_multiple_comparisons: Add p-values corrected over the dependents (see
+                                         add_multiple_comparison_corrections). Only meaningful
+                                         when the partial aggregate holds every dependent.
+    :return: The global regression results, keyed by dependent.
+    """
+    global_results = {}
+
+    for dependent_var, sums in partial.items():
+        total_subjects = sums["Subjects"]
 
-        # Store the aggregated global results
+        # Store the aggregated global results as weighted averages
         global_results[dependent_var] = {
-            "Variables": ['Intercept'] + covariates_headers,
-            "Coefficients": avg_coefficients.tolist(),
-            "t-Statistics": avg_t_stats.tolist(),
-            "P-Values": avg_p_values.tolist(),
-            "R-Squared": avg_r_squared,
-            "Degrees of Freedom": total_degrees_of_freedom,
-            "Sum of Squared Errors": total_sse
+            "Variables": sums.get("Variables") or ['Intercept'] + covariates_headers,
+            "Coefficients": _weighted_average(sums, "Coefficients"),
+            "t-Statistics": _weighted_average(sums, "t-Statistics"),
+            "P-Values": _weighted_average(sums, "P-Values"),
+            "R-Squared": sums["R-Squared"] / total_subjects,
+            "Degrees of Freedom": sums["Degrees of Freedom"],
+            "Sum of Squared Errors": sums["Sum of Squared Errors"]
         }
+        # Optional statistics are only reported when every site reported them
+        for key in OPTIONAL_WEIGHTED_STATISTICS:
+            if key in sums["Optional"]:
+                weighted_sum, n_sites = sums["Optional"][key]
+                if n_sites == sums["Sites"]:
+                    global_results[dependent_var][key] = _weighted_average(sums, key, weighted_sum)
+        for key in OPTIONAL_SUMMED_STATISTICS:
+            if key in sums["Optional"]:
+                summed, n_sites = sums["Optional"][key]
+                if n_sites == sums["Sites"]:
+                    global_results[dependent_var][key] = summed.tolist()
 
+    if correct_multiple_comparisons:
+        add_multiple_comparison_corrections(global_results)
     return global_results
+
+def add_multiple_comparison_corrections(global_results):
+    """
+    Add Benjamini-Hochberg FDR and Bonferroni corrected p-values to the global results.
+
+    Every variable is corrected over all dependents at once: the p-values form one
+    dependents x variables matrix and both corrections are computed column-wise in
+    vectorized form. Undefined (NaN) p-values are not counted as tests and stay NaN.
+
+    :param global_results: Global regression results, keyed by dependent; updated in place.
+    """
+    if not global_results:
+        return
+    p_values = np.array([stats["P-Values"] for stats in global_results.values()], dtype=np.float64)
+    fdr = benjamini_hochberg(p_values)
+    bonferroni = bonferroni_correction(p_values)
+    for j, stats in enumerate(global_results.values()):
+        stats[FDR_P_VALUES] = fdr[j].tolist()
+        stats[BONFERRONI_P_VALUES] = bonferroni[j].tolist()
+
+def select_cross_validated_alphas(global_results, alphas):
+    """
+    Replace the ridge fit of every dependent with the fit at its cross-validated alpha.
+
+    The alpha with the smallest held-out sum of squared errors, pooled over the folds of
+    every site, is reported as "Selected Alpha", and the subject-weighted average of the
+    site coefficients at that alpha (and their summed sum of squared errors) replace the
+    "Coefficients" and "Sum of Squared Errors" of the default penalty. The per-alpha
+    coefficients are dropped; the pooled "CV Errors" stay for inspection. Dependents
+    without cross-validation results from every site are left unchanged, and dependents
+    whose errors are all undefined keep the default fit with a NaN "Selected Alpha".
+
+    :param global_results: Global regression results, keyed by dependent; updated in place.
+    :param alphas: The alpha grid the sites validated, in the order of their statistics.
+    """
+    for stats in global_results.values():
+        if "CV Errors" not in stats or "CV Coefficients" not in stats:
+            continue
+        errors = np.array(stats["CV Errors"], dtype=np.float64)
+        coefficients = stats.pop("CV Coefficients")
+        sse = stats.pop("CV Sum of Squared Errors", None)
+        if np.all(np.isnan(errors)):
+            stats["Selected Alpha"] = float('nan')
+            continue
+        best = int(np.nanargmin(errors))
+        stats["Selected Alpha"] = float(alphas[best])
+        stats["Coefficients"] = coefficients[best]
+        if sse is not None:
+            stats["Sum of Squared Errors"] = sse[best]
+
+def benjamini_hochberg(p_values):
+    """
+    Benjamini-Hochberg adjusted p-values of each column of a tests x variables matrix.
+
+    :param p_values: Matrix of p-values; NaN marks an undefined test.
+    :return: The adjusted p-values, in the layout of the input.
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    undefined = np.isnan(p_values)
+    n_tests = np.sum(~undefined, axis=0)
+    # NaNs sort last, so the defined p-values of every column hold ranks 1..n_tests
+    order = np.argsort(p_values, axis=0, kind="stable")
+    ranks = np.arange(1, p_values.shape[0] + 1)[:, None]
+    adjusted = np.take_along_axis(p_values, order, axis=0) * n_tests / ranks
+    # Step-up: running minimum from the largest rank down (fmin skips the trailing NaNs)
+    adjusted = np.minimum(np.fmin.accumulate(adjusted[::-1], axis=0)[::-1], 1.0)
+    result = np.empty_like(p_values)
+    np.put_along_axis(result, order, adjusted, axis=0)
+    result[undefined] = np.nan
+    return result
+
+def bonferroni_correction(p_values):
+    """
+    Bonferroni adjusted p-values of each column of a tests x variables matrix.
+
+    :param p_values: Matrix of p-values; NaN marks an undefined test.
+    :return: The adjusted p-values, in the layout of the input.
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    return np.minimum(p_values * np.sum(~np.isnan(p_values), axis=0), 1.0)
+
+def _weighted(values, n_subjects):
+    """
+    Subject-weighted values of a site and their weights; undefined (NaN) values get weight 0.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    defined = ~np.isnan(values)
+    return np.where(defined, values, 0.0) * n_subjects, defined * n_subjects
+
+def _weighted_average(sums, key, weighted_sum=None):
+    """
+    Average of a weighted statistic over the sites where it is defined; NaN where it is
+    defined at no site.
+    """
+    weighted_sum = sums[key] if weighted_sum is None else weighted_sum
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (weighted_sum / sums["Weights"][key]).tolist()
+
+def _check_variables(variables, site_variables, dependent_var):
+    """
+    Return the design columns shared by all sites so far; statistics can only be averaged
+    when every site fitted the same columns in the same order.
+    """
+    if variables is not None and list(site_variables) != list(variables):
+        raise ValueError(
+            f"Sites fitted different design columns for {dependent_var}: {list(variables)} and "
+            f"{list(site_variables)}. Categorical terms of a model formula need the same levels "
+            f"at every site, e.g. C(Scanner, levels=[...]).")
+    return list(site_variables)
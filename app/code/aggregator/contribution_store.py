@@ -0,0 +1,68 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pickle
+from typing import Any, Dict, Optional, Tuple
+
+_CONTRIBUTION_SUFFIX = ".pkl.gz"
+
+
+def parameters_hash(computation_parameters: Dict[str, Any]) -> str:
+    """Hash of the computation parameters; contributions are only reused for identical parameters."""
+    return hashlib.sha256(json.dumps(computation_parameters, sort_keys=True).encode()).hexdigest()
+
+
+class SiteContributionStore:
+    """
+    Server-side store of the contribution of each site (its result and, when it
+    bootstrapped, its per-resample coefficients) for incremental re-aggregation.
+
+    Contributions are kept as compressed pickles under
+    `<directory>/<site hash>/<parameters hash>/<data fingerprint>.pkl.gz`. Storing a
+    new contribution of a site replaces the one computed from its earlier data for
+    the same parameters.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory of the store; created on first write.
+        """
+        self.directory = directory
+
+    def load(self, site_name: str, fingerprint: str, parameters_digest: str) -> Optional[Tuple[Dict, Optional[Dict]]]:
+        """
+        Return the stored (result, bootstrap) of a site for its data fingerprint and the
+        parameters, or None when the site has no such contribution.
+        """
+        path = self._path(site_name, parameters_digest, fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logging.warning(f"Ignoring unreadable stored contribution of site {site_name}: {e}")
+            return None
+
+    def save(self, site_name: str, fingerprint: str, parameters_digest: str,
+             result: Dict, bootstrap: Optional[Dict] = None) -> None:
+        """Store the contribution of a site, replacing its contributions from earlier data."""
+        path = self._path(site_name, parameters_digest, fingerprint)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with gzip.open(temporary_path, 'wb', compresslevel=6) as f:
+            pickle.dump((result, bootstrap), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+        for name in os.listdir(directory):
+            if name.endswith(_CONTRIBUTION_SUFFIX) and os.path.join(directory, name) != path:
+                os.remove(os.path.join(directory, name))
+        logging.info(f"Stored contribution of site {site_name} ({fingerprint[:12]})")
+
+    def _path(self, site_name: str, parameters_digest: str, fingerprint: str) -> str:
+        # Site names are hashed so that they are always valid directory names
+        site_key = hashlib.sha256(site_name.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, site_key, parameters_digest, f"{fingerprint}{_CONTRIBUTION_SUFFIX}")
@@ -0,0 +1,69 @@
+import os
+import pickle
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .calculate_global_values import FDR_P_VALUES, BONFERRONI_P_VALUES, benjamini_hochberg, bonferroni_correction
+
+
+class GlobalBlockSpool:
+    """
+    Global result blocks held back until the p-values of every dependent are known.
+
+    The multiple comparison corrections span all dependents, so a block of the global
+    result cannot be sent before the last block has been aggregated. The blocks are
+    pickled to a temporary directory as they are aggregated and only their p-values, a
+    dependents x variables matrix, are kept in memory; the corrections are then computed
+    once over that matrix and the blocks are read back one at a time.
+    """
+
+    def __init__(self):
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+        self._paths: List[str] = []
+        self._p_values: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def add(self, block: Dict[str, Dict[str, Any]]) -> None:
+        """Spool the next block of the global result, keyed by dependent."""
+        if self._directory is None:
+            self._directory = tempfile.TemporaryDirectory(prefix="srr_global_blocks_")
+        path = os.path.join(self._directory.name, f"block_{len(self._paths)}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._paths.append(path)
+        if block:
+            self._p_values.append(np.array([stats["P-Values"] for stats in block.values()], dtype=np.float64))
+
+    def corrected_blocks(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """
+        Yield the spooled blocks in order, with the p-values corrected over the dependents
+        of all blocks (see add_multiple_comparison_corrections). The spool is emptied.
+        """
+        try:
+            p_values = np.concatenate(self._p_values) if self._p_values else np.empty((0, 0))
+            fdr = benjamini_hochberg(p_values)
+            bonferroni = bonferroni_correction(p_values)
+            start = 0
+            for path in self._paths:
+                with open(path, 'rb') as f:
+                    block = pickle.load(f)
+                os.remove(path)
+                for j, stats in enumerate(block.values(), start):
+                    stats[FDR_P_VALUES] = fdr[j].tolist()
+                    stats[BONFERRONI_P_VALUES] = bonferroni[j].tolist()
+                start += len(block)
+                yield block
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Discard the spooled blocks, e.g. when the run is aborted."""
+        if self._directory is not None:
+            self._directory.cleanup()
+        self._directory = None
+        self._paths = []
+        self._p_values = []
@@ -0,0 +1,95 @@
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from .calculate_global_values import calculate_partial_aggregate, merge_partial_aggregates
+from .calculate_global_bootstrap import calculate_partial_bootstrap, merge_partial_bootstraps
+
+
+def relay_aggregate(site_results: Dict[str, Any], site_bootstrap: Dict[str, Any]) -> Tuple[Dict, Optional[Dict]]:
+    """
+    Pre-combine one group of sites, as an intermediate aggregator does.
+
+    :param site_results: Regression results of the sites in the group.
+    :param site_bootstrap: Per-resample coefficients of the sites in the group that bootstrapped.
+    :return: The partial aggregate, and the partial bootstrap when every site in the group bootstrapped.
+    """
+    partial = calculate_partial_aggregate(site_results)
+    partial_bootstrap = None
+    if site_bootstrap and set(site_bootstrap) == set(site_results):
+        partial_bootstrap = calculate_partial_bootstrap(site_results, site_bootstrap)
+    return partial, partial_bootstrap
+
+
+class RelayTree:
+    """
+    Hierarchical aggregation with local relay processes.
+
+    Site results are buffered only until a group of `group_size` sites is complete;
+    the group is then handed to a relay process, which reduces it to a partial
+    aggregate, and the raw site results are released. The root merges only the
+    partial aggregates, so neither its memory nor its merge work grows with the
+    size of every individual site result.
+    """
+
+    def __init__(self, group_size: int, max_relays: Optional[int] = None):
+        """
+        :param group_size: Number of sites pre-combined by one relay.
+        :param max_relays: Number of relay processes. None uses one per CPU.
+        """
+        self.group_size = group_size
+        self.max_relays = max_relays
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._futures: List[Future] = []
+        self._sites = set()
+        self._pending_results: Dict[str, Any] = {}
+        self._pending_bootstrap: Dict[str, Any] = {}
+
+    @property
+    def site_count(self) -> int:
+        return len(self._sites)
+
+    def add(self, site_name: str, result: Dict[str, Any], bootstrap: Optional[Dict[str, Any]] = None) -> None:
+        """Add the result of a site, handing its group to a relay once the group is complete."""
+        if site_name in self._sites:
+            logging.warning(f"Ignoring duplicate result from site {site_name}")
+            return
+        self._sites.add(site_name)
+        self._pending_results[site_name] = result
+        if bootstrap is not None:
+            self._pending_bootstrap[site_name] = bootstrap
+        if len(self._pending_results) >= self.group_size:
+            self._submit_group()
+
+    def merge(self) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Wait for every relay and merge their partial aggregates.
+
+        :return: The partial aggregate over all sites, and the partial bootstrap when every site bootstrapped.
+        """
+        self._submit_group()
+        try:
+            parts = [future.result() for future in self._futures]
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._pool = None
+            self._futures = []
+        logging.info(f"Merging {len(parts)} relay aggregates of {self.site_count} sites")
+        self._sites = set()
+        if not parts:
+            logging.error("No site results were accepted; the relay aggregate is empty")
+            return {}, None
+
+        partial = merge_partial_aggregates([part for part, _ in parts])
+        bootstraps = [bootstrap for _, bootstrap in parts]
+        partial_bootstrap = merge_partial_bootstraps(bootstraps) if all(b is not None for b in bootstraps) else None
+        return partial, partial_bootstrap
+
+    def _submit_group(self) -> None:
+        if not self._pending_results:
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_relays)
+        self._futures.append(self._pool.submit(relay_aggregate, self._pending_results, self._pending_bootstrap))
+        self._pending_results = {}
+        self._pending_bootstrap = {}
@@ -1,17 +1,38 @@
 import json
+import logging
+import math
+import time
+from nvflare.apis.fl_constant import ReturnCode
 from nvflare.apis.impl.controller import Controller, Task, ClientTask
 from nvflare.apis.fl_context import FLContext
 from nvflare.apis.signal import Signal
 from nvflare.apis.shareable import Shareable
-from utils.utils import get_parameters_file_path
-from typing import Callable
+from utils.utils import get_parameters_file_path, get_job_completion_socket_path
+from utils.job_completion import notify_job_completion, JOB_STATUS_FINISHED, JOB_STATUS_ABORTED, JOB_STATUS_FAILED
+from utils.metrics import get_metrics_registry, payload_bytes, BYTES_BUCKETS
+from typing import Callable, List, Optional, Set
 
 # Task names
 TASK_NAME_PERFORM_REGRESSION = "perform_regression"
 TASK_NAME_SAVE_GLOBAL_REGRESSION_RESULTS = "save_global_regression_results"
+TASK_NAME_GET_RESULT_BLOCK = "get_regression_result_block"
+TASK_NAME_GET_DATA_FINGERPRINT = "get_data_fingerprint"
 # Component IDs
 SRR_AGGREGATOR_ID = "srr_aggregator"
 
+# Metrics of the server process, exported in the Prometheus text format
+_metrics = get_metrics_registry()
+BROADCAST_SECONDS = _metrics.histogram(
+    "srr_controller_broadcast_seconds", "Duration of task broadcasts until the responses arrived.", ["task"])
+SITE_RESPONSE_SECONDS = _metrics.histogram(
+    "srr_controller_site_response_seconds", "Time from a task broadcast to the response of a site.", ["task"])
+SITE_RESPONSES_TOTAL = _metrics.counter(
+    "srr_controller_site_responses_total", "Site responses by task and acceptance.", ["task", "accepted"])
+AGGREGATION_SECONDS = _metrics.histogram("srr_controller_aggregation_seconds", "Duration of aggregations.")
+PAYLOAD_BYTES = _metrics.histogram(
+    "srr_controller_payload_bytes", "Serialized size of the payloads the server sends.", ["task", "direction"],
+    buckets=BYTES_BUCKETS)
+
 class SrrController(Controller):
     """
     SrrController handles the flow of tasks for site regression and aggregation 
@@ -24,6 +45,9 @@ class SrrController(Controller):
         min_clients: int = 2,
         wait_time_after_min_received: int = 10,
         task_timeout: int = 0,
+        result_block_size: int = 0,
+        metrics_port: int = 0,
+        metrics_textfile_path: str = "",
     ):
         """
         Initializes the SrrController with specific parameters for task broadcasting.
@@ -31,11 +55,23 @@ class SrrController(Controller):
         :param min_clients: Minimum number of client responses required.
         :param wait_time_after_min_received: Time to wait after receiving minimum responses.
         :param task_timeout: Timeout for task completion.
+        :param result_block_size: Number of dependents per result message. Site and global results
+                                  are transferred and aggregated one block at a time, which bounds
+                                  message sizes and memory. 0 transfers each result as one message.
+        :param metrics_port: Local port of an HTTP endpoint serving the server metrics. 0 disables it.
+        :param metrics_textfile_path: Prometheus textfile (*.prom) the server metrics are written to
+                                      after every task broadcast. Empty disables it.
         """
         super().__init__()
         self._task_timeout = task_timeout
         self._min_clients = min_clients
         self._wait_time_after_min_received = wait_time_after_min_received
+        self._result_block_size = result_block_size
+        self._metrics_textfile_path = metrics_textfile_path
+        # Sites whose regression result was accepted in the current broadcast
+        self._accepted_sites: Set[str] = set()
+        if metrics_port:
+            _metrics.start_http_server(metrics_port)
 
 #### Computation Author Defined Section ####
 ### This is where computation authors will define the control flow logic ###
@@ -65,19 +101,99 @@ class SrrController(Controller):
         :param abort_signal: Signal for aborting the flow if needed.
         :param fl_ctx: Federated learning context for this run.
         """
-        # Broadcast the regression task and send site results to the aggregator
-        self._broadcast_task(
-            task_name=TASK_NAME_PERFORM_REGRESSION,
-            data=Shareable(),
-            result_cb=self._accept_site_regression_result,
-            fl_ctx=fl_ctx,
-            abort_signal=abort_signal,
-        )
+        status = JOB_STATUS_FAILED
+        try:
+            # With a contribution store, sites whose data is unchanged since an earlier job
+            # contribute their stored results and only changed or new sites run the regression
+            targets = None
+            if self.srr_aggregator.has_contribution_store and self._result_block_size <= 0:
+                self._broadcast_task(
+                    task_name=TASK_NAME_GET_DATA_FINGERPRINT,
+                    data=Shareable(),
+                    result_cb=self._accept_site_fingerprint,
+                    fl_ctx=fl_ctx,
+                    abort_signal=abort_signal,
+                )
+                targets = self.srr_aggregator.reuse_stored_contributions(fl_ctx)
+
+            # Broadcast the regression task and send site results to the aggregator.
+            # With result blocks, the sites answer with the first block of their result.
+            self._accepted_sites = set()
+            if targets is None or targets:
+                regression_request = Shareable()
+                regression_request["result_block_size"] = self._result_block_size
+                self._broadcast_task(
+                    task_name=TASK_NAME_PERFORM_REGRESSION,
+                    data=regression_request,
+                    result_cb=self._accept_site_regression_result,
+                    fl_ctx=fl_ctx,
+                    abort_signal=abort_signal,
+                    targets=targets,
+                )
+
+            block_count = self._result_block_count(fl_ctx)
+            # Every block of the global result is averaged over the sites of the first block
+            contributors = sorted(self._accepted_sites)
+            if block_count > 1 and not contributors:
+                raise RuntimeError("No site returned the first result block")
+            for block in range(block_count):
+                if abort_signal.triggered:
+                    break
+
+                # Fetch the next block of the result of every contributing site
+                if block > 0:
+                    block_request = Shareable()
+                    block_request["block"] = block
+                    self._accepted_sites = set()
+                    self._broadcast_task(
+                        task_name=TASK_NAME_GET_RESULT_BLOCK,
+                        data=block_request,
+                        result_cb=self._accept_site_regression_result,
+                        fl_ctx=fl_ctx,
+                        abort_signal=abort_signal,
+                        targets=contributors,
+                    )
+                    missing = set(contributors) - self._accepted_sites
+                    if missing and not abort_signal.triggered:
+                        raise RuntimeError(
+                            f"Sites {sorted(missing)} did not return result block {block}; "
+                            f"the global result would mix different sets of sites")
+
+                # Aggregate results from all sites. The p-values of a block are corrected over
+                # all dependents, so global blocks are held back until the last one is aggregated.
+                if block_count > 1:
+                    with AGGREGATION_SECONDS.time():
+                        self.srr_aggregator.spool_block(fl_ctx)
+                    continue
+                with AGGREGATION_SECONDS.time():
+                    aggregate_result = self.srr_aggregator.aggregate(fl_ctx)
+                self._broadcast_global_block(aggregate_result, block, block_count, abort_signal, fl_ctx)
+
+            if block_count > 1 and not abort_signal.triggered:
+                for block, aggregate_result in enumerate(self.srr_aggregator.spooled_blocks(fl_ctx)):
+                    self._broadcast_global_block(aggregate_result, block, block_count, abort_signal, fl_ctx)
+                    if abort_signal.triggered:
+                        break
+            status = JOB_STATUS_ABORTED if abort_signal.triggered else JOB_STATUS_FINISHED
+        finally:
+            self.srr_aggregator.discard_spooled_blocks()
+            # Let the central entry point shut down without waiting for its status poll
+            self._notify_job_completion(status, fl_ctx)
 
-        # Aggregate results from all sites
-        aggregate_result = self.srr_aggregator.aggregate(fl_ctx)
+    def _broadcast_global_block(
+        self, aggregate_result: Shareable, block: int, block_count: int, abort_signal: Signal, fl_ctx: FLContext
+    ) -> None:
+        """
+        Broadcasts a block of the global aggregated results to all sites.
 
-        # Broadcast the global aggregated results to all sites
+        :param aggregate_result: The global result (block) returned by the aggregator.
+        :param block: Index of the dependent block.
+        :param block_count: Number of dependent blocks.
+        :param abort_signal: Signal for aborting the flow if needed.
+        :param fl_ctx: Federated learning context for this run.
+        """
+        aggregate_result["block"] = block
+        aggregate_result["block_count"] = block_count
         self._broadcast_task(
             task_name=TASK_NAME_SAVE_GLOBAL_REGRESSION_RESULTS,
             data=aggregate_result,
@@ -98,15 +214,33 @@ class SrrController(Controller):
         :param fl_ctx: Federated learning context for this run.
         :return: Boolean indicating whether the result was successfully accepted.
         """
-        return self.srr_aggregator.accept(client_task.result, fl_ctx)
+        # Sites answer aborted or failed tasks without a result
+        return_code = client_task.result.get_return_code()
+        if return_code != ReturnCode.OK:
+            logging.warning(f"Site {client_task.client.name} returned no regression result: {return_code}")
+            return False
+        accepted = self.srr_aggregator.accept(client_task.result, fl_ctx)
+        if accepted:
+            self._accepted_sites.add(client_task.client.name)
+        return accepted
+
+    def _accept_site_fingerprint(self, client_task: ClientTask, fl_ctx: FLContext) -> bool:
+        """
+        Callback method that passes the data fingerprint of each site to the aggregator.
+
+        :param client_task: The task result received from a client site.
+        :param fl_ctx: Federated learning context for this run.
+        :return: Boolean indicating whether the fingerprint was successfully accepted.
+        """
+        return self.srr_aggregator.accept_fingerprint(client_task.result, fl_ctx)
 
 #### End of Computation Author Defined Section ####
 
 #### Framework Helper Methods: No modification necessary ####
     
-    def _broadcast_task(self, task_name: str, data: Shareable, result_cb: Callable[[ClientTask, FLContext], bool], fl_ctx: FLContext, abort_signal: Signal) -> None:
+    def _broadcast_task(self, task_name: str, data: Shareable, result_cb: Callable[[ClientTask, FLContext], bool], fl_ctx: FLContext, abort_signal: Signal, targets: Optional[List[str]] = None) -> None:
         """
-        Broadcasts a task to all client sites and waits for responses.
+        Broadcasts a task to all client sites (or the given targets) and waits for responses.
 
         Computation authors can use this method to simplify task broadcasting.
         Typically, this method does not need to be modified.
@@ -116,20 +250,70 @@ class SrrController(Controller):
         :param result_cb: Callback for handling results from each client site.
         :param fl_ctx: Federated learning context for this run.
         :param abort_signal: Signal used to abort the task if needed.
+        :param targets: Names of the client sites to send the task to. None sends it to all sites.
         """
-        self.broadcast_and_wait(
-            task=Task(
-                name=task_name,
-                data=data,
-                props={},
-                timeout=self._task_timeout,
-                result_received_cb=result_cb,
-            ),
-            min_responses=self._min_clients,
-            wait_time_after_min_received=self._wait_time_after_min_received,
-            fl_ctx=fl_ctx,
-            abort_signal=abort_signal,
-        )
+        start = time.perf_counter()
+
+        def on_result(client_task: ClientTask, fl_ctx: FLContext) -> bool:
+            # Record the response of the site before handing it to the callback
+            # Received payload sizes are recorded by the sites; serializing every site result
+            # again here would double the work of the server per response
+            SITE_RESPONSE_SECONDS.observe(time.perf_counter() - start, task=task_name)
+            accepted = result_cb(client_task, fl_ctx) if result_cb else True
+            SITE_RESPONSES_TOTAL.inc(task=task_name, accepted=str(bool(accepted)).lower())
+            return accepted
+
+        PAYLOAD_BYTES.observe(payload_bytes(data), task=task_name, direction="sent")
+        with BROADCAST_SECONDS.time(task=task_name):
+            self.broadcast_and_wait(
+                task=Task(
+                    name=task_name,
+                    data=data,
+                    props={},
+                    timeout=self._task_timeout,
+                    result_received_cb=on_result,
+                ),
+                targets=targets,
+                min_responses=len(targets) if targets else self._min_clients,
+                wait_time_after_min_received=self._wait_time_after_min_received,
+                fl_ctx=fl_ctx,
+                abort_signal=abort_signal,
+            )
+        self._export_metrics()
+
+    def _export_metrics(self) -> None:
+        """
+        Writes the server metrics to the configured Prometheus textfile. A failed write is
+        logged and does not fail the workflow.
+        """
+        if not self._metrics_textfile_path:
+            return
+        try:
+            _metrics.write_textfile(self._metrics_textfile_path)
+        except OSError as e:
+            logging.warning(f"Could not write the metrics textfile: {e}")
+
+    def _result_block_count(self, fl_ctx: FLContext) -> int:
+        """
+        Returns the number of dependent blocks the results are transferred in.
+
+        :param fl_ctx: Federated learning context for this run.
+        """
+        if self._result_block_size <= 0:
+            return 1
+        n_dependents = len(fl_ctx.get_prop("COMPUTATION_PARAMETERS")["Dependents"])
+        return max(1, math.ceil(n_dependents / self._result_block_size))
+
+    def _notify_job_completion(self, status: str, fl_ctx: FLContext) -> None:
+        """
+        Notifies the local completion listener, if one is configured, that the workflow has finished.
+
+        :param status: Final status of the workflow.
+        :param fl_ctx: Federated learning context for this run.
+        """
+        socket_path = get_job_completion_socket_path()
+        if socket_path:
+            notify_job_completion(socket_path, fl_ctx.get_job_id(), status)
 
     def _load_and_set_computation_parameters(self, fl_ctx: FLContext) -> None:
         """
@@ -0,0 +1,119 @@
+import zlib
+import numpy as np
+from typing import Any, Dict, List, Optional
+from .perform_ridge_regression import RegressionDesign
+from .progress import RegressionProgress
+
+
+class BootstrapEstimator:
+    """
+    Bootstrap percentile confidence intervals of the ridge coefficients.
+
+    Resamples are drawn as multinomial weight vectors instead of materialized
+    datasets. For a block of resamples, the weighted Gram matrices and weighted
+    X'y of all dependents are batched products, and the weighted ridge systems of
+    every resample are solved for all dependents at once. The working memory is
+    bounded by the block size; only the coefficient of each resample is kept,
+    because the percentile intervals (and the global intervals on the server)
+    are formed from them.
+
+    Weighted fits center with the weighted means, exactly like sklearn's Ridge
+    with sample weights, and the intercept is unpenalized and not reported.
+    """
+
+    def __init__(
+        self,
+        n_resamples: int,
+        block_size: int = 100,
+        confidence_level: float = 0.95,
+        seed: int = 0,
+        site_seed: int = 0,
+    ):
+        """
+        :param n_resamples: Number of bootstrap resamples.
+        :param block_size: Number of resamples evaluated per batched product.
+        :param confidence_level: Coverage of the percentile intervals.
+        :param seed: Seed of the resamples.
+        :param site_seed: Site specific part of the seed, so sites draw independent resamples.
+        """
+        self.n_resamples = n_resamples
+        self.block_size = block_size
+        self.confidence_level = confidence_level
+        self.seed = seed
+        self.site_seed = site_seed
+        self._replicates: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_parameters(cls, computation_parameters: Dict[str, Any], site_name: Optional[str] = None) -> Optional["BootstrapEstimator"]:
+        """
+        Create the estimator from the optional "Bootstrap" entry of parameters.json, e.g.
+        {"Resamples": 1000, "BlockSize": 100, "ConfidenceLevel": 0.95, "Seed": 0}.
+        Returns None when it is absent.
+        """
+        settings = computation_parameters.get("Bootstrap")
+        if not settings:
+            return None
+        return cls(
+            n_resamples=int(settings["Resamples"]),
+            block_size=int(settings.get("BlockSize", 100)),
+            confidence_level=float(settings.get("ConfidenceLevel", 0.95)),
+            seed=int(settings.get("Seed", 0)),
+            site_seed=zlib.crc32((site_name or "").encode()),
+        )
+
+    def update(
+        self,
+        design: RegressionDesign,
+        names: List[str],
+        centered: np.ndarray,
+        progress: Optional[RegressionProgress] = None,
+    ) -> None:
+        """
+        Fit every resample for a block of dependents.
+
+        :param design: The standardized covariates of the site.
+        :param names: Names of the dependents in the block.
+        :param centered: Mean-centered values of the dependents, subjects x dependents.
+        :param progress: Optional progress of the regression, checked for an abort between resample blocks.
+        """
+        n_subjects, n_covariates = design.covariates.shape
+        replicates = np.empty((self.n_resamples, n_covariates, len(names)), dtype=np.float32)
+        penalty = design.alpha * np.eye(n_covariates)
+        for start in range(0, self.n_resamples, self.block_size):
+            if progress is not None:
+                progress.check()
+            size = min(self.block_size, self.n_resamples - start)
+            rng = np.random.default_rng([self.seed, self.site_seed, start])
+            weights = rng.multinomial(n_subjects, np.full(n_subjects, 1 / n_subjects), size=size).astype(np.float64)
+
+            # Weighted, weighted-mean-centered Gram matrices and X'y: resamples x covariates x ...
+            weighted_covariates = design.covariates.T[None] * weights[:, None, :]
+            covariate_means = weights @ design.covariates / n_subjects
+            dependent_means = weights @ centered / n_subjects
+            gram = weighted_covariates @ design.covariates - n_subjects * covariate_means[:, :, None] * covariate_means[:, None, :]
+            cross_products = weighted_covariates @ centered - n_subjects * covariate_means[:, :, None] * dependent_means[:, None, :]
+            replicates[start:start + size] = np.linalg.solve(gram + penalty, cross_products)
+
+        for j, name in enumerate(names):
+            self._replicates[name] = replicates[:, :, j]
+
+    def merge(self, other: "BootstrapEstimator") -> None:
+        """Merge the resamples of an estimator with the same seeds that was updated with other dependents."""
+        self._replicates.update(other._replicates)
+
+    def apply(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """Add the percentile intervals as "CI Lower" and "CI Upper" to the results (NaN for the intercept)."""
+        for name, stats in results.items():
+            lower, upper = percentile_interval(self._replicates[name], self.confidence_level)
+            stats["CI Lower"] = [float('nan')] + lower.tolist()
+            stats["CI Upper"] = [float('nan')] + upper.tolist()
+
+    def replicates(self) -> Dict[str, np.ndarray]:
+        """Coefficients (resamples x covariates, without the intercept) of every dependent."""
+        return self._replicates
+
+
+def percentile_interval(replicates: np.ndarray, confidence_level: float) -> tuple:
+    """Lower and upper percentile bounds over the resample axis (the first axis)."""
+    tail = (1 - confidence_level) / 2 * 100
+    return np.percentile(replicates, [tail, 100 - tail], axis=0)
@@ -0,0 +1,134 @@
+import zlib
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+from .perform_ridge_regression import RegressionDesign, decompose_covariates
+from .progress import RegressionProgress
+
+
+class CrossValidation:
+    """
+    K-fold cross-validation of the ridge penalty over a grid of alphas.
+
+    The subjects of the site are split into folds once, so every block of dependents
+    (and every data shard) is validated on the same folds. For each fold, the ridge fit
+    on the remaining folds is evaluated on the held-out fold for every alpha and every
+    dependent of a block from moments alone: with the training covariates centered at
+    their training means, X'X of the training subjects is eigendecomposed once per fold
+    (in primal or dual form, whichever is cheaper), the ridge solutions of all alphas are
+    rescalings in its eigenbasis, and the held-out squared errors follow from the
+    held-out Gram matrix, cross products and sums of squares in that basis, without
+    forming predictions.
+
+    Besides the validation errors, the ridge fit on all subjects is reported for every
+    alpha, so the server can pick the alpha per dependent from the pooled validation
+    errors and take the matching coefficients within the same round.
+    """
+
+    def __init__(self, n_folds: int, alphas: Sequence[float], seed: int = 0, site_seed: int = 0):
+        """
+        :param n_folds: Number of folds.
+        :param alphas: Ridge penalties to validate.
+        :param seed: Seed of the fold assignment.
+        :param site_seed: Site specific part of the seed, so sites split their subjects independently.
+        """
+        self.n_folds = n_folds
+        self.alphas = np.asarray(alphas, dtype=np.float64)
+        self.seed = seed
+        self.site_seed = site_seed
+        self._errors: Dict[str, np.ndarray] = {}
+        self._coefficients: Dict[str, np.ndarray] = {}
+        self._sse: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_parameters(cls, computation_parameters: Dict[str, Any], site_name: Optional[str] = None) -> Optional["CrossValidation"]:
+        """
+        Create the cross-validation from the optional "CrossValidation" entry of parameters.json, e.g.
+        {"Folds": 5, "Alphas": [0.1, 1, 10, 100], "Seed": 0}. Returns None when it is absent.
+        """
+        settings = computation_parameters.get("CrossValidation")
+        if not settings:
+            return None
+        return cls(
+            n_folds=int(settings.get("Folds", 5)),
+            alphas=[float(alpha) for alpha in settings["Alphas"]],
+            seed=int(settings.get("Seed", 0)),
+            site_seed=zlib.crc32((site_name or "").encode()),
+        )
+
+    def folds(self, n_subjects: int) -> np.ndarray:
+        """Fold of every subject: a seeded permutation dealt round-robin, so fold sizes differ by at most one."""
+        rng = np.random.default_rng([self.seed, self.site_seed])
+        return rng.permutation(n_subjects) % self.n_folds
+
+    def update(
+        self,
+        design: RegressionDesign,
+        names: List[str],
+        centered: np.ndarray,
+        progress: Optional[RegressionProgress] = None,
+    ) -> None:
+        """
+        Validate every alpha for a block of dependents and fit them on all subjects.
+
+        :param design: The standardized covariates of the site.
+        :param names: Names of the dependents in the block.
+        :param centered: Mean-centered values of the dependents, subjects x dependents.
+        :param progress: Optional progress of the regression, checked for an abort between folds.
+        """
+        covariates = design.covariates
+        folds = self.folds(design.n_subjects)
+        errors = np.zeros((len(self.alphas), len(names)))
+        for fold in range(self.n_folds):
+            if progress is not None:
+                progress.check()
+            held_out = folds == fold
+            covariate_means = covariates[~held_out].mean(axis=0)
+            dependent_means = centered[~held_out].mean(axis=0)
+            train_covariates = covariates[~held_out] - covariate_means
+            _, eigenvalues, components = decompose_covariates(train_covariates)
+            rotated_slopes = components.T @ (train_covariates.T @ (centered[~held_out] - dependent_means))
+
+            # Held-out residuals before the slopes: y - mean_train(y) - (x - mean_train(x))'b
+            projected = (covariates[held_out] - covariate_means) @ components
+            residuals = centered[held_out] - dependent_means
+            rotated_gram = projected.T @ projected
+            rotated_cross = projected.T @ residuals
+            residual_squares = np.einsum('ij,ij->j', residuals, residuals)
+            for a, alpha in enumerate(self.alphas):
+                slopes = rotated_slopes / (eigenvalues + alpha)[:, None]
+                errors[a] += (residual_squares
+                              - 2 * np.einsum('ij,ij->j', rotated_cross, slopes)
+                              + np.einsum('ij,ij->j', slopes, rotated_gram @ slopes))
+
+        # Fits on all subjects from the eigendecomposition of the design, with the sum of
+        # squared errors as in the reported ridge fit
+        rotated = design.components.T @ (covariates.T @ centered)
+        sum_of_squares = np.einsum('ij,ij->j', centered, centered)
+        rotated_slopes = rotated[None] / (design.eigenvalues[None, :, None] + self.alphas[:, None, None])
+        slopes = design.components @ rotated_slopes
+        sse = (sum_of_squares
+               - 2 * np.einsum('ij,aij->aj', rotated, rotated_slopes)
+               + np.einsum('aij,aij->aj', rotated_slopes, design.eigenvalues[:, None] * rotated_slopes))
+
+        for j, name in enumerate(names):
+            self._errors[name] = errors[:, j]
+            self._coefficients[name] = slopes[:, :, j]
+            self._sse[name] = sse[:, j]
+
+    def merge(self, other: "CrossValidation") -> None:
+        """Merge the state of a cross-validation with the same folds that was updated with other dependents."""
+        self._errors.update(other._errors)
+        self._coefficients.update(other._coefficients)
+        self._sse.update(other._sse)
+
+    def apply(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Add, per alpha of the grid, the held-out "CV Errors" (sum of squared errors over the
+        folds), the "CV Coefficients" of the fit on all subjects (intercept reported as 0)
+        and its "CV Sum of Squared Errors" to the results.
+        """
+        for name, stats in results.items():
+            coefficients = self._coefficients[name]
+            stats["CV Errors"] = self._errors[name].tolist()
+            stats["CV Coefficients"] = np.hstack([np.zeros((len(self.alphas), 1)), coefficients]).tolist()
+            stats["CV Sum of Squared Errors"] = self._sse[name].tolist()
@@ -0,0 +1,76 @@
+import glob
+import hashlib
+import json
+import os
+import pandas as pd
+from typing import Dict, List
+
+# Optional manifest listing the data shards of a site, relative to the data directory
+DATA_MANIFEST_FILENAME = "data_manifest.json"
+# Data file pattern used when a site has no manifest
+DEFAULT_DATA_FILE_PATTERN = "data.csv"
+
+
+def resolve_data_shards(data_directory: str, data_file_pattern: str = DEFAULT_DATA_FILE_PATTERN) -> List[str]:
+    """
+    List the data files (shards) of a site.
+
+    A `data_manifest.json` in the data directory takes precedence. It holds either
+    a list of file names or an object with a "shards" list. Otherwise the files
+    matching `data_file_pattern` are used, in sorted order.
+
+    :param data_directory: The site's data directory.
+    :param data_file_pattern: Glob pattern, relative to the data directory.
+    :return: Absolute paths of the data shards.
+    """
+    manifest_path = os.path.join(data_directory, DATA_MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        shards = manifest["shards"] if isinstance(manifest, dict) else manifest
+        return [os.path.join(data_directory, shard) for shard in shards]
+
+    return sorted(glob.glob(os.path.join(data_directory, data_file_pattern)))
+
+
+def assign_dependents_to_shards(data_paths: List[str], dependents: List[str]) -> Dict[str, List[str]]:
+    """
+    Map each requested dependent to the first shard whose header contains it.
+
+    Only the headers of the shards are read. Shards without any requested
+    dependent are left out, and dependents found in no shard are ignored here
+    (validation reports them).
+
+    :param data_paths: Paths of the data shards.
+    :param dependents: Requested dependent variables.
+    :return: Dependents to read from each shard, keyed by shard path.
+    """
+    remaining = list(dependents)
+    assignment: Dict[str, List[str]] = {}
+    for data_path in data_paths:
+        headers = set(pd.read_csv(data_path, nrows=0).columns)
+        found = [dependent for dependent in remaining if dependent in headers]
+        if found:
+            assignment[data_path] = found
+            remaining = [dependent for dependent in remaining if dependent not in headers]
+    return assignment
+
+
+def fingerprint_site_data(covariates_path: str, data_paths: List[str]) -> str:
+    """
+    Fingerprint of the data a site would regress: the names and contents of the
+    covariates file and of every data shard, in order.
+
+    :param covariates_path: Path to covariates.csv.
+    :param data_paths: Paths of the data shards.
+    :return: The SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for path in [covariates_path] + list(data_paths):
+        digest.update(os.path.basename(path).encode())
+        digest.update(b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class DatasetCache:
+    """
+    Process-level LRU cache of parsed, column-projected and standardized site data.
+
+    Entries are keyed by the identity of the source file (path, size, modification
+    time and content hash) and by the selected columns, so a changed file or a
+    different column selection is never served from the cache. Entries are evicted
+    least recently used first once their arrays exceed the memory cap. Cached arrays
+    are made read-only, because they are shared by every later job of the process.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        """
+        :param max_bytes: Memory cap of the cached arrays in bytes. 0 disables the cache.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._digests: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, path: str, columns: Sequence[str], loader: Callable[[], T]) -> T:
+        """
+        Return the cached data of a file, loading (and caching) it on a miss.
+
+        :param kind: What the loader produces from the file, e.g. "design" or "data".
+        :param path: Path of the source file.
+        :param columns: Columns selected from the file.
+        :param loader: Loads the data from the file.
+        """
+        if self.max_bytes <= 0:
+            return loader()
+
+        key = (kind, tuple(columns)) + self._file_identity(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                logging.info(f"Dataset cache hit for {kind} of {path}")
+                return entry[0]
+            self.misses += 1
+
+        value = loader()
+        size = _freeze(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._size = 0
+
+    def _file_identity(self, path: str) -> Tuple:
+        """(path, size, mtime, content hash) of a file; the hash is only recomputed when the file changed."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        signature = (path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        with self._lock:
+            digest = self._digests.get(signature)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            with self._lock:
+                self._digests[signature] = digest
+        return path, stat.st_size, stat.st_mtime_ns, digest
+
+
+def _freeze(value: Any) -> int:
+    """Make the arrays of a cached value read-only and return their total size in bytes."""
+    arrays = [value] if isinstance(value, np.ndarray) else [
+        attribute for attribute in vars(value).values() if isinstance(attribute, np.ndarray)]
+    for array in arrays:
+        array.setflags(write=False)
+    return sum(array.nbytes for array in arrays)
+
+
+# The cache of this process, shared by every job it runs
+_dataset_cache = DatasetCache()
+
+
+def get_dataset_cache() -> DatasetCache:
+    """Return the process-level dataset cache."""
+    return _dataset_cache
@@ -0,0 +1,86 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import patsy
+from scipy import sparse
+
+# Categorical factors with at least this many levels (e.g. scanner or site IDs) are
+# treated as sparse indicator blocks when the Gram matrix is formed
+SPARSE_MIN_LEVELS = 16
+
+
+def build_formula_design(covariates: pd.DataFrame, formula: str) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """
+    Build the standardized design of a model formula over the covariates of a site.
+
+    The formula is the right-hand side of a patsy model, e.g.
+    "Age * Sex + I(Age ** 2) + C(Scanner, levels=['a', 'b', 'c'])". Categorical terms use
+    treatment coding against the intercept, whose column is then dropped: the intercept is
+    fitted separately from the standardized columns, as for plain covariates. Missing values
+    raise instead of dropping subjects, so the rows stay aligned with the data files.
+
+    Columns of terms with a high-cardinality categorical factor are mostly zeros; their
+    blocks of the Gram matrix are computed with sparse products on the unstandardized
+    indicators and standardized afterwards.
+
+    :param covariates: The covariates of the site.
+    :param formula: Right-hand side of the model formula.
+    :return: The standardized design (subjects x columns), the column names and the Gram matrix.
+    """
+    matrix = patsy.dmatrix(formula, covariates, NA_action=patsy.NAAction(NA_types=["None", "NaN"], on_NA="raise"))
+    info = matrix.design_info
+    raw = np.asarray(matrix, dtype=np.float64)
+
+    sparse_columns = np.zeros(raw.shape[1], dtype=bool)
+    for term, columns in info.term_slices.items():
+        if any(_is_high_cardinality(info.factor_infos[factor]) for factor in term.factors):
+            sparse_columns[columns] = True
+    keep = np.ones(raw.shape[1], dtype=bool)
+    if patsy.INTERCEPT in info.term_slices:
+        keep[info.term_slices[patsy.INTERCEPT]] = False
+    raw, sparse_columns = raw[:, keep], sparse_columns[keep]
+    names = [name for name, kept in zip(info.column_names, keep) if kept]
+
+    # Standardize like StandardScaler: population standard deviation, constant columns unscaled
+    mean = raw.mean(axis=0)
+    scale = raw.std(axis=0)
+    scale[scale == 0] = 1.0
+    design = (raw - mean) / scale
+    return design, names, _standardized_gram(raw, design, mean, scale, sparse_columns)
+
+
+def _is_high_cardinality(factor_info: patsy.FactorInfo) -> bool:
+    return factor_info.type == "categorical" and len(factor_info.categories) >= SPARSE_MIN_LEVELS
+
+
+def _standardized_gram(
+    raw: np.ndarray,
+    design: np.ndarray,
+    mean: np.ndarray,
+    scale: np.ndarray,
+    sparse_columns: np.ndarray,
+) -> np.ndarray:
+    """
+    Gram matrix of the standardized design, with the blocks of the sparse columns taken from
+    sparse products: for raw columns D with means m and scales s, the standardized columns
+    are (D - 1m')/s, so their Gram block is (D'D - n mm') / ss', and their cross products with
+    the (centered) dense columns X are D'X / s.
+    """
+    dense_columns = ~sparse_columns
+    if not sparse_columns.any():
+        return design.T @ design
+
+    n_columns = design.shape[1]
+    gram = np.empty((n_columns, n_columns))
+    dense = design[:, dense_columns]
+    indicators = sparse.csc_matrix(raw[:, sparse_columns])
+    sparse_mean, sparse_scale = mean[sparse_columns], scale[sparse_columns]
+
+    gram[np.ix_(dense_columns, dense_columns)] = dense.T @ dense
+    sparse_gram = (indicators.T @ indicators).toarray() - raw.shape[0] * np.outer(sparse_mean, sparse_mean)
+    gram[np.ix_(sparse_columns, sparse_columns)] = sparse_gram / np.outer(sparse_scale, sparse_scale)
+    cross_products = np.asarray(indicators.T @ dense) / sparse_scale[:, None]
+    gram[np.ix_(sparse_columns, dense_columns)] = cross_products
+    gram[np.ix_(dense_columns, sparse_columns)] = cross_products.T
+    return gram
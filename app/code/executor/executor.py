@@ -1,25 +1,103 @@
 import logging
 import os
 import json
+from nvflare.apis.event_type import EventType
 from nvflare.apis.executor import Executor
-from nvflare.apis.shareable import Shareable
+from nvflare.apis.fl_constant import ReturnCode
+from nvflare.apis.shareable import Shareable, make_reply
 from nvflare.apis.fl_context import FLContext
 from nvflare.apis.signal import Signal
 from utils.utils import get_data_directory_path, get_output_directory_path
-from .perform_ridge_regression import perform_ridge_regression
-from .json_to_html_results import json_to_html_results
-from .validate_run_input import validate_run_input
+from utils.result_store import save_results_to_store, RESULT_STORE_FILENAME
+from utils.significance_filter import save_compact_results, concatenate_compact_results, COMPACT_RESULTS_FILENAME
+from utils.metrics import get_metrics_registry, payload_bytes, BYTES_BUCKETS
+from .perform_ridge_regression import perform_ridge_regression, perform_sharded_ridge_regression, perform_worker_ridge_regression
+from .json_to_html_results import json_to_html_results, html_report_header, html_report_sections, html_report_footer
+from .validate_run_input import validate_run_input, log_validation_info
+from .memory_budget import plan_processing, peak_rss_bytes
+from .dataset_cache import get_dataset_cache
+from .permutation_test import PermutationTest
+from .progress import RegressionProgress, RegressionAborted
+from .bootstrap import BootstrapEstimator
+from .cross_validation import CrossValidation
+from .data_shards import resolve_data_shards, assign_dependents_to_shards, fingerprint_site_data, DEFAULT_DATA_FILE_PATTERN
+from .result_writer import BackgroundResultWriter, ResultWriteError
 
 # Task names
 TASK_NAME_PERFORM_REGRESSION = "perform_regression"
 TASK_NAME_SAVE_GLOBAL_REGRESSION_RESULTS = "save_global_regression_results"
+TASK_NAME_GET_RESULT_BLOCK = "get_regression_result_block"
+TASK_NAME_GET_DATA_FINGERPRINT = "get_data_fingerprint"
+
+# Metrics of this client process, exported in the Prometheus text format
+METRICS_TEXTFILE = "srr_executor.prom"
+_metrics = get_metrics_registry()
+TASK_SECONDS = _metrics.histogram("srr_executor_task_seconds", "Duration of executor tasks.", ["task"])
+TASKS_TOTAL = _metrics.counter("srr_executor_tasks_total", "Executor tasks by outcome.", ["task", "status"])
+PHASE_SECONDS = _metrics.histogram(
+    "srr_executor_phase_seconds", "Duration of the phases of the regression task.", ["phase"])
+ROWS_PROCESSED = _metrics.counter("srr_executor_rows_processed_total", "Data file rows processed by site regressions.")
+DEPENDENTS_PROCESSED = _metrics.counter(
+    "srr_executor_dependents_processed_total", "Dependents regressed by site regressions.")
+PAYLOAD_BYTES = _metrics.histogram(
+    "srr_executor_payload_bytes", "Serialized size of the result payloads of tasks.", ["task", "direction"],
+    buckets=BYTES_BUCKETS)
+
 
 class SrrExecutor(Executor):
-    def __init__(self):
+    def __init__(
+        self,
+        max_pending_writes: int = 4,
+        memory_budget_mb: float = 0,
+        data_file_pattern: str = DEFAULT_DATA_FILE_PATTERN,
+        max_shard_workers: int = 4,
+        dependent_workers: int = 1,
+        dataset_cache_mb: float = 0,
+        metrics_port: int = 0,
+    ):
         """
-        Initialize the SrrExecutor. This constructor sets up the logger.
+        Initialize the SrrExecutor. This constructor sets up the logger and the
+        background writer used to persist result reports.
+
+        Parameters:
+            max_pending_writes: Maximum number of report writes queued before tasks block on disk I/O;
+                at least 1.
+            memory_budget_mb: Memory budget for loading site data, in megabytes. 0 disables the budget.
+            data_file_pattern: Glob pattern of the data files (shards) when the site has no data manifest.
+            max_shard_workers: Number of data shards processed concurrently.
+            dependent_workers: Number of worker processes that split the dependents of the site
+                between them. 1 runs the regression in the client process.
+            dataset_cache_mb: Memory cap, in megabytes, of the process-level cache of loaded site data
+                that later jobs of the same client process reuse. 0 disables the cache.
+            metrics_port: Local port of an HTTP endpoint serving the metrics. 0 only writes the
+                metrics textfile to the output directory.
         """
+        super().__init__()
+        self._memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._data_file_pattern = data_file_pattern
+        self._max_shard_workers = max_shard_workers
+        self._dependent_workers = max(1, dependent_workers)
+        get_dataset_cache().max_bytes = int(dataset_cache_mb * 1024 * 1024)
+        if metrics_port:
+            _metrics.start_http_server(metrics_port)
+        self._result_writer = BackgroundResultWriter(max_pending=max_pending_writes)
+        # Site result and per-resample coefficients kept until all result blocks were sent
+        self._pending_result: dict = {}
+        self._pending_bootstrap: dict = {}
+        self._result_block_size = 0
+        # Compact blocks of the global dependents that did not pass the significance filter
+        self._pending_compact: list = []
         logging.info("SrrExecutor initialized")
+
+    def handle_event(self, event_type: str, fl_ctx: FLContext) -> None:
+        """
+        Flush outstanding report writes when the run ends.
+        """
+        if event_type == EventType.END_RUN:
+            try:
+                self._result_writer.flush()
+            except ResultWriteError as e:
+                logging.error(str(e))
     
     def execute(
         self,
@@ -40,14 +118,63 @@ class SrrExecutor(Executor):
         Returns:
             A Shareable object containing results of the task.
         """
-        if task_name == TASK_NAME_PERFORM_REGRESSION:
-            return self._do_task_perform_regression(shareable, fl_ctx, abort_signal)
-        elif task_name == TASK_NAME_SAVE_GLOBAL_REGRESSION_RESULTS:
-            return self._do_task_save_global_regression_results(shareable, fl_ctx, abort_signal)
-        else:
-            # Raise an error if the task name is unknown
-            raise ValueError(f"Unknown task name: {task_name}")
+        status = "error"
+        try:
+            PAYLOAD_BYTES.observe(payload_bytes(shareable), task=task_name, direction="received")
+            with TASK_SECONDS.time(task=task_name):
+                if task_name == TASK_NAME_PERFORM_REGRESSION:
+                    outgoing_shareable = self._do_task_perform_regression(shareable, fl_ctx, abort_signal)
+                elif task_name == TASK_NAME_GET_DATA_FINGERPRINT:
+                    outgoing_shareable = self._do_task_get_data_fingerprint(shareable, fl_ctx, abort_signal)
+                elif task_name == TASK_NAME_GET_RESULT_BLOCK:
+                    outgoing_shareable = self._do_task_get_result_block(shareable, fl_ctx, abort_signal)
+                elif task_name == TASK_NAME_SAVE_GLOBAL_REGRESSION_RESULTS:
+                    outgoing_shareable = self._do_task_save_global_regression_results(shareable, fl_ctx, abort_signal)
+                else:
+                    # Raise an error if the task name is unknown
+                    raise ValueError(f"Unknown task name: {task_name}")
+            PAYLOAD_BYTES.observe(payload_bytes(outgoing_shareable), task=task_name, direction="sent")
+            return_code = outgoing_shareable.get_return_code()
+            if return_code == ReturnCode.TASK_ABORTED:
+                status = "aborted"
+            elif return_code == ReturnCode.OK:
+                status = "ok"
+            return outgoing_shareable
+        finally:
+            TASKS_TOTAL.inc(task=task_name, status=status)
+            self._export_metrics(fl_ctx)
+
+    def _export_metrics(self, fl_ctx: FLContext) -> None:
+        """
+        Write the metrics of this client to a Prometheus textfile in the output directory.
+        Metrics are diagnostics, so a failed write is logged and does not fail the task.
+        """
+        try:
+            _metrics.write_textfile(os.path.join(get_output_directory_path(fl_ctx), METRICS_TEXTFILE))
+        except OSError as e:
+            logging.warning(f"Could not write the metrics textfile: {e}")
         
+    def _do_task_get_data_fingerprint(
+        self,
+        shareable: Shareable,
+        fl_ctx: FLContext,
+        abort_signal: Signal,
+    ) -> Shareable:
+        """
+        Fingerprint the site data, so the server can reuse the stored contribution
+        of this site when its data did not change since an earlier job.
+
+        Returns:
+            A Shareable object with the fingerprint of the site data.
+        """
+        data_directory = get_data_directory_path(fl_ctx)
+        covariates_path = os.path.join(data_directory, "covariates.csv")
+        data_paths = resolve_data_shards(data_directory, self._data_file_pattern)
+
+        outgoing_shareable = Shareable()
+        outgoing_shareable["fingerprint"] = fingerprint_site_data(covariates_path, data_paths)
+        return outgoing_shareable
+
     def _do_task_perform_regression(
         self,
         shareable: Shareable,
@@ -59,38 +186,160 @@ class SrrExecutor(Executor):
 
         This method assumes that data has been validated and is ready for regression analysis.
         It reads the covariates and dependent data, runs the regression, and saves the results.
+        The dependents may be split over several data files (shards), listed in a
+        data manifest or matched by the configured data file pattern.
+
+        The regression runs block by block and stops between blocks when the task is
+        aborted, answering with TASK_ABORTED; progress and the estimated time remaining
+        are written to the validation log.
 
         Returns:
             A Shareable object with the regression results.
         """
+        if abort_signal.triggered:
+            return make_reply(ReturnCode.TASK_ABORTED)
+
         # Paths to data directories and logs
         data_directory = get_data_directory_path(fl_ctx)
         covariates_path = os.path.join(data_directory, "covariates.csv")
-        data_path = os.path.join(data_directory, "data.csv")
+        data_paths = resolve_data_shards(data_directory, self._data_file_pattern)
         computation_parameters = fl_ctx.get_peer_context().get_prop("COMPUTATION_PARAMETERS")
-        log_path = os.path.join(get_output_directory_path(fl_ctx), "validation_log.txt")
+        output_directory = get_output_directory_path(fl_ctx)
+        log_path = os.path.join(output_directory, "validation_log.txt")
         
         # Validate the run inputs (covariates, dependent data, and parameters)
-        is_valid = validate_run_input(covariates_path, data_path, computation_parameters, log_path)
+        with PHASE_SECONDS.time(phase="validation"):
+            is_valid = validate_run_input(covariates_path, data_paths, computation_parameters, log_path)
         if not is_valid:
             # Halt execution if validation fails
             raise ValueError(f"Invalid run input. Check validation log at {log_path}")
         
         # Extract covariates and dependent headers from computation parameters
-        covariates_headers = computation_parameters["Covariates"]
+        # With a model formula, the covariates only list the columns the formula may use
+        covariates_headers = computation_parameters.get("Covariates", [])
+        formula = computation_parameters.get("Formula")
+        schema = computation_parameters.get("Schema")
         data_headers = computation_parameters["Dependents"]
+        shard_dependents = assign_dependents_to_shards(data_paths, data_headers)
+        workers = max(1, min(self._dependent_workers, len(data_headers)))
+        # Worker processes share the CPUs used for the permutation blocks
+        permutation_test = PermutationTest.from_parameters(
+            computation_parameters, max_workers=max(1, (os.cpu_count() or 1) // workers))
+        bootstrap = BootstrapEstimator.from_parameters(computation_parameters, fl_ctx.get_identity_name())
+        cross_validation = CrossValidation.from_parameters(computation_parameters, fl_ctx.get_identity_name())
+        block_analyses = [
+            analysis for analysis in (permutation_test, bootstrap, cross_validation) if analysis is not None]
         
+        # Choose in-memory, chunked or memory-mapped processing to stay within the memory budget.
+        # Shards (and dependent workers) are processed concurrently, so each one gets an equal
+        # share of the budget; a worker reads its share of the dependents of every shard.
+        concurrent_shards = max(1, min(self._max_shard_workers, len(shard_dependents)))
+        plans = {}
+        for data_path, headers in shard_dependents.items():
+            plans[data_path] = plan_processing(
+                data_path, len(covariates_headers), -(-len(headers) // workers),
+                self._memory_budget_bytes // (concurrent_shards * workers),
+                allow_chunked=not block_analyses)
+            log_validation_info(
+                f"Processing {os.path.basename(data_path)} in {plans[data_path].mode} mode "
+                f"(estimated {plans[data_path].estimated_bytes / 2**20:.1f} MB)", log_path)
+
         # Perform ridge regression using the specified covariates and dependent variables
-        result = perform_ridge_regression(covariates_path, data_path, covariates_headers, data_headers)
+        progress = RegressionProgress(
+            len(data_headers), is_cancelled=lambda: abort_signal.triggered,
+            report=lambda message: log_validation_info(message, log_path))
+        try:
+            with PHASE_SECONDS.time(phase="regression"):
+                if workers > 1:
+                    log_validation_info(f"Splitting {len(data_headers)} dependents over {workers} worker processes", log_path)
+                    result = perform_worker_ridge_regression(
+                        covariates_path, shard_dependents, covariates_headers, data_headers, plans, workers,
+                        max_shard_workers=concurrent_shards, scratch_directory=output_directory,
+                        block_analyses=block_analyses, progress=progress, formula=formula, schema=schema)
+                elif len(shard_dependents) == 1:
+                    data_path = next(iter(shard_dependents))
+                    result = perform_ridge_regression(
+                        covariates_path, data_path, covariates_headers, data_headers,
+                        plan=plans[data_path], scratch_directory=output_directory, block_analyses=block_analyses,
+                        progress=progress, formula=formula, schema=schema)
+                else:
+                    result = perform_sharded_ridge_regression(
+                        covariates_path, shard_dependents, covariates_headers, data_headers, plans,
+                        max_workers=concurrent_shards, scratch_directory=output_directory,
+                        block_analyses=block_analyses, progress=progress, formula=formula, schema=schema)
+        except RegressionAborted as e:
+            log_validation_info(str(e), log_path)
+            return make_reply(ReturnCode.TASK_ABORTED)
+
+        DEPENDENTS_PROCESSED.inc(len(data_headers))
+        ROWS_PROCESSED.inc(progress.processed_rows)
+
+        budget = f"{self._memory_budget_bytes / 2**20:.1f} MB" if self._memory_budget_bytes else "unlimited"
+        log_validation_info(f"Peak RSS {peak_rss_bytes() / 2**20:.1f} MB (budget: {budget})", log_path)
         
-        # Save the results in both JSON and HTML format
-        self.save_json(result, "site_regression_result.json", fl_ctx)
-        html = json_to_html_results(result, "Site Regression Results")
-        self.save_html(html, "site_regression_result.html", fl_ctx)
+        # Save the results in both JSON and HTML format in the background,
+        # so the result is sent to the server without waiting on the disk
+        self._queue_result_reports(result, "site_regression_result", "Site Regression Results", fl_ctx)
 
         # Prepare the Shareable object to send the result to other components
+        result_block_size = shareable.get("result_block_size", 0)
+        if result_block_size > 0:
+            # Send the result in dependent blocks; the server fetches the remaining blocks
+            self._pending_result = result
+            self._pending_bootstrap = bootstrap.replicates() if bootstrap is not None else {}
+            self._result_block_size = result_block_size
+            return self._result_block(0, data_headers)
+
         outgoing_shareable = Shareable()
         outgoing_shareable["result"] = result
+        if bootstrap is not None:
+            # Per-resample coefficients, so the server can form global bootstrap intervals
+            outgoing_shareable["bootstrap"] = bootstrap.replicates()
+        return outgoing_shareable
+
+    def _do_task_get_result_block(
+        self,
+        shareable: Shareable,
+        fl_ctx: FLContext,
+        abort_signal: Signal,
+    ) -> Shareable:
+        """
+        Send one dependent block of the site result kept by the regression task.
+
+        Returns:
+            A Shareable object with the requested block of the regression results.
+        """
+        if abort_signal.triggered:
+            # The remaining blocks will not be fetched
+            self._pending_result, self._pending_bootstrap = {}, {}
+            return make_reply(ReturnCode.TASK_ABORTED)
+        data_headers = fl_ctx.get_peer_context().get_prop("COMPUTATION_PARAMETERS")["Dependents"]
+        return self._result_block(shareable["block"], data_headers)
+
+    def _result_block(self, block: int, data_headers: list) -> Shareable:
+        """
+        Build the Shareable of one dependent block of the pending site result.
+        Blocks follow the order of the dependents in the computation parameters.
+
+        Parameters:
+            block: Index of the block.
+            data_headers: The dependents of the computation.
+        """
+        start = block * self._result_block_size
+        names = data_headers[start:start + self._result_block_size]
+        if any(name not in self._pending_result for name in names):
+            # The regression task failed, was aborted or never ran at this site
+            logging.error(f"No pending regression result for result block {block}")
+            return make_reply(ReturnCode.EXECUTION_EXCEPTION)
+        outgoing_shareable = Shareable()
+        outgoing_shareable["result"] = {name: self._pending_result[name] for name in names}
+        if self._pending_bootstrap:
+            outgoing_shareable["bootstrap"] = {name: self._pending_bootstrap[name] for name in names}
+
+        # The last block releases the site result
+        if start + self._result_block_size >= len(data_headers):
+            self._pending_result = {}
+            self._pending_bootstrap = {}
         return outgoing_shareable
 
     def _do_task_save_global_regression_results(
@@ -104,45 +353,147 @@ class SrrExecutor(Executor):
 
         This method retrieves the global regression results from the Shareable object,
         saves them in JSON and HTML format, and returns a Shareable object.
+        The global result may arrive in dependent blocks, which are appended to the
+        reports as they arrive. With a significance filter, the dependents that did not
+        pass it arrive in compact form and are written to a compressed .npz file. Write
+        failures of this task or of the earlier site reports are raised with the last block.
         """
-        # Retrieve the global regression result from the Shareable object
+        # Retrieve the global regression result (block) from the Shareable object
         result = shareable.get("result")
+        block = shareable.get("block", 0)
+        block_count = shareable.get("block_count", 1)
+        first, last = block == 0, block == block_count - 1
         
-        # Save the global regression results
-        self.save_json(result, "global_regression_result.json", fl_ctx)
-        html = json_to_html_results(result, "Global Regression Results")
-        self.save_html(html, "global_regression_result.html", fl_ctx)
+        # Save the global regression results and index them so they can be
+        # queried without loading the JSON
+        output_dir = get_output_directory_path(fl_ctx)
+        self._result_writer.submit(
+            "global_regression_result.json", self.save_json_block,
+            result, "global_regression_result.json", output_dir, first, last)
+        self._result_writer.submit(
+            "global_regression_result.html", self.save_html_report_block,
+            result, "global_regression_result.html", "Global Regression Results", output_dir, first, last)
+        store_path = os.path.join(output_dir, RESULT_STORE_FILENAME)
+        self._result_writer.submit(
+            RESULT_STORE_FILENAME, save_results_to_store, result, store_path, fl_ctx.get_job_id())
+
+        # Dependents that did not pass the significance filter are only kept in compact binary form
+        compact = shareable.get("compact_result")
+        if compact is not None:
+            if first:
+                self._pending_compact = []
+            self._pending_compact.append(compact)
+            if last:
+                self._result_writer.submit(
+                    COMPACT_RESULTS_FILENAME, save_compact_results,
+                    concatenate_compact_results(self._pending_compact), os.path.join(output_dir, COMPACT_RESULTS_FILENAME))
+                self._pending_compact = []
+
+        # This is the last task of the run, so wait for all reports to be on disk
+        if last:
+            with PHASE_SECONDS.time(phase="report_flush"):
+                self._result_writer.flush()
         
         return Shareable()
 
 
 # Utility methods for saving JSON and HTML files
-    def save_json(self, data: dict, filename: str, fl_ctx: FLContext) -> None:
+    def _queue_result_reports(self, result: dict, basename: str, title: str, fl_ctx: FLContext) -> None:
+        """
+        Queue the JSON and HTML reports of a result on the background writer.
+
+        The output directory is resolved here because the FLContext must not be
+        used from the writer thread.
+
+        Parameters:
+            result: The result dictionary to be saved.
+            basename: File name of the reports without extension.
+            title: Title of the HTML report.
+            fl_ctx: The federated learning context.
+        """
+        output_dir = get_output_directory_path(fl_ctx)
+        self._result_writer.submit(f"{basename}.json", self.save_json, result, f"{basename}.json", output_dir)
+        self._result_writer.submit(f"{basename}.html", self.save_html_report, result, f"{basename}.html", title, output_dir)
+
+    def save_json(self, data: dict, filename: str, output_dir: str) -> None:
         """
         Save a dictionary as a JSON file in the output directory.
 
         Parameters:
             data: The dictionary to be saved.
             filename: The name of the JSON file.
-            fl_ctx: The federated learning context.
+            output_dir: The output directory path.
         """
-        # Get the output directory path and save the JSON file
-        output_dir = get_output_directory_path(fl_ctx)
         output_path = os.path.join(output_dir, filename)
         with open(output_path, 'w') as f:
             json.dump(data, f, indent=4)
 
-    def save_html(self, data: str, filename: str, fl_ctx: FLContext) -> None:
+    def save_html_report(self, data: dict, filename: str, title: str, output_dir: str) -> None:
+        """
+        Render a result dictionary as HTML and save it in the output directory.
+
+        Parameters:
+            data: The result dictionary to be rendered.
+            filename: The name of the HTML file.
+            title: The title of the HTML report.
+            output_dir: The output directory path.
+        """
+        self.save_html(json_to_html_results(data, title), filename, output_dir)
+
+    def save_json_block(self, data: dict, filename: str, output_dir: str, first: bool, last: bool) -> None:
+        """
+        Append a block of a dictionary to a JSON file in the output directory. The
+        blocks together produce the same file as save_json of the whole dictionary.
+
+        Parameters:
+            data: The block of the dictionary to be saved.
+            filename: The name of the JSON file.
+            output_dir: The output directory path.
+            first: Whether this is the first block; the file is created.
+            last: Whether this is the last block; the file is closed.
+        """
+        output_path = os.path.join(output_dir, filename)
+        # Earlier blocks may have been empty, e.g. when no dependent of a block passed the significance filter
+        empty = first or os.path.getsize(output_path) <= 1
+        with open(output_path, 'w' if first else 'a') as f:
+            if first:
+                f.write("{")
+            for index, item in enumerate(data.items()):
+                # The entries of an indented dump of a single-entry object, without the braces
+                f.write("\n" if empty and index == 0 else ",\n")
+                f.write(json.dumps(dict([item]), indent=4)[2:-2])
+            if last:
+                f.write("}" if empty and not data else "\n}")
+
+    def save_html_report_block(self, data: dict, filename: str, title: str, output_dir: str, first: bool, last: bool) -> None:
+        """
+        Append the tables of a block of a result dictionary to an HTML report in the output directory.
+
+        Parameters:
+            data: The block of the result dictionary to be rendered.
+            filename: The name of the HTML file.
+            title: The title of the HTML report.
+            output_dir: The output directory path.
+            first: Whether this is the first block; the file is created.
+            last: Whether this is the last block; the file is closed.
+        """
+        output_path = os.path.join(output_dir, filename)
+        with open(output_path, 'w' if first else 'a') as f:
+            if first:
+                f.write(html_report_header(title))
+            f.write(html_report_sections(data))
+            if last:
+                f.write(html_report_footer())
+
+    def save_html(self, data: str, filename: str, output_dir: str) -> None:
         """
         Save a string as an HTML file in the output directory.
 
         Parameters:
             data: The string content to be saved.
             filename: The name of the HTML file.
-            fl_ctx: The federated learning context.
+            output_dir: The output directory path.
         """
-        # Get the output directory path and save the HTML file
-        output_dir = get_output_directory_path(fl_ctx)
         output_path = os.path.join(output_dir, filename)
         with open(output_path, 'w') as f:
             f.write(data)
@@ -1,8 +1,21 @@
 import json
 
+# Optional rows rendered when present in the results, as (key, label, number format)
+OPTIONAL_ROWS = [
+    ("Permutation P-Values", "Permutation P-value", ".4e"),
+    ("FWER P-Values", "FWER P-value", ".4e"),
+    ("FDR P-Values", "FDR P-value", ".4e"),
+    ("Bonferroni P-Values", "Bonferroni P-value", ".4e"),
+    ("CI Lower", "CI Lower", ".4f"),
+    ("CI Upper", "CI Upper", ".4f"),
+]
+
 def json_to_html_results(json_data, table_name="Regression Results"):
+    return html_report_header(table_name) + html_report_sections(json_data) + html_report_footer()
+
+def html_report_header(table_name="Regression Results"):
     # HTML header
-    html_content = f"""
+    return f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -34,6 +47,10 @@ def json_to_html_results(json_data, table_name="Regression Results"):
     <h1>{table_name}</h1>
     """
 
+def html_report_sections(json_data):
+    """Tables of a block of dependents, so large reports can be written incrementally."""
+    html_content = ""
+
     # Process each entry in the JSON
     for key, values in json_data.items():
         html_content += f"<h2>{key}</h2>\n"
@@ -60,6 +77,14 @@ def json_to_html_results(json_data, table_name="Regression Results"):
         for p_val in values["P-Values"]:
             html_content += f"<td>{p_val:.4e}</td>"
         html_content += "</tr>"
+
+        # Optional rows, e.g. from a permutation test or a bootstrap
+        for key, label, number_format in OPTIONAL_ROWS:
+            if key in values:
+                html_content += f"<tr><td>{label}</td>"
+                for value in values[key]:
+                    html_content += f"<td>{value:{number_format}}</td>"
+                html_content += "</tr>"
         
         # Add rows for R-Squared, Degrees of Freedom, Sum of Squared Errors
         html_content += f"""
@@ -76,13 +101,21 @@ def json_to_html_results(json_data, table_name="Regression Results"):
             <td colspan="{len(values['Variables'])}">{values['Sum of Squared Errors']:.2f}</td>
         </tr>
         """
-        
+        if "Selected Alpha" in values:
+            html_content += f"""
+        <tr>
+            <td>Selected Alpha</td>
+            <td colspan="{len(values['Variables'])}">{values['Selected Alpha']:.4g}</td>
+        </tr>
+        """
+
         html_content += "</table>\n"
 
+    return html_content
+
+def html_report_footer():
     # HTML footer
-    html_content += """
+    return """
     </body>
     </html>
     """
-
-    return html_content
@@ -0,0 +1,96 @@
+import os
+import resource
+from typing import NamedTuple
+
+# Processing modes for data.csv
+MODE_IN_MEMORY = "in_memory"
+MODE_CHUNKED = "chunked"
+MODE_MEMORY_MAPPED = "memory_mapped"
+
+# Peak pandas/numpy working set per parsed float value: the parser buffers,
+# the float64 array and the centered copy used for the moments
+_BYTES_PER_VALUE = 3 * 8
+# Python objects held per reported statistic in the result dictionary
+_RESULT_BYTES_PER_STATISTIC = 64
+# Smallest row chunk worth streaming; below this the file is staged to disk instead
+_MIN_CHUNK_ROWS = 256
+# Lines sampled to estimate the row count and the width of a row
+_SAMPLE_LINES = 100
+# Most dependents regressed per block in any mode; progress is reported and aborts are
+# honored between blocks
+MAX_DEPENDENT_BLOCK_SIZE = 512
+
+
+class ProcessingPlan(NamedTuple):
+    """How data.csv is loaded so that the executor stays within its memory budget."""
+    mode: str
+    chunk_rows: int
+    dependent_block_size: int
+    estimated_bytes: int
+
+
+def plan_processing(
+    data_path: str,
+    n_covariates: int,
+    n_dependents: int,
+    memory_budget_bytes: int,
+    allow_chunked: bool = True,
+) -> ProcessingPlan:
+    """
+    Estimate the memory footprint of a run before loading anything and choose how to
+    process data.csv:
+
+    - in_memory: the whole file is loaded at once.
+    - chunked: the file is streamed in row chunks and only the moments of the
+      dependents are kept.
+    - memory_mapped: even a minimal row chunk of all dependents does not fit, so the
+      file is staged to a memory-mapped file and processed in dependent blocks.
+
+    :param data_path: Path to data.csv.
+    :param n_covariates: Number of covariates in the model.
+    :param n_dependents: Number of dependent variables in the model.
+    :param memory_budget_bytes: Memory budget in bytes. 0 disables the budget.
+    :param allow_chunked: Whether row-chunked processing may be used. Analyses that
+                          need whole dependent columns (e.g. permutation tests) disable it.
+    :return: The processing plan. Dependent blocks hold at most MAX_DEPENDENT_BLOCK_SIZE dependents.
+    """
+    max_block_size = max(1, min(n_dependents, MAX_DEPENDENT_BLOCK_SIZE))
+    n_rows, bytes_per_row = _estimate_rows(data_path)
+    row_bytes = bytes_per_row + n_dependents * _BYTES_PER_VALUE
+    result_bytes = n_dependents * (3 * (n_covariates + 1) + 3) * _RESULT_BYTES_PER_STATISTIC
+    moment_bytes = n_dependents * (n_covariates + 2) * 8
+    in_memory_bytes = n_rows * row_bytes + result_bytes + moment_bytes
+
+    if memory_budget_bytes <= 0 or in_memory_bytes <= memory_budget_bytes:
+        return ProcessingPlan(MODE_IN_MEMORY, 0, max_block_size, in_memory_bytes)
+
+    available = memory_budget_bytes - result_bytes - moment_bytes
+    chunk_rows = available // row_bytes if available > 0 else 0
+    if allow_chunked and chunk_rows >= _MIN_CHUNK_ROWS:
+        return ProcessingPlan(MODE_CHUNKED, int(chunk_rows), max_block_size,
+                              int(result_bytes + moment_bytes + chunk_rows * row_bytes))
+
+    # Stage the file with small row chunks, then process as many dependents per
+    # block as fit when each column holds every subject
+    staging_rows = max(1, min(_MIN_CHUNK_ROWS, available // max(row_bytes, 1)))
+    column_bytes = max(n_rows, 1) * _BYTES_PER_VALUE
+    block_size = max(1, min(max_block_size, max(available, 0) // column_bytes))
+    return ProcessingPlan(MODE_MEMORY_MAPPED, int(staging_rows), int(block_size),
+                          int(result_bytes + block_size * column_bytes))
+
+
+def _estimate_rows(data_path: str) -> tuple:
+    """Estimate the number of rows and the text width of a row from the file size and a sample."""
+    file_size = os.path.getsize(data_path)
+    with open(data_path, 'rb') as f:
+        header_bytes = len(f.readline())
+        sample = [len(line) for _, line in zip(range(_SAMPLE_LINES), f)]
+    if not sample:
+        return 0, 0
+    bytes_per_row = sum(sample) / len(sample)
+    return int((file_size - header_bytes) / bytes_per_row) + 1, int(bytes_per_row)
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process (ru_maxrss is reported in kilobytes on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
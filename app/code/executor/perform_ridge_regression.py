@@ -1,58 +1,623 @@
+import os
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import Ridge
+from scipy import stats
 from sklearn.preprocessing import StandardScaler
-import statsmodels.api as sm
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
+from .memory_budget import ProcessingPlan, MODE_IN_MEMORY, MODE_CHUNKED, MODE_MEMORY_MAPPED, MAX_DEPENDENT_BLOCK_SIZE
+from .dataset_cache import get_dataset_cache
+from .design_formula import build_formula_design
+from .typed_csv import read_typed_csv
+from .progress import RegressionProgress, RegressionAborted, WorkerProgress, drain_worker_progress
 
-def perform_ridge_regression(covariates_path: str, data_path: str, covariates_headers: List[str], data_headers: List[str]) -> Dict[str, Dict[str, Any]]:
-    # Load data
-    covariates = pd.read_csv(covariates_path)
-    data = pd.read_csv(data_path)
 
-    # Filter data using the specified headers
-    covariates = covariates[covariates_headers]
-    data = data[data_headers]
+# Ridge penalty used for the reported coefficients
+RIDGE_ALPHA = 1.0
+# Forms of the ridge and OLS solutions (see decompose_covariates)
+SOLVER_PRIMAL = "primal"
+SOLVER_DUAL = "dual"
+SOLVER_AUTO = "auto"
+SOLVERS = (SOLVER_AUTO, SOLVER_PRIMAL, SOLVER_DUAL)
+# Seconds between two polls of the progress of worker processes
+_WORKER_POLL_INTERVAL = 0.5
 
-    # Standardize covariates
-    scaler = StandardScaler()
-    X = scaler.fit_transform(covariates)
-    X = sm.add_constant(X)  # Add intercept
 
-    # Initialize results storage
+class RegressionDesign:
+    """
+    Standardized covariates of a site together with the factorizations shared by
+    every dependent variable.
+
+    The standardized covariates have zero column means, so the intercept
+    decouples from the slopes and all statistics can be computed from the
+    per-dependent moments: the mean, the centered sum of squares and X'y.
+
+    The OLS and ridge solutions of every dependent and every alpha come from one
+    eigendecomposition of X'X, restricted to its numerically nonzero eigenvalues
+    (see decompose_covariates): in primal form from the covariates x covariates
+    Gram matrix, or, for designs with more covariates than subjects, in dual form
+    from the subjects x subjects kernel XX'. Both give the same eigenpairs, so the
+    statistics do not depend on the form.
+    """
+
+    def __init__(
+        self,
+        covariates: np.ndarray,
+        covariates_headers: List[str],
+        alpha: float = RIDGE_ALPHA,
+        gram: Optional[np.ndarray] = None,
+        solver: str = SOLVER_AUTO,
+    ):
+        """
+        :param covariates: The standardized covariates, subjects x covariates.
+        :param covariates_headers: Names of the covariate columns.
+        :param alpha: Ridge penalty of the reported coefficients.
+        :param gram: Precomputed X'X, used by the primal form.
+        :param solver: SOLVER_PRIMAL, SOLVER_DUAL, or SOLVER_AUTO to choose from the shape.
+        """
+        self.covariates = covariates
+        self.labels = ['Intercept'] + covariates_headers
+        self.n_subjects = covariates.shape[0]
+        self.alpha = alpha
+        self.column_sums = covariates.sum(axis=0)
+        self.solver, self.eigenvalues, self.components = decompose_covariates(covariates, gram, solver)
+        # Diagonal of the pseudo-inverse of X'X, for the OLS standard errors
+        self.ols_variances = (self.components ** 2) @ (1 / self.eigenvalues)
+        self.degrees_of_freedom = float(self.n_subjects - len(self.eigenvalues) - 1)
+
+
+def choose_solver(n_subjects: int, n_covariates: int) -> str:
+    """
+    The cheaper form of a design: the primal form costs O(n p^2 + p^3) for the Gram
+    matrix and its eigendecomposition, the dual form O(n^2 p + n^3) for the kernel.
+    """
+    return SOLVER_DUAL if n_covariates > n_subjects else SOLVER_PRIMAL
+
+
+def decompose_covariates(
+    covariates: np.ndarray,
+    gram: Optional[np.ndarray] = None,
+    solver: str = SOLVER_AUTO,
+) -> Tuple[str, np.ndarray, np.ndarray]:
+    """
+    Eigendecomposition X'X = V diag(l) V' restricted to the eigenvalues above the
+    rank tolerance of numpy's matrix_rank (largest eigenvalue x max(n, p) x eps).
+
+    In dual form, the kernel XX' = U diag(l) U' has the same nonzero eigenvalues, and
+    the eigenvectors of X'X follow as V = X'U diag(l)^-1/2, without forming X'X.
+
+    :param covariates: The covariates, subjects x covariates.
+    :param gram: Precomputed X'X, used by the primal form.
+    :param solver: SOLVER_PRIMAL, SOLVER_DUAL, or SOLVER_AUTO to choose from the shape.
+    :return: The form used, the eigenvalues and the eigenvectors (covariates x rank).
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver {solver!r}; expected one of {SOLVERS}.")
+    n_subjects, n_covariates = covariates.shape
+    if solver == SOLVER_AUTO:
+        solver = choose_solver(n_subjects, n_covariates)
+
+    if solver == SOLVER_PRIMAL:
+        eigenvalues, eigenvectors = np.linalg.eigh(gram if gram is not None else covariates.T @ covariates)
+    else:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariates @ covariates.T)
+    tolerance = eigenvalues.max(initial=0.0) * max(n_subjects, n_covariates) * np.finfo(np.float64).eps
+    kept = eigenvalues > tolerance
+    eigenvalues = eigenvalues[kept]
+    if solver == SOLVER_PRIMAL:
+        return solver, eigenvalues, eigenvectors[:, kept]
+    return solver, eigenvalues, (covariates.T @ eigenvectors[:, kept]) / np.sqrt(eigenvalues)
+
+
+def load_regression_design(
+    covariates_path: str,
+    covariates_headers: List[str],
+    formula: Optional[str] = None,
+    schema: Optional[Dict[str, str]] = None,
+) -> RegressionDesign:
+    """
+    Load and standardize the covariates of a site, from the dataset cache when it holds them.
+    With a model formula, the design columns are built from the formula instead (see
+    build_formula_design); the covariates headers then only select the columns it may use.
+    Columns are parsed with the types declared in the schema (see read_typed_csv).
+    """
+    schema = schema or {}
+    if formula:
+        columns = covariates_headers or list(pd.read_csv(covariates_path, nrows=0).columns)
+
+        def load_formula() -> RegressionDesign:
+            covariates = read_typed_csv(covariates_path, columns, schema)
+            design, names, gram = build_formula_design(covariates, formula)
+            return RegressionDesign(design, names, gram=gram)
+
+        return get_dataset_cache().get(
+            "formula_design", covariates_path, [formula] + _typed_columns(columns, schema), load_formula)
+
+    def load() -> RegressionDesign:
+        covariates = read_typed_csv(covariates_path, covariates_headers, schema)
+        scaler = StandardScaler()
+        return RegressionDesign(scaler.fit_transform(covariates), covariates_headers)
+
+    return get_dataset_cache().get("design", covariates_path, _typed_columns(covariates_headers, schema), load)
+
+
+def _typed_columns(columns: List[str], schema: Dict[str, str]) -> List[str]:
+    """Columns with their declared types, which identify the parsed data in the dataset cache."""
+    return [f"{column}:{schema[column]}" if column in schema else column for column in columns]
+
+
+def perform_ridge_regression(
+    covariates_path: str,
+    data_path: str,
+    covariates_headers: List[str],
+    data_headers: List[str],
+    plan: Optional[ProcessingPlan] = None,
+    scratch_directory: Optional[str] = None,
+    block_analyses: Sequence[Any] = (),
+    progress: Optional[RegressionProgress] = None,
+    formula: Optional[str] = None,
+    schema: Optional[Dict[str, str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit a ridge regression (with OLS statistics) for every dependent variable.
+
+    :param covariates_path: Path to covariates.csv.
+    :param data_path: Path to data.csv.
+    :param covariates_headers: Covariate columns to use.
+    :param data_headers: Dependent columns to use.
+    :param plan: How to load data.csv. The whole file is loaded in memory when omitted.
+    :param scratch_directory: Directory for the memory-mapped copy of data.csv.
+    :param block_analyses: Optional analyses (e.g. a PermutationTest or BootstrapEstimator) that
+                           add statistics to the results.
+    :param progress: Optional progress, advanced after every block of dependents; raises
+                     RegressionAborted between blocks once the task is aborted.
+    :param formula: Optional model formula the design is built from.
+    :param schema: Optional declared types of the covariates columns.
+    :return: Regression statistics keyed by dependent variable.
+    """
+    design = load_regression_design(covariates_path, covariates_headers, formula, schema)
+    results = regress_data_file(design, data_path, data_headers, plan, scratch_directory, block_analyses, progress)
+    for analysis in block_analyses:
+        analysis.apply(results)
+    return results
+
+
+def perform_sharded_ridge_regression(
+    covariates_path: str,
+    shard_dependents: Dict[str, List[str]],
+    covariates_headers: List[str],
+    data_headers: List[str],
+    plans: Dict[str, ProcessingPlan],
+    max_workers: int,
+    scratch_directory: Optional[str] = None,
+    block_analyses: Sequence[Any] = (),
+    progress: Optional[RegressionProgress] = None,
+    formula: Optional[str] = None,
+    schema: Optional[Dict[str, str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit the regressions of dependents spread over several data files (shards).
+
+    The covariates are standardized once and the design is shared by all shards,
+    which are processed concurrently by a thread pool (the heavy numpy and CSV
+    parsing work releases the GIL). Shards are never concatenated; only their
+    per-dependent results are merged.
+
+    :param covariates_path: Path to covariates.csv.
+    :param shard_dependents: Dependents to read from each shard, keyed by shard path.
+    :param covariates_headers: Covariate columns to use.
+    :param data_headers: All dependent columns, in the order of the merged result.
+    :param plans: Processing plan of each shard, keyed by shard path.
+    :param max_workers: Number of shards processed concurrently.
+    :param scratch_directory: Directory for memory-mapped copies of the shards.
+    :param block_analyses: Optional analyses that add statistics to the results. They are
+                           shared by all shards, so e.g. the max-statistic correction of a
+                           permutation test spans every dependent.
+    :param progress: Optional progress shared by the shards; raises RegressionAborted between
+                     blocks once the task is aborted.
+    :param formula: Optional model formula the design is built from.
+    :param schema: Optional declared types of the covariates columns.
+    :return: Regression statistics keyed by dependent variable.
+    """
+    design = load_regression_design(covariates_path, covariates_headers, formula, schema)
+    shard_results = _regress_shards(
+        design, shard_dependents, plans, max_workers, scratch_directory, block_analyses, progress)
+    results = {dependent_var: shard_results[dependent_var] for dependent_var in data_headers}
+    for analysis in block_analyses:
+        analysis.apply(results)
+    return results
+
+
+def perform_worker_ridge_regression(
+    covariates_path: str,
+    shard_dependents: Dict[str, List[str]],
+    covariates_headers: List[str],
+    data_headers: List[str],
+    plans: Dict[str, ProcessingPlan],
+    n_workers: int,
+    max_shard_workers: int = 1,
+    scratch_directory: Optional[str] = None,
+    block_analyses: Sequence[Any] = (),
+    progress: Optional[RegressionProgress] = None,
+    formula: Optional[str] = None,
+    schema: Optional[Dict[str, str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit the regressions in several worker processes that split the dependents between them.
+
+    The dependents are divided into contiguous groups, one per worker. Every worker
+    loads the design itself and regresses its group from the (shared) data files; the
+    results and the state of the block analyses of all workers are then combined into
+    one site result, in the order of `data_headers`.
+
+    :param covariates_path: Path to covariates.csv.
+    :param shard_dependents: Dependents to read from each shard, keyed by shard path.
+    :param covariates_headers: Covariate columns to use.
+    :param data_headers: All dependent columns, in the order of the combined result.
+    :param plans: Processing plan of each shard for the share of one worker, keyed by shard path.
+    :param n_workers: Number of worker processes.
+    :param max_shard_workers: Number of shards processed concurrently within a worker.
+    :param scratch_directory: Directory for memory-mapped copies of the shards.
+    :param block_analyses: Optional analyses that add statistics to the results. Every worker
+                           updates a copy, which is merged back before they are applied.
+    :param progress: Optional progress of the whole site. The workers report their finished
+                     blocks through a manager queue and stop between blocks once the parent
+                     sets the cancellation event, after which RegressionAborted is raised.
+    :param formula: Optional model formula the design is built from.
+    :param schema: Optional declared types of the covariates columns.
+    :return: Regression statistics keyed by dependent variable.
+    """
+    if progress is None:
+        return _perform_worker_ridge_regression(
+            covariates_path, shard_dependents, covariates_headers, data_headers, plans, n_workers,
+            max_shard_workers, scratch_directory, block_analyses, formula, schema)
+    with multiprocessing.Manager() as manager:
+        return _perform_worker_ridge_regression(
+            covariates_path, shard_dependents, covariates_headers, data_headers, plans, n_workers,
+            max_shard_workers, scratch_directory, block_analyses, formula, schema, progress, manager.Queue(),
+            manager.Event())
+
+
+def _perform_worker_ridge_regression(
+    covariates_path: str,
+    shard_dependents: Dict[str, List[str]],
+    covariates_headers: List[str],
+    data_headers: List[str],
+    plans: Dict[str, ProcessingPlan],
+    n_workers: int,
+    max_shard_workers: int,
+    scratch_directory: Optional[str],
+    block_analyses: Sequence[Any],
+    formula: Optional[str] = None,
+    schema: Optional[Dict[str, str]] = None,
+    progress: Optional[RegressionProgress] = None,
+    progress_blocks: Any = None,
+    cancelled: Any = None,
+) -> Dict[str, Dict[str, Any]]:
+    """perform_worker_ridge_regression, with the manager queue and event relaying the progress."""
+    groups = [list(group) for group in np.array_split(np.array(data_headers, dtype=object), n_workers) if len(group)]
+    with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+        futures = []
+        for group in groups:
+            members = set(group)
+            worker_dependents = {
+                data_path: [dependent for dependent in headers if dependent in members]
+                for data_path, headers in shard_dependents.items()
+            }
+            worker_dependents = {data_path: headers for data_path, headers in worker_dependents.items() if headers}
+            futures.append(pool.submit(
+                _regress_dependent_group, covariates_path, worker_dependents, covariates_headers, plans,
+                max_shard_workers, scratch_directory, list(block_analyses), formula, schema, progress_blocks,
+                cancelled))
+
+        if progress is not None:
+            # Relay the progress of the workers and cancel them once the task is aborted
+            try:
+                pending = set(futures)
+                while pending:
+                    _, pending = wait(pending, timeout=_WORKER_POLL_INTERVAL)
+                    drain_worker_progress(progress_blocks, progress)
+                progress.check()
+            except RegressionAborted:
+                cancelled.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+        worker_results = {}
+        for future in futures:
+            group_results, group_analyses = future.result()
+            worker_results.update(group_results)
+            for analysis, group_analysis in zip(block_analyses, group_analyses):
+                analysis.merge(group_analysis)
+
+    results = {dependent_var: worker_results[dependent_var] for dependent_var in data_headers}
+    for analysis in block_analyses:
+        analysis.apply(results)
+    return results
+
+
+def _regress_dependent_group(
+    covariates_path: str,
+    shard_dependents: Dict[str, List[str]],
+    covariates_headers: List[str],
+    plans: Dict[str, ProcessingPlan],
+    max_shard_workers: int,
+    scratch_directory: Optional[str],
+    block_analyses: List[Any],
+    formula: Optional[str] = None,
+    schema: Optional[Dict[str, str]] = None,
+    progress_blocks: Any = None,
+    cancelled: Any = None,
+) -> Tuple[Dict[str, Dict[str, Any]], List[Any]]:
+    """Worker process: regress one group of dependents and return the results with the updated analyses."""
+    progress = WorkerProgress(progress_blocks, cancelled) if progress_blocks is not None else None
+    design = load_regression_design(covariates_path, covariates_headers, formula, schema)
+    results = _regress_shards(
+        design, shard_dependents, plans, max_shard_workers, scratch_directory, block_analyses, progress)
+    return results, block_analyses
+
+
+def _regress_shards(
+    design: RegressionDesign,
+    shard_dependents: Dict[str, List[str]],
+    plans: Dict[str, ProcessingPlan],
+    max_workers: int,
+    scratch_directory: Optional[str],
+    block_analyses: Sequence[Any],
+    progress: Optional[RegressionProgress] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Regress the shards concurrently in a thread pool and merge their (unordered) results."""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(regress_data_file, design, data_path, headers, plans[data_path], scratch_directory,
+                        block_analyses, progress)
+            for data_path, headers in shard_dependents.items()
+        ]
+        shard_results = {}
+        for future in futures:
+            shard_results.update(future.result())
+    return shard_results
+
+
+def regress_data_file(
+    design: RegressionDesign,
+    data_path: str,
+    data_headers: List[str],
+    plan: Optional[ProcessingPlan] = None,
+    scratch_directory: Optional[str] = None,
+    block_analyses: Sequence[Any] = (),
+    progress: Optional[RegressionProgress] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit the regressions of the dependents in one data file against a loaded design.
+
+    :param design: The standardized covariates of the site.
+    :param data_path: Path to the data file.
+    :param data_headers: Dependent columns to use.
+    :param plan: How to load the data file. The whole file is loaded in memory when omitted.
+    :param scratch_directory: Directory for the memory-mapped copy of the data file.
+    :param block_analyses: Optional analyses fed with every block of dependents through
+                           update(design, names, centered, progress); they check the progress
+                           for an abort within long blocks. The caller applies them to the
+                           results once all blocks are seen.
+    :param progress: Optional progress, advanced after every block of dependents and checked
+                     between the row chunks of a streamed file.
+    :return: Regression statistics keyed by dependent variable.
+    """
+    plan = plan or ProcessingPlan(MODE_IN_MEMORY, 0, max(1, min(len(data_headers), MAX_DEPENDENT_BLOCK_SIZE)), 0)
+
     results = {}
+    blocks = _iterate_blocks(design, data_path, data_headers, plan, scratch_directory, progress)
+    for names, centered, moments in blocks:
+        results.update(_statistics_from_moments(design, names, *moments))
+        if block_analyses and centered is None:
+            raise ValueError("Permutation tests, bootstraps and cross-validation need whole dependent columns and cannot run in chunked mode.")
+        for analysis in block_analyses:
+            analysis.update(design, names, centered, progress)
+        if progress is not None:
+            progress.advance(len(names))
+    if progress is not None:
+        progress.record_rows(design.n_subjects)
+    return results
+
+
+def _iterate_blocks(
+    design: RegressionDesign,
+    data_path: str,
+    data_headers: List[str],
+    plan: ProcessingPlan,
+    scratch_directory: Optional[str],
+    progress: Optional[RegressionProgress] = None,
+) -> Iterator[Tuple[List[str], Optional[np.ndarray], Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+    """
+    Yield the dependents block by block, loading the data file as planned, as
+    (names, centered values, moments). The centered values are None in chunked
+    mode, where whole columns are never held in memory; the moments of all dependents
+    are accumulated in one pass over the file (checking for an abort between row
+    chunks) and then yielded in dependent blocks.
+    """
+    if plan.mode == MODE_CHUNKED:
+        mean, sum_of_squares, cross_products = _accumulate_moments_in_chunks(
+            design, data_path, data_headers, plan.chunk_rows, progress)
+        for start in range(0, len(data_headers), plan.dependent_block_size):
+            stop = start + plan.dependent_block_size
+            moments = (mean[start:stop], sum_of_squares[start:stop], cross_products[:, start:stop])
+            yield data_headers[start:stop], None, moments
+        return
+
+    if plan.mode == MODE_MEMORY_MAPPED:
+        with tempfile.TemporaryDirectory(dir=scratch_directory) as directory:
+            data = _stage_memory_mapped(data_path, data_headers, plan.chunk_rows, design.n_subjects,
+                                        os.path.join(directory, "data.f64"), progress)
+            for start in range(0, len(data_headers), plan.dependent_block_size):
+                stop = start + plan.dependent_block_size
+                yield (data_headers[start:stop], *_block_moments(design, np.asarray(data[:, start:stop])))
+            del data
+        return
+
+    data = get_dataset_cache().get(
+        "data", data_path, data_headers,
+        lambda: read_typed_csv(data_path, data_headers, default_type="float64").to_numpy(dtype=np.float64))
+    for start in range(0, len(data_headers), plan.dependent_block_size):
+        stop = start + plan.dependent_block_size
+        yield (data_headers[start:stop], *_block_moments(design, data[:, start:stop]))
 
-    # Include intercept in the headers for labeling
-    covariate_labels = ['Intercept'] + covariates_headers
 
-    # Loop through each dependent variable in data.csv
-    for dependent_var in data.columns:
-        y = data[dependent_var]
+def _block_moments(design: RegressionDesign, y: np.ndarray) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Centered values, and mean, centered sum of squares and X'y, of a block of dependents held in memory."""
+    _check_row_count(y.shape[0], design.n_subjects, exact=True)
+    mean = y.mean(axis=0)
+    centered = y - mean
+    return centered, (mean, np.einsum('ij,ij->j', centered, centered), design.covariates.T @ centered)
 
-        # Fit Ridge regression model
-        ridge_model = Ridge(alpha=1.0)
-        ridge_model.fit(X, y)
-        coefficients = ridge_model.coef_
 
-        # Fit OLS model for statistical metrics
-        ols_model = sm.OLS(y, X).fit()
+def _accumulate_moments_in_chunks(
+    design: RegressionDesign,
+    data_path: str,
+    data_headers: List[str],
+    chunk_rows: int,
+    progress: Optional[RegressionProgress] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stream the data file in row chunks and accumulate the moments of all dependents.
 
-        # Extract statistics
-        t_stats = ols_model.tvalues
-        p_values = ols_model.pvalues
-        r_squared = ols_model.rsquared
-        degrees_of_freedom = ols_model.df_resid
-        sse = np.sum((y - ridge_model.predict(X)) ** 2)
+    Means and sums of squares are merged with Chan's parallel update, and X'y is
+    accumulated around a fixed shift to avoid cancellation on large values.
+    """
+    count = 0
+    mean = shift = None
+    sum_of_squares = cross_products = None
+    reader = read_typed_csv(data_path, data_headers, default_type="float64", chunksize=chunk_rows)
+    for chunk in reader:
+        if progress is not None:
+            progress.check()
+        y = chunk[data_headers].to_numpy(dtype=np.float64)
+        rows = slice(count, count + y.shape[0])
+        _check_row_count(rows.stop, design.n_subjects)
+        chunk_mean = y.mean(axis=0)
+        centered = y - chunk_mean
+        chunk_sum_of_squares = np.einsum('ij,ij->j', centered, centered)
+        if mean is None:
+            shift = chunk_mean
+            mean = chunk_mean
+            sum_of_squares = chunk_sum_of_squares
+            cross_products = design.covariates[rows].T @ (y - shift)
+        else:
+            total = count + y.shape[0]
+            delta = chunk_mean - mean
+            mean = mean + delta * y.shape[0] / total
+            sum_of_squares = sum_of_squares + chunk_sum_of_squares + delta ** 2 * count * y.shape[0] / total
+            cross_products += design.covariates[rows].T @ (y - shift)
+        count = rows.stop
 
-        # Store results with proper labeling of variables
+    _check_row_count(count, design.n_subjects, exact=True)
+    # X'(y - mean) = X'(y - shift) - X'1 (mean - shift)
+    cross_products -= np.outer(design.column_sums, mean - shift)
+    return mean, sum_of_squares, cross_products
+
+
+def _stage_memory_mapped(
+    data_path: str,
+    data_headers: List[str],
+    chunk_rows: int,
+    n_subjects: int,
+    staging_path: str,
+    progress: Optional[RegressionProgress] = None,
+) -> np.memmap:
+    """Copy the data file into a column-major float64 memory map, chunk by chunk."""
+    data = np.memmap(staging_path, dtype=np.float64, mode='w+', shape=(n_subjects, len(data_headers)), order='F')
+    count = 0
+    for chunk in read_typed_csv(data_path, data_headers, default_type="float64", chunksize=chunk_rows):
+        if progress is not None:
+            progress.check()
+        _check_row_count(count + len(chunk), n_subjects)
+        data[count:count + len(chunk)] = chunk[data_headers].to_numpy(dtype=np.float64)
+        count += len(chunk)
+    _check_row_count(count, n_subjects, exact=True)
+    data.flush()
+    return data
+
+
+def _check_row_count(rows: int, n_subjects: int, exact: bool = False) -> None:
+    """Raise if the data file has more (or, once fully read, a different number of) rows than covariates.csv."""
+    if rows > n_subjects or (exact and rows != n_subjects):
+        raise ValueError(f"The data file has {'more' if rows > n_subjects else 'fewer'} rows than covariates.csv ({n_subjects}).")
+
+
+def ols_slope_t_statistics(
+    design: RegressionDesign,
+    sum_of_squares: np.ndarray,
+    cross_products: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    OLS sum of squared errors and slope t-statistics of a block of dependents.
+
+    `cross_products` may carry leading batch dimensions (e.g. permutations), as
+    long as the covariates stay the second to last axis. Collinear covariates get
+    the minimum-norm slopes. A covariate that is constant at this site has no
+    standard error, so its t-statistic is NaN.
+    """
+    rotated = design.components.T @ cross_products
+    slopes = design.components @ (rotated / design.eigenvalues[:, None])
+    sse = sum_of_squares - np.sum(rotated ** 2 / design.eigenvalues[:, None], axis=-2)
+    sigma_squared = residual_variance(design, sse)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_stats = slopes / np.sqrt(design.ols_variances[:, None] * sigma_squared[..., None, :])
+    return sse, t_stats
+
+
+def residual_variance(design: RegressionDesign, sse: np.ndarray) -> np.ndarray:
+    """OLS residual variance; undefined (NaN) when the design leaves no residual degrees of freedom."""
+    if design.degrees_of_freedom <= 0:
+        return np.full_like(sse, np.nan)
+    return sse / design.degrees_of_freedom
+
+
+def _statistics_from_moments(
+    design: RegressionDesign,
+    names: List[str],
+    mean: np.ndarray,
+    sum_of_squares: np.ndarray,
+    cross_products: np.ndarray,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Compute the reported statistics of a block of dependents from their moments.
+
+    Coefficients are the ridge coefficients (the intercept is fitted unpenalized
+    and reported as 0, as sklearn does for the constant column). t-statistics,
+    p-values and R-squared come from the OLS fit, and the sum of squared errors
+    from the ridge fit.
+    """
+    # OLS fit; the intercept equals the mean because the covariates are centered
+    ols_sse, slope_t_stats = ols_slope_t_statistics(design, sum_of_squares, cross_products)
+    sigma_squared = residual_variance(design, ols_sse)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intercept_t_stats = mean / np.sqrt(sigma_squared / design.n_subjects)
+        r_squared = 1 - ols_sse / sum_of_squares
+    t_stats = np.vstack([intercept_t_stats, slope_t_stats])
+    p_values = 2 * stats.t.sf(np.abs(t_stats), design.degrees_of_freedom)
+
+    # Ridge fit, in the eigenbasis: c = V'X'y / (l + alpha), SSE = y'y - 2 c'V'X'y + c' diag(l) c
+    rotated = design.components.T @ cross_products
+    rotated_slopes = rotated / (design.eigenvalues + design.alpha)[:, None]
+    ridge_slopes = design.components @ rotated_slopes
+    ridge_sse = (sum_of_squares
+                 - 2 * np.einsum('ij,ij->j', rotated, rotated_slopes)
+                 + np.einsum('ij,ij->j', rotated_slopes, design.eigenvalues[:, None] * rotated_slopes))
+    coefficients = np.vstack([np.zeros(len(names)), ridge_slopes])
+
+    results = {}
+    for j, dependent_var in enumerate(names):
         results[dependent_var] = {
-            "Variables": covariate_labels,
-            "Coefficients": coefficients.tolist(),
-            "t-Statistics": t_stats.tolist(),
-            "P-Values": p_values.tolist(),
-            "R-Squared": r_squared,
-            "Degrees of Freedom": degrees_of_freedom,
-            "Sum of Squared Errors": sse
+            "Variables": design.labels,
+            "Coefficients": coefficients[:, j].tolist(),
+            "t-Statistics": t_stats[:, j].tolist(),
+            "P-Values": p_values[:, j].tolist(),
+            "R-Squared": float(r_squared[j]),
+            "Degrees of Freedom": design.degrees_of_freedom,
+            "Sum of Squared Errors": float(ridge_sse[j])
         }
-
     return results
@@ -0,0 +1,159 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from .perform_ridge_regression import RegressionDesign, ols_slope_t_statistics
+from .progress import RegressionProgress
+
+
+class PermutationTest:
+    """
+    Permutation test of the OLS slope t-statistics with max-statistic FWER correction.
+
+    Permuting the subjects of y is equivalent to permuting the rows of the
+    standardized covariates, which leaves X'X unchanged, so one factorization
+    serves every permutation. Permutations are drawn in blocks of index
+    matrices; for each block the permuted X'y of all dependents in a block is a
+    single batched product, so memory is bounded by the block sizes and not by
+    the number of permutations. Blocks are evaluated in parallel threads.
+
+    Permutations are reproducible from the seed and block size, so every block
+    of dependents (and every data shard) is tested against the same
+    permutations, and the maximum |t| over all dependents can be accumulated
+    block by block for the FWER p-values. The intercept is not tested and gets
+    NaN p-values.
+    """
+
+    def __init__(self, n_permutations: int, block_size: int = 100, seed: int = 0, max_workers: Optional[int] = None):
+        """
+        :param n_permutations: Number of permutations.
+        :param block_size: Number of permutations evaluated per batched product.
+        :param seed: Seed of the permutations.
+        :param max_workers: Number of permutation blocks evaluated concurrently. Defaults to the CPU count.
+        """
+        self.n_permutations = n_permutations
+        self.block_size = block_size
+        self.seed = seed
+        self.max_workers = max_workers or os.cpu_count()
+        self._lock = threading.Lock()
+        self._observed: Dict[str, np.ndarray] = {}
+        self._exceedances: Dict[str, np.ndarray] = {}
+        self._max_statistics: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_parameters(cls, computation_parameters: Dict[str, Any], max_workers: Optional[int] = None) -> Optional["PermutationTest"]:
+        """
+        Create the test from the optional "PermutationTest" entry of parameters.json, e.g.
+        {"Permutations": 5000, "BlockSize": 100, "Seed": 0}. Returns None when it is absent.
+        """
+        settings = computation_parameters.get("PermutationTest")
+        if not settings:
+            return None
+        return cls(
+            n_permutations=int(settings["Permutations"]),
+            block_size=int(settings.get("BlockSize", 100)),
+            seed=int(settings.get("Seed", 0)),
+            max_workers=max_workers,
+        )
+
+    def update(
+        self,
+        design: RegressionDesign,
+        names: List[str],
+        centered: np.ndarray,
+        progress: Optional[RegressionProgress] = None,
+    ) -> None:
+        """
+        Evaluate all permutations for a block of dependents.
+
+        :param design: The standardized covariates of the site.
+        :param names: Names of the dependents in the block.
+        :param centered: Mean-centered values of the dependents, subjects x dependents.
+        :param progress: Optional progress of the regression, checked for an abort before every
+                         permutation block, so the blocks that did not start yet are skipped.
+        """
+        sum_of_squares = np.einsum('ij,ij->j', centered, centered)
+        _, observed = ols_slope_t_statistics(design, sum_of_squares, design.covariates.T @ centered)
+        observed = np.abs(observed)
+
+        exceedances = np.zeros(observed.shape, dtype=np.int64)
+        max_statistics = np.empty((self.n_permutations, observed.shape[0]))
+        starts = range(0, self.n_permutations, self.block_size)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            blocks = pool.map(
+                lambda start: self._evaluate_block(design, centered, sum_of_squares, observed, start, progress),
+                starts)
+            for start, (block_exceedances, block_max) in zip(starts, blocks):
+                exceedances += block_exceedances
+                max_statistics[start:start + len(block_max)] = block_max
+        with self._lock:
+            for j, name in enumerate(names):
+                self._observed[name] = observed[:, j]
+                self._exceedances[name] = exceedances[:, j]
+            if self._max_statistics is None:
+                self._max_statistics = max_statistics
+            else:
+                self._max_statistics = np.fmax(self._max_statistics, max_statistics)
+
+    def merge(self, other: "PermutationTest") -> None:
+        """Merge the state of a test with the same permutations that was updated with other dependents."""
+        with self._lock:
+            self._observed.update(other._observed)
+            self._exceedances.update(other._exceedances)
+            if self._max_statistics is None:
+                self._max_statistics = other._max_statistics
+            elif other._max_statistics is not None:
+                self._max_statistics = np.fmax(self._max_statistics, other._max_statistics)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Tests are sent to and from worker processes; the lock is not picklable
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def apply(self, results: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Add "Permutation P-Values" (uncorrected) and "FWER P-Values" (max-statistic
+        corrected over all dependents) to the results.
+        """
+        denominator = self.n_permutations + 1
+        for name, stats in results.items():
+            observed = self._observed[name]
+            uncorrected = (self._exceedances[name] + 1) / denominator
+            corrected = ((self._max_statistics >= observed).sum(axis=0) + 1) / denominator
+            undefined = np.isnan(observed)
+            uncorrected[undefined] = np.nan
+            corrected[undefined] = np.nan
+            stats["Permutation P-Values"] = [float('nan')] + uncorrected.tolist()
+            stats["FWER P-Values"] = [float('nan')] + corrected.tolist()
+
+    def _evaluate_block(
+        self,
+        design: RegressionDesign,
+        centered: np.ndarray,
+        sum_of_squares: np.ndarray,
+        observed: np.ndarray,
+        start: int,
+        progress: Optional[RegressionProgress] = None,
+    ) -> tuple:
+        """Count permuted |t| >= observed |t| and take the max |t| over dependents for one permutation block."""
+        if progress is not None:
+            progress.check()
+        size = min(self.block_size, self.n_permutations - start)
+        rng = np.random.default_rng([self.seed, start])
+        indices = rng.permuted(np.tile(np.arange(design.n_subjects), (size, 1)), axis=1)
+
+        # Permuted X'y for every permutation and dependent: permutations x covariates x dependents
+        cross_products = np.matmul(design.covariates[indices].transpose(0, 2, 1), centered)
+        _, t_stats = ols_slope_t_statistics(design, sum_of_squares, cross_products)
+        t_stats = np.abs(t_stats)
+
+        exceedances = (t_stats >= observed[None]).sum(axis=0)
+        with np.errstate(invalid='ignore'):
+            block_max = np.fmax.reduce(t_stats, axis=2)
+        return exceedances, block_max
@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+# Seconds between progress reports of a regression
+DEFAULT_REPORT_INTERVAL = 10.0
+
+
+class RegressionAborted(Exception):
+    """Raised by the regression engine when the task was aborted between two blocks."""
+
+
+class RegressionProgress:
+    """
+    Progress of a site regression, advanced by the engine after every block of dependents.
+
+    Every advance (and every check, e.g. between the row chunks of a streamed file) raises
+    RegressionAborted once the task is cancelled, so an aborted task stops after the block
+    in flight instead of after the whole site. Progress, with the estimated time remaining,
+    is reported at most once per report interval and when the last block is done.
+    Shards regressed in parallel threads share one progress. The engine also records the
+    data file rows it processed, for the metrics of the executor.
+    """
+
+    def __init__(
+        self,
+        total_dependents: int,
+        is_cancelled: Callable[[], bool] = lambda: False,
+        report: Callable[[str], None] = logging.info,
+        report_interval: float = DEFAULT_REPORT_INTERVAL,
+    ):
+        """
+        :param total_dependents: Number of dependents of the regression.
+        :param is_cancelled: Returns whether the task was aborted.
+        :param report: Receives the progress messages.
+        :param report_interval: Minimum number of seconds between two progress messages.
+        """
+        self.total_dependents = total_dependents
+        self.done_dependents = 0
+        self.processed_rows = 0
+        self._is_cancelled = is_cancelled
+        self._report = report
+        self._report_interval = report_interval
+        self._start = time.monotonic()
+        self._last_report = self._start
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        """Raise RegressionAborted if the task was aborted."""
+        if self._is_cancelled():
+            raise RegressionAborted(
+                f"Regression aborted after {self.done_dependents}/{self.total_dependents} dependents")
+
+    def advance(self, n_dependents: int) -> None:
+        """Record a finished block of dependents, report progress if due, and check for an abort."""
+        with self._lock:
+            self.done_dependents += n_dependents
+            now = time.monotonic()
+            due = now - self._last_report >= self._report_interval or self.done_dependents >= self.total_dependents
+            if due:
+                self._last_report = now
+                message = self.describe(now)
+        if due:
+            self._report(message)
+        self.check()
+
+    def record_rows(self, n_rows: int) -> None:
+        """Record the rows of a data file whose dependents were regressed."""
+        with self._lock:
+            self.processed_rows += n_rows
+
+    def describe(self, now: Optional[float] = None) -> str:
+        """Progress message: dependents done, elapsed time and estimated time remaining."""
+        elapsed = (now or time.monotonic()) - self._start
+        done, total = self.done_dependents, max(self.total_dependents, 1)
+        message = f"Regressed {done}/{self.total_dependents} dependents ({100 * done / total:.0f}%) in {elapsed:.1f} s"
+        if 0 < done < self.total_dependents:
+            message += f", ETA {elapsed * (self.total_dependents - done) / done:.0f} s"
+        return message
+
+
+class WorkerProgress(RegressionProgress):
+    """
+    Progress of the share of a worker process. Finished blocks and processed rows are sent
+    to the parent process through a queue, and the parent cancels the workers through an event.
+    """
+
+    def __init__(self, blocks: Any, cancelled: Any):
+        """
+        :param blocks: Queue (of a multiprocessing manager) receiving (dependents, rows) of every
+                       finished block and data file.
+        :param cancelled: Event (of a multiprocessing manager) set when the task was aborted.
+        """
+        super().__init__(0, is_cancelled=cancelled.is_set)
+        self._blocks = blocks
+
+    def advance(self, n_dependents: int) -> None:
+        self._blocks.put((n_dependents, 0))
+        self.check()
+
+    def record_rows(self, n_rows: int) -> None:
+        self._blocks.put((0, n_rows))
+
+
+def drain_worker_progress(blocks: Any, progress: RegressionProgress) -> None:
+    """Advance the progress of the parent process by the blocks the workers finished so far."""
+    while True:
+        try:
+            n_dependents, n_rows = blocks.get_nowait()
+        except queue.Empty:
+            return
+        progress.record_rows(n_rows)
+        if n_dependents:
+            progress.advance(n_dependents)
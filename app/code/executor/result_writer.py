@@ -0,0 +1,66 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, List
+
+
+class ResultWriteError(IOError):
+    """Raised by flush() when one or more background writes failed."""
+
+
+class BackgroundResultWriter:
+    """
+    Writes result files on a background thread so tasks can return their
+    Shareable without waiting on local disk I/O.
+
+    Writes are queued in submission order on a bounded queue; submit() blocks
+    once `max_pending` writes are waiting, so a slow disk applies back-pressure
+    instead of growing memory. Failures are logged as they happen and raised
+    together from the next flush().
+    """
+
+    def __init__(self, max_pending: int = 4):
+        """
+        :param max_pending: Maximum number of queued writes before submit() blocks; at least 1.
+        """
+        if max_pending < 1:
+            raise ValueError(f"max_pending must be at least 1, but got {max_pending}")
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._errors: List[str] = []
+        self._errors_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="SrrResultWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, description: str, write_fn: Callable[..., None], *args: Any) -> None:
+        """
+        Queue a write.
+
+        :param description: Human readable name of the write, used in error messages.
+        :param write_fn: Callable performing the write.
+        :param args: Arguments passed to `write_fn`.
+        """
+        self._queue.put((description, write_fn, args))
+
+    def flush(self) -> None:
+        """
+        Block until every queued write has finished.
+
+        :raises ResultWriteError: If any write failed since the previous flush.
+        """
+        self._queue.join()
+        with self._errors_lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise ResultWriteError("Failed to write results: " + "; ".join(errors))
+
+    def _run(self) -> None:
+        while True:
+            description, write_fn, args = self._queue.get()
+            try:
+                write_fn(*args)
+            except Exception as e:
+                logging.error(f"Background write of {description} failed: {e}")
+                with self._errors_lock:
+                    self._errors.append(f"{description}: {e}")
+            finally:
+                self._queue.task_done()
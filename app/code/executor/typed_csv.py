@@ -0,0 +1,89 @@
+import importlib.util
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Column types a schema in parameters.json may declare
+NUMERIC_TYPES = {"float64", "float32", "int64", "int32"}
+SCHEMA_TYPES = NUMERIC_TYPES | {"bool", "category", "string"}
+# Spellings of booleans accepted for bool columns (compared case-insensitively)
+TRUE_VALUES = ["true", "t", "yes", "y", "1", "1.0"]
+FALSE_VALUES = ["false", "f", "no", "n", "0", "0.0"]
+
+# pyarrow parses CSV files multi-threaded; it is used when it is installed
+PARSER_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") is not None else "c"
+
+
+def read_typed_csv(
+    path: str,
+    columns: List[str],
+    schema: Optional[Dict[str, str]] = None,
+    default_type: Optional[str] = None,
+    nrows: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Read only the given columns of a CSV file, with the column types of a schema.
+
+    Numeric and string columns are parsed with their declared type, so the parser does
+    not infer types by scanning; bool and category columns are read as strings and
+    coerced in vectorized form. Columns without a declared type get `default_type`, or
+    are inferred when it is None. Whole files are parsed with the fastest available
+    engine (pyarrow when installed); row limits and chunks use the C engine.
+
+    :param path: Path of the CSV file.
+    :param columns: Columns to read, in the order of the returned frame.
+    :param schema: Declared type of each column, one of SCHEMA_TYPES.
+    :param default_type: Type of the columns the schema does not declare.
+    :param nrows: Number of rows to read.
+    :param chunksize: Read the file in chunks of this many rows and return an iterator.
+    :return: The columns, or an iterator over row chunks of them.
+    """
+    types = {column: (schema or {}).get(column, default_type) for column in columns}
+    parse_types = {
+        column: (column_type if column_type in NUMERIC_TYPES else "string")
+        for column, column_type in types.items() if column_type is not None
+    }
+    engine = PARSER_ENGINE if nrows is None and chunksize is None else "c"
+    frames = pd.read_csv(path, usecols=columns, dtype=parse_types, engine=engine, nrows=nrows, chunksize=chunksize)
+    if chunksize is not None:
+        return (_coerce(frame[columns], types, path) for frame in frames)
+    return _coerce(frames[columns], types, path)
+
+
+def validate_schema(schema: Dict[str, Any], covariates: List[str], dependents: List[str], has_formula: bool) -> Optional[str]:
+    """Return why a schema from parameters.json is invalid, or None when it is valid."""
+    if not isinstance(schema, dict):
+        return "The schema must map column names to types."
+    for column, column_type in schema.items():
+        if column_type not in SCHEMA_TYPES:
+            return f"Column {column} has the unknown type {column_type!r}; expected one of {sorted(SCHEMA_TYPES)}."
+        if column in dependents and column_type not in NUMERIC_TYPES:
+            return f"Dependent {column} must have a numeric type, not {column_type!r}."
+        if column_type in ("category", "string") and column in covariates and not has_formula:
+            return f"Covariate {column} of type {column_type!r} can only be used through a model formula."
+    return None
+
+
+def _coerce(frame: pd.DataFrame, types: Dict[str, Optional[str]], path: str) -> pd.DataFrame:
+    """Convert the bool and category columns, which were parsed as strings."""
+    for column, column_type in types.items():
+        if column_type == "bool":
+            frame[column] = _to_bool(frame[column], column, path)
+        elif column_type == "category":
+            frame[column] = frame[column].astype("category")
+        elif column_type == "string":
+            frame[column] = frame[column].astype(object)
+    return frame
+
+
+def _to_bool(values: pd.Series, column: str, path: str) -> pd.Series:
+    lowered = values.str.strip().str.lower()
+    is_true = lowered.isin(TRUE_VALUES).to_numpy()
+    is_false = lowered.isin(FALSE_VALUES).to_numpy()
+    invalid = ~(is_true | is_false)
+    if invalid.any():
+        raise ValueError(
+            f"Column {column} of {path} is declared bool but holds {values[invalid].iloc[0]!r}.")
+    return pd.Series(is_true, index=values.index, dtype=np.bool_)
@@ -1,12 +1,25 @@
 import logging
 import pandas as pd
-from typing import Dict, Any
+import patsy
+from typing import Dict, Any, List
+from utils.significance_filter import significance_filter_settings, filter_p_value_keys
+from .typed_csv import read_typed_csv, validate_schema
 
-def validate_run_input(covariates_path: str, data_path: str, computation_parameters: Dict[str, Any], log_path: str) -> bool:
+# Covariate rows the model formula is checked against
+_FORMULA_SAMPLE_ROWS = 100
+
+def validate_run_input(covariates_path: str, data_paths: List[str], computation_parameters: Dict[str, Any], log_path: str) -> bool:
     try:
-        # Load the data
-        covariates = pd.read_csv(covariates_path)
-        data = pd.read_csv(data_path)
+        if not data_paths:
+            _log_validation_error("No data files were found in the data directory.", log_path)
+            return False
+
+        # Load only the headers; the data itself is loaded later within the memory budget.
+        # The dependents may be spread over several data files (shards).
+        covariates = pd.read_csv(covariates_path, nrows=0)
+        data_headers = set()
+        for data_path in data_paths:
+            data_headers.update(pd.read_csv(data_path, nrows=0).columns)
         
         # Extract expected headers from computation parameters
         expected_covariates = computation_parameters.get("Covariates", [])
@@ -19,8 +32,49 @@ def validate_run_input(covariates_path: str, data_path: str, computation_paramet
             _log_validation_error(error_message, log_path)
             return False
         
+        # Validate the declared column types
+        formula = computation_parameters.get("Formula")
+        schema = computation_parameters.get("Schema")
+        if schema is not None:
+            schema_error = validate_schema(schema, expected_covariates, expected_dependents, bool(formula))
+            if schema_error:
+                _log_validation_error(schema_error, log_path)
+                return False
+
+        # Validate the model formula on the first rows of the covariates
+        if formula:
+            sample = read_typed_csv(
+                covariates_path, expected_covariates or list(covariates.columns), schema, nrows=_FORMULA_SAMPLE_ROWS)
+            try:
+                patsy.dmatrix(formula, sample)
+            except patsy.PatsyError as e:
+                _log_validation_error(f"The model formula {formula!r} cannot be built from the covariates: {e}", log_path)
+                return False
+
+        # Validate the cross-validation of the ridge penalty
+        cross_validation = computation_parameters.get("CrossValidation")
+        if cross_validation:
+            alphas = cross_validation.get("Alphas") or []
+            if int(cross_validation.get("Folds", 5)) < 2:
+                _log_validation_error("CrossValidation needs at least 2 folds.", log_path)
+                return False
+            if not alphas or any(float(alpha) <= 0 for alpha in alphas):
+                _log_validation_error(f"CrossValidation needs a list of positive Alphas, but got {alphas}.", log_path)
+                return False
+
+        # Validate the p-values of the significance filter
+        significance_filter = significance_filter_settings(computation_parameters)
+        if significance_filter is not None:
+            p_value_keys = filter_p_value_keys(computation_parameters)
+            if significance_filter[1] not in p_value_keys:
+                _log_validation_error(
+                    f"SignificanceFilter PValues must be one of {p_value_keys}, but got {significance_filter[1]!r}.", log_path)
+                return False
+
         # Validate data headers
-        data_headers = set(data.columns)
+        if not expected_dependents:
+            _log_validation_error("No dependents were given in the computation parameters.", log_path)
+            return False
         if not set(expected_dependents).issubset(data_headers):
             error_message = f"Data headers do not contain all expected headers. Expected at least {expected_dependents}, but got {data_headers}."
             _log_validation_error(error_message, log_path)
@@ -35,11 +89,23 @@ def validate_run_input(covariates_path: str, data_path: str, computation_paramet
         return False
 
 
+def log_validation_info(message: str, log_path: str) -> None:
+    """
+    Log an informational message to the console and write it to validation_log.txt.
+    """
+    logging.info(message)
+    _write_to_log(message, log_path)
+
+
 def _log_validation_error(message: str, log_path: str) -> None:
     """
     Log the validation error message to the console and write it to validation_log.txt.
     """
     logging.error(message)
+    _write_to_log(message, log_path)
+
+
+def _write_to_log(message: str, log_path: str) -> None:
     try:
         with open(log_path, 'a') as f:
             f.write(f"{message}\n")
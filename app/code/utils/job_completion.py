@@ -0,0 +1,59 @@
+import json
+import logging
+import os
+import socket
+
+# Statuses reported by the workflow when control_flow returns
+JOB_STATUS_FINISHED = "FINISHED"
+JOB_STATUS_ABORTED = "ABORTED"
+JOB_STATUS_FAILED = "FAILED"
+
+_MAX_MESSAGE_BYTES = 4096
+
+
+def notify_job_completion(socket_path: str, job_id: str, status: str) -> bool:
+    """
+    Tell the process listening on `socket_path` that the workflow of a job has finished.
+
+    The notification is a single JSON datagram. A missing listener is not an error:
+    the entry point then learns about completion from its status poll.
+
+    :param socket_path: Path of the Unix datagram socket of the listener.
+    :param job_id: ID of the job that finished.
+    :param status: One of the JOB_STATUS_* values.
+    :return: Whether the notification was delivered.
+    """
+    message = json.dumps({"job_id": job_id, "status": status}).encode()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(message, socket_path)
+    except OSError as e:
+        logging.warning(f"Could not notify job completion on {socket_path}: {e}")
+        return False
+    logging.info(f"Notified completion of job {job_id} ({status}) on {socket_path}")
+    return True
+
+
+def open_job_completion_listener(socket_path: str) -> socket.socket:
+    """Bind the Unix datagram socket that completion notifications are sent to, replacing a stale one."""
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    listener.bind(socket_path)
+    return listener
+
+
+def wait_for_job_completion(listener: socket.socket, job_id: str) -> str:
+    """
+    Block until the completion of `job_id` is notified on `listener` and return its status.
+    Notifications of other jobs and malformed messages are ignored.
+    """
+    while True:
+        data = listener.recv(_MAX_MESSAGE_BYTES)
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logging.warning(f"Ignoring malformed job completion message: {data!r}")
+            continue
+        if message.get("job_id") == job_id:
+            return message.get("status", JOB_STATUS_FINISHED)
@@ -0,0 +1,223 @@
+import bisect
+import logging
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# Buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+# Buckets of payload size histograms, in bytes
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KiB .. 1 GiB
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Keys of the task messages that carry the payload of the computation
+PAYLOAD_KEYS = ("result", "compact_result", "bootstrap", "fingerprint")
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    """Base of the metric families: a name, a help text and label names."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format_labels(self, values: LabelValues, extra: Sequence[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.label_names, values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, per combination of label values."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._format_labels(key)} {value:g}" for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observations, per combination of label values."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the enclosed block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {total:g}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process, rendered in the Prometheus text exposition format.
+
+    Metrics can be exported as a node-exporter textfile (write_textfile) and served
+    from a local HTTP endpoint (start_http_server). No Prometheus client library is
+    needed.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """Return the counter with this name, creating it on first use."""
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """Return the histogram with this name, creating it on first use."""
+        return self._get_or_create(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Atomically write the metrics to a node-exporter textfile (*.prom)."""
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as f:
+            f.write(self.render())
+        os.replace(temporary_path, path)
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> None:
+        """Serve the metrics at http://host:port/metrics from a daemon thread; only the first call starts it."""
+        with self._lock:
+            if self._server is not None:
+                return
+            registry = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = registry.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", CONTENT_TYPE)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass  # Scrapes are not worth a log line each
+
+            self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=self._server.serve_forever, name="SrrMetricsServer", daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def _get_or_create(self, metric_class, name, documentation, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, documentation, label_names, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class) or metric.label_names != tuple(label_names):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+
+# The metrics of this process
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Return the process-level metrics registry."""
+    return _registry
+
+
+def payload_bytes(message: Optional[Mapping[str, Any]], keys: Sequence[str] = PAYLOAD_KEYS) -> int:
+    """
+    Serialized size of the payload of a task message; headers and other keys are not counted.
+
+    The payload is pickled into a writer that only counts bytes, and the buffers of numpy
+    arrays are passed out-of-band and counted by their size, so no serialized copy of the
+    payload is held in memory.
+    """
+    if message is None:
+        return 0
+    counter = _ByteCounter()
+    for key in keys:
+        if message.get(key) is not None:
+            pickle.dump(message[key], counter, protocol=5, buffer_callback=counter.add_buffer)
+    return counter.n_bytes
+
+
+class _ByteCounter:
+    """File-like sink that counts the bytes written to it."""
+
+    def __init__(self):
+        self.n_bytes = 0
+
+    def write(self, data: Any) -> int:
+        size = memoryview(data).nbytes
+        self.n_bytes += size
+        return size
+
+    def add_buffer(self, buffer: pickle.PickleBuffer) -> None:
+        # Returning None keeps the buffer out-of-band, so it is not copied into the stream
+        self.n_bytes += buffer.raw().nbytes
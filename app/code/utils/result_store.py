@@ -0,0 +1,230 @@
+import argparse
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+# Default file name of the result store inside an output directory
+RESULT_STORE_FILENAME = "regression_results.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS regression_models (
+    job_id TEXT NOT NULL,
+    dependent TEXT NOT NULL,
+    r_squared REAL,
+    degrees_of_freedom REAL,
+    sum_of_squared_errors REAL,
+    PRIMARY KEY (job_id, dependent)
+);
+CREATE TABLE IF NOT EXISTS regression_statistics (
+    job_id TEXT NOT NULL,
+    dependent TEXT NOT NULL,
+    variable TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    coefficient REAL,
+    t_statistic REAL,
+    p_value REAL,
+    PRIMARY KEY (job_id, dependent, variable)
+);
+CREATE INDEX IF NOT EXISTS idx_statistics_p_value
+    ON regression_statistics (job_id, p_value);
+CREATE INDEX IF NOT EXISTS idx_statistics_effect_size
+    ON regression_statistics (job_id, abs(coefficient));
+"""
+
+
+def _connect(store_path: str, read_only: bool = False) -> sqlite3.Connection:
+    """
+    Open the store. Writers create the schema on first use; readers open an existing
+    store read-only, so a mistyped path raises instead of creating an empty store.
+    """
+    if read_only:
+        if not os.path.isfile(store_path):
+            raise FileNotFoundError(f"Result store {store_path} does not exist")
+        connection = sqlite3.connect(f"{pathlib.Path(store_path).absolute().as_uri()}?mode=ro", uri=True)
+    else:
+        connection = sqlite3.connect(store_path)
+        connection.executescript(_SCHEMA)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def save_results_to_store(results: Dict[str, Dict[str, Any]], store_path: str, job_id: str) -> None:
+    """
+    Write regression results into the SQLite result store.
+
+    Rows are keyed by job ID, dependent and variable, so writing the same job
+    twice replaces the earlier rows instead of duplicating them.
+
+    :param results: Regression results keyed by dependent variable.
+    :param store_path: Path of the SQLite database file.
+    :param job_id: ID of the job the results belong to.
+    """
+    model_rows = []
+    statistic_rows = []
+    for dependent, stats in results.items():
+        model_rows.append((
+            job_id,
+            dependent,
+            stats["R-Squared"],
+            stats["Degrees of Freedom"],
+            stats["Sum of Squared Errors"],
+        ))
+        for position, variable in enumerate(stats["Variables"]):
+            statistic_rows.append((
+                job_id,
+                dependent,
+                variable,
+                position,
+                stats["Coefficients"][position],
+                stats["t-Statistics"][position],
+                stats["P-Values"][position],
+            ))
+
+    with closing(_connect(store_path)) as connection, connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO regression_models VALUES (?, ?, ?, ?, ?)", model_rows)
+        connection.executemany(
+            "INSERT OR REPLACE INTO regression_statistics VALUES (?, ?, ?, ?, ?, ?, ?)", statistic_rows)
+    logging.info(f"Saved {len(model_rows)} dependents for job {job_id} to result store {store_path}")
+
+
+def query_dependent(store_path: str, dependent: str, job_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Look up the full result of one dependent, in the same layout as the JSON results.
+
+    :param store_path: Path of the SQLite database file.
+    :param dependent: Name of the dependent variable.
+    :param job_id: Restrict the lookup to one job. All stored jobs are returned when omitted.
+    :return: Results keyed by job ID.
+    """
+    job_filter, job_args = _job_filter(job_id, "m.")
+    with closing(_connect(store_path, read_only=True)) as connection:
+        rows = connection.execute(
+            "SELECT m.job_id, m.r_squared, m.degrees_of_freedom, m.sum_of_squared_errors, "
+            "s.variable, s.coefficient, s.t_statistic, s.p_value "
+            "FROM regression_models m JOIN regression_statistics s "
+            "ON s.job_id = m.job_id AND s.dependent = m.dependent "
+            f"WHERE m.dependent = ?{job_filter} ORDER BY m.job_id, s.position",
+            (dependent, *job_args),
+        ).fetchall()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        entry = results.setdefault(row["job_id"], {
+            "Variables": [],
+            "Coefficients": [],
+            "t-Statistics": [],
+            "P-Values": [],
+            "R-Squared": row["r_squared"],
+            "Degrees of Freedom": row["degrees_of_freedom"],
+            "Sum of Squared Errors": row["sum_of_squared_errors"],
+        })
+        entry["Variables"].append(row["variable"])
+        entry["Coefficients"].append(row["coefficient"])
+        entry["t-Statistics"].append(row["t_statistic"])
+        entry["P-Values"].append(row["p_value"])
+    return results
+
+
+def query_p_value_threshold(
+    store_path: str,
+    threshold: float,
+    job_id: Optional[str] = None,
+    variable: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Find all statistics whose p-value is at or below a threshold.
+
+    :param store_path: Path of the SQLite database file.
+    :param threshold: Maximum p-value to return.
+    :param job_id: Restrict the lookup to one job.
+    :param variable: Restrict the lookup to one variable (e.g. a covariate name).
+    :return: Matching rows, smallest p-value first.
+    """
+    job_filter, job_args = _job_filter(job_id)
+    variable_filter, variable_args = _variable_filter(variable)
+    with closing(_connect(store_path, read_only=True)) as connection:
+        rows = connection.execute(
+            "SELECT job_id, dependent, variable, coefficient, t_statistic, p_value "
+            f"FROM regression_statistics WHERE p_value <= ?{job_filter}{variable_filter} "
+            "ORDER BY p_value",
+            (threshold, *job_args, *variable_args),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def query_top_k_effect_size(
+    store_path: str,
+    k: int,
+    job_id: Optional[str] = None,
+    variable: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Find the k statistics with the largest absolute coefficient.
+
+    Covariates are standardized before fitting, so the coefficient magnitude is
+    directly comparable across covariates. The intercept is never returned.
+
+    :param store_path: Path of the SQLite database file.
+    :param k: Number of rows to return.
+    :param job_id: Restrict the lookup to one job.
+    :param variable: Restrict the lookup to one variable (e.g. a covariate name).
+    :return: Matching rows, largest effect first.
+    """
+    job_filter, job_args = _job_filter(job_id)
+    variable_filter, variable_args = _variable_filter(variable)
+    with closing(_connect(store_path, read_only=True)) as connection:
+        rows = connection.execute(
+            "SELECT job_id, dependent, variable, coefficient, t_statistic, p_value "
+            f"FROM regression_statistics WHERE variable != 'Intercept'{job_filter}{variable_filter} "
+            "ORDER BY abs(coefficient) DESC LIMIT ?",
+            (*job_args, *variable_args, k),
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _job_filter(job_id: Optional[str], prefix: str = "") -> tuple:
+    if job_id is None:
+        return "", ()
+    return f" AND {prefix}job_id = ?", (job_id,)
+
+
+def _variable_filter(variable: Optional[str]) -> tuple:
+    if variable is None:
+        return "", ()
+    return " AND variable = ?", (variable,)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query a regression result store")
+    parser.add_argument("store_path", help="Path to the SQLite result store")
+    parser.add_argument("--job-id", default=None, help="Only return results of this job")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    dependent_parser = subparsers.add_parser("dependent", help="Full result of one dependent")
+    dependent_parser.add_argument("dependent")
+
+    p_value_parser = subparsers.add_parser("p-value", help="Statistics at or below a p-value threshold")
+    p_value_parser.add_argument("threshold", type=float)
+    p_value_parser.add_argument("--variable", default=None)
+
+    top_k_parser = subparsers.add_parser("top-k", help="Largest absolute effect sizes")
+    top_k_parser.add_argument("k", type=int)
+    top_k_parser.add_argument("--variable", default=None)
+
+    args = parser.parse_args()
+    if args.command == "dependent":
+        output = query_dependent(args.store_path, args.dependent, args.job_id)
+    elif args.command == "p-value":
+        output = query_p_value_threshold(args.store_path, args.threshold, args.job_id, args.variable)
+    else:
+        output = query_top_k_effect_size(args.store_path, args.k, args.job_id, args.variable)
+    print(json.dumps(output, indent=4))
+
+
+if __name__ == "__main__":
+    main()
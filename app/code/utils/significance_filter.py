@@ -0,0 +1,111 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# File name of the compact results next to the JSON and HTML reports
+COMPACT_RESULTS_FILENAME = "global_regression_result_compact.npz"
+# Statistics the filter is based on when parameters.json does not name one
+DEFAULT_FILTER_P_VALUES = "FDR P-Values"
+_DEPENDENTS_KEY = "Dependents"
+_VARIABLES_KEY = "Variables"
+
+
+def filter_p_value_keys(computation_parameters: Dict[str, Any]) -> List[str]:
+    """The p-values of the global results that the significance filter can be applied to."""
+    keys = ["P-Values", "FDR P-Values", "Bonferroni P-Values"]
+    if computation_parameters.get("PermutationTest"):
+        keys += ["Permutation P-Values", "FWER P-Values"]
+    return keys
+
+
+def significance_filter_settings(computation_parameters: Dict[str, Any]) -> Optional[Tuple[float, str]]:
+    """
+    Read the optional "SignificanceFilter" entry of parameters.json, e.g.
+    {"Alpha": 0.05, "PValues": "FDR P-Values"}, as (alpha, p-value key). Returns None when it is absent.
+    """
+    settings = computation_parameters.get("SignificanceFilter")
+    if not settings:
+        return None
+    return float(settings.get("Alpha", 0.05)), settings.get("PValues", DEFAULT_FILTER_P_VALUES)
+
+
+def split_by_significance(
+    results: Dict[str, Dict[str, Any]],
+    alpha: float,
+    p_value_key: str = DEFAULT_FILTER_P_VALUES,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, np.ndarray]]:
+    """
+    Split results into the dependents with a significant covariate, kept in full detail,
+    and the rest in compact form (see compact_results).
+
+    A dependent is significant when the p-value of any covariate (the intercept is not
+    considered) is below alpha.
+
+    :param results: Regression results keyed by dependent variable.
+    :param alpha: Significance threshold.
+    :param p_value_key: The p-values the threshold is applied to.
+    :return: The significant results and the compact remainder.
+    """
+    if not results:
+        return {}, compact_results({})
+    if p_value_key not in next(iter(results.values())):
+        raise ValueError(f"The significance filter needs {p_value_key}, which the results do not have")
+    p_values = np.array([stats[p_value_key][1:] for stats in results.values()], dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        significant = np.any(p_values < alpha, axis=1)
+
+    detailed, remainder = {}, {}
+    for (dependent_var, stats), is_significant in zip(results.items(), significant):
+        (detailed if is_significant else remainder)[dependent_var] = stats
+    logging.info(f"{len(detailed)} of {len(results)} dependents have {p_value_key} below {alpha}")
+    return detailed, compact_results(remainder)
+
+
+def compact_results(results: Dict[str, Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Columnar form of results: the dependent and variable names, a dependents x variables
+    float64 matrix per per-variable statistic and a vector per per-model statistic. Results
+    must share their variables and statistics, as the global results of one job do.
+    """
+    compact = {_DEPENDENTS_KEY: np.array(list(results), dtype=str)}
+    if not results:
+        return compact
+    first = next(iter(results.values()))
+    compact[_VARIABLES_KEY] = np.array(first[_VARIABLES_KEY], dtype=str)
+    for key, value in first.items():
+        if key != _VARIABLES_KEY:
+            compact[key] = np.array([stats[key] for stats in results.values()], dtype=np.float64)
+    return compact
+
+
+def concatenate_compact_results(blocks: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Join the compact results of consecutive dependent blocks."""
+    blocks = [block for block in blocks if len(block[_DEPENDENTS_KEY])]
+    if not blocks:
+        return compact_results({})
+    joined = {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0] if key != _VARIABLES_KEY}
+    joined[_VARIABLES_KEY] = blocks[0][_VARIABLES_KEY]
+    return joined
+
+
+def save_compact_results(compact: Dict[str, np.ndarray], path: str) -> None:
+    """Write compact results to a compressed .npz file."""
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, **compact)
+
+
+def load_compact_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read compact results back into the layout of the JSON results, keyed by dependent."""
+    with np.load(path) as compact:
+        dependents = compact[_DEPENDENTS_KEY].tolist()
+        if not dependents:
+            return {}
+        variables = compact[_VARIABLES_KEY].tolist()
+        statistics = {key: compact[key] for key in compact.files if key not in (_DEPENDENTS_KEY, _VARIABLES_KEY)}
+    results = {}
+    for i, dependent_var in enumerate(dependents):
+        results[dependent_var] = {_VARIABLES_KEY: variables}
+        for key, values in statistics.items():
+            results[dependent_var][key] = values[i].tolist() if values.ndim > 1 else float(values[i])
+    return results
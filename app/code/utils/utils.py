@@ -1,5 +1,6 @@
 import os
 import logging
+from typing import Optional
 from nvflare.apis.fl_constant import FLContextKey
 from nvflare.apis.fl_context import FLContext
 
@@ -76,3 +77,11 @@ def get_parameters_file_path(fl_ctx: FLContext) -> str:
         return simulator_and_poc_path
 
     raise FileNotFoundError("Parameters file path could not be determined.")
+
+def get_job_completion_socket_path() -> Optional[str]:
+    """Return the path of the Unix socket that is notified when the workflow finishes, if configured."""
+    env_path = os.getenv("JOB_COMPLETION_SOCKET_PATH")
+    if env_path:
+        logging.info(f"Job completion socket path from environment: {env_path}")
+        return env_path
+    return None
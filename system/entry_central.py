@@ -1,7 +1,10 @@
-import subprocess
 import os
+import sys
+import threading
 from nvflare.fuel.flare_api.flare_api import new_secure_session, Session
 from nvflare.apis.job_def import RunStatus, JobMetaKey
+from provision.code.run_process import run_logged_process
+from utils.job_completion import open_job_completion_listener, wait_for_job_completion
 
 # Path Constants
 STARTUP_SCRIPT_DIRECTORY = "/workspace/runKit/server/startup"
@@ -9,9 +12,25 @@ STARTUP_SCRIPT_PATH = "/workspace/runKit/server/startup/start.sh"
 ADMIN_DIRECTORY_PATH = "/workspace/runKit/admin"
 JOB_DIRECTORY_PATH = "/workspace/runKit/job/"
 ADMIN_USER_EMAIL = "admin@admin.com"
+DEFAULT_JOB_COMPLETION_SOCKET_PATH = "/tmp/nvflare_job_completion.sock"
+# The status poll is only a fallback for when the workflow cannot notify completion
+JOB_STATUS_POLL_INTERVAL = float(os.getenv("JOB_STATUS_POLL_INTERVAL", "60"))
+JOB_TIMEOUT = 3600
 
 def start_server():
-    subprocess.run(["/bin/bash", STARTUP_SCRIPT_PATH], cwd=STARTUP_SCRIPT_DIRECTORY)
+    # start.sh leaves the server running in the background; its output keeps being pumped
+    run_logged_process(
+        ["/bin/bash", STARTUP_SCRIPT_PATH],
+        cwd=STARTUP_SCRIPT_DIRECTORY,
+        stdout_handler=print,
+        stderr_handler=lambda line: print(line, file=sys.stderr),
+        drain_after_exit=False,
+    )
+
+# Listen for the completion notification of the workflow before the server (which inherits
+# the socket path from the environment) starts
+job_completion_socket_path = os.environ.setdefault("JOB_COMPLETION_SOCKET_PATH", DEFAULT_JOB_COMPLETION_SOCKET_PATH)
+job_completion_listener = open_job_completion_listener(job_completion_socket_path)
 
 # Start the server
 start_server()
@@ -25,17 +44,36 @@ session = new_secure_session(
 job_id = session.submit_job(JOB_DIRECTORY_PATH)
 
 
+job_finished = threading.Event()
+
+
 def job_status_callback(session: Session, job_id: str, job_meta, *cb_args, **cb_kwargs) -> bool:
     job_status = job_meta[JobMetaKey.STATUS]
     print(f"Job status: {job_status}")
 
     if 'FINISHED' in job_status:
-        print(f"Job {job_id} finished, shutting down system")
-        session.shutdown("all")
-        return False
-    else:
-        return True
+        job_finished.set()
+    return not job_finished.is_set()
+
+
+def listen_for_completion():
+    status = wait_for_job_completion(job_completion_listener, job_id)
+    print(f"Workflow of job {job_id} reported {status}")
+    job_finished.set()
+
+
+def poll_for_completion():
+    session.monitor_job(job_id, timeout=JOB_TIMEOUT, poll_interval=JOB_STATUS_POLL_INTERVAL, cb=job_status_callback)
+    # monitor_job also returns on timeout; shut down then as well
+    job_finished.set()
+
 
+# Shut down as soon as the workflow reports completion; the status poll is kept as a fallback
+threading.Thread(target=listen_for_completion, daemon=True).start()
+threading.Thread(target=poll_for_completion, daemon=True).start()
+job_finished.wait()
 
-# Monitor the job with the callback
-session.monitor_job(job_id, timeout=3600, poll_interval=10, cb=job_status_callback)
+print(f"Job {job_id} finished, shutting down system")
+session.shutdown("all")
+job_completion_listener.close()
+os.remove(job_completion_socket_path)
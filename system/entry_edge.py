@@ -1,28 +1,15 @@
-import subprocess
-import time
-import psutil
 import sys
+from provision.code.process_supervisor import supervise_process_tree
 
 
 print("Starting the shell script...")
-subprocess.Popen(["/bin/bash", "/workspace/runKit/startup/start.sh"])
-
-
-time.sleep(10)
-
-print("Polling for nvflare process and printing process details for debugging...")
-while True:
-    process_found = False
-    for proc in psutil.process_iter(attrs=['cmdline']):
-        cmdline = ' '.join(proc.info['cmdline']
-                           ) if proc.info['cmdline'] else ''
-        if 'nvflare' in cmdline:
-            process_found = True
-            print("nvflare process is running...")
-            break
-
-    if process_found:
-        time.sleep(10)
-    else:
-        print("nvflare process is not running anymore or not found. Exiting.")
-        sys.exit(0)
+# Blocks until the client started by start.sh, and everything else it spawned, has exited
+exit_status = supervise_process_tree(
+    ["/bin/bash", "/workspace/runKit/startup/start.sh"],
+    stdout_handler=print,
+    stderr_handler=lambda line: print(line, file=sys.stderr),
+)
+
+print(f"nvflare client exited with status {exit_status}. Exiting.")
+# Processes killed by a signal are reported with the shell convention 128 + signal number
+sys.exit(exit_status if exit_status >= 0 else 128 - exit_status)
@@ -1,7 +1,7 @@
 import os
-import shutil
 import json
 from typing import Dict, Any
+from .sync_directory import sync_directory
 
 def generate_job_meta(min_clients: int) -> Dict[str, Any]:
     return {
@@ -20,8 +20,8 @@ def create_job(app_path: str, job_path: str, min_clients: int) -> None:
     job_app_path = os.path.join(job_path, 'app')
     os.makedirs(job_app_path, exist_ok=True)
 
-    # Copy the app directory
-    shutil.copytree(app_path, job_app_path, dirs_exist_ok=True)
+    # Copy the app directory, skipping files that have not changed
+    sync_directory(app_path, job_app_path)
 
     # Generate and write job_meta to meta.json
     job_meta = generate_job_meta(min_clients)
@@ -1,8 +1,9 @@
 import os
-import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from .create_job import create_job
+from .sync_directory import sync_directory
 # Set up logging
 logger = logging.getLogger(__name__)
 
@@ -13,7 +14,9 @@ def create_run_kits(
     output_directory: str,
     computation_parameters: str,
     host_identifier: str,
-    admin_name: str
+    admin_name: str,
+    max_workers: int = 8,
+    use_hardlinks: bool = False,
 ) -> None:
     logger.info('Running create_run_kits command')
 
@@ -29,29 +32,29 @@ def create_run_kits(
 
         logger.info(f'Found site directories: {site_directories}')
 
-        # Copy each site's startupKit to the runKits directory
-        for site in site_directories:
-            source_path = os.path.join(startup_kits_path, site)
-            destination_path = os.path.join(output_directory, site)
-            logger.info(f'Copying {source_path} to {destination_path}')
-            copy_directory(source_path, destination_path)
-
         # Create the central node runKit
         central_node_path = os.path.join(output_directory, 'centralNode')
         os.makedirs(central_node_path, exist_ok=True)
         logger.info(f'Created central node directory at {central_node_path}')
-        job_path = os.path.join(central_node_path, 'job')
-        create_job(path_app, job_path, min_clients=len(user_ids))
 
-        # Copy the server's startupKit to the central node runKit
-        server_startup_kit_path = os.path.join(startup_kits_path, host_identifier)
-        copy_directory(server_startup_kit_path, os.path.join(central_node_path, 'server'))
-        logger.info(f'Copied server startup kit from {server_startup_kit_path} to {central_node_path}/server')
+        # Sync each site's startupKit, the server's and the admin's startupKits and the job
+        # in parallel. Unchanged files are skipped, so re-provisioning only rewrites what changed.
+        copies = [
+            (os.path.join(startup_kits_path, site), os.path.join(output_directory, site))
+            for site in site_directories
+        ]
+        copies.append((os.path.join(startup_kits_path, host_identifier), os.path.join(central_node_path, 'server')))
+        copies.append((os.path.join(startup_kits_path, admin_name), os.path.join(central_node_path, 'admin')))
 
-        # Copy the admin's startupKit to the central node runKit
-        admin_startup_kit_path = os.path.join(startup_kits_path, admin_name)
-        copy_directory(admin_startup_kit_path, os.path.join(central_node_path, 'admin'))
-        logger.info(f'Copied admin startup kit from {admin_startup_kit_path} to {central_node_path}/admin')
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [
+                pool.submit(copy_directory, source_path, destination_path, use_hardlinks)
+                for source_path, destination_path in copies
+            ]
+            job_path = os.path.join(central_node_path, 'job')
+            futures.append(pool.submit(create_job, path_app, job_path, min_clients=len(user_ids)))
+            for future in futures:
+                future.result()
 
         # Create or modify computationParameters.json within the central node's runKit
         parameters_path = os.path.join(central_node_path, 'parameters.json')
@@ -64,13 +67,10 @@ def create_run_kits(
         logger.error(f'Error creating runKits: {error}')
         raise  # Rethrow or handle as needed
 
-# Helper function to copy directories recursively
-def copy_directory(src: str, dest: str) -> None:
-    if os.path.exists(dest):
-        shutil.rmtree(dest)  # Remove existing destination directory
-        logger.info(f'Removed existing directory at {dest}')
-    shutil.copytree(src, dest)
-    logger.info(f'Copied directory from {src} to {dest}')
+# Helper function to copy directories recursively, skipping unchanged files
+def copy_directory(src: str, dest: str, use_hardlinks: bool = False) -> None:
+    logger.info(f'Copying {src} to {dest}')
+    sync_directory(src, dest, use_hardlinks=use_hardlinks)
 
 # Example usage:
-# create_run_kits('/path/to/startupKits', '/path/to/outputDirectory', '{"param": "value"}', 'example.com', 'admin@admin.com')
+# create_run_kits('/path/to/app', ['site1', 'site2'], '/path/to/startupKits', '/path/to/outputDirectory', '{"param": "value"}', 'example.com', 'admin@admin.com')
@@ -1,11 +1,13 @@
 import subprocess
 import logging
 import os
+from typing import Optional
+from .run_process import run_logged_process
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def create_startup_kits(project_file_path: str, output_directory: str) -> None:
+def create_startup_kits(project_file_path: str, output_directory: str, timeout: Optional[float] = 1800) -> None:
     provision_command = [
         'nvflare',
         'provision',
@@ -25,37 +27,8 @@ def create_startup_kits(project_file_path: str, output_directory: str) -> None:
         # Log that the provision command is starting
         logger.info('Starting provision command...')
 
-        # Use subprocess.Popen for real-time output logging
-        process = subprocess.Popen(
-            provision_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-
-        # Capture and log output from both stdout and stderr in real-time
-        while True:
-            stdout_line = process.stdout.readline()
-            stderr_line = process.stderr.readline()
-
-            # Log stdout if there's output
-            if stdout_line:
-                logger.info(stdout_line.strip())
-
-            # Log stderr if there's output
-            if stderr_line:
-                logger.error(stderr_line.strip())
-
-            # Break the loop when both stdout and stderr are done
-            if stdout_line == '' and stderr_line == '' and process.poll() is not None:
-                break
-
-        # Ensure the process streams are closed
-        process.stdout.close()
-        process.stderr.close()
-
-        # Wait for the process to complete and get the return code
-        return_code = process.wait()
+        # Drain stdout and stderr concurrently so neither stream can stall the other
+        return_code = run_logged_process(provision_command, timeout=timeout)
 
         if return_code != 0:
             logger.error(f'Provision command failed with return code {return_code}')
@@ -63,7 +36,7 @@ def create_startup_kits(project_file_path: str, output_directory: str) -> None:
 
         logger.info('Provisioning completed successfully.')
 
-    except subprocess.CalledProcessError as error:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as error:
         logger.error(f'Failed to execute provision command: {error}')
         raise  # Propagate the error for further handling
 
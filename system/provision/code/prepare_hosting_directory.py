@@ -1,12 +1,29 @@
+import hashlib
 import os
 import zipfile
 import logging
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional
+from .sync_directory import file_digest
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def prepare_hosting_directory(source_dir: str, target_dir: str, exclude: List[str]) -> None:
+# Extensions of files that are already compressed and are stored without deflating
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.whl', '.jar',
+    '.png', '.jpg', '.jpeg', '.gif', '.pdf',
+])
+_FINGERPRINT_PREFIX = b'fingerprint:'
+
+def prepare_hosting_directory(
+    source_dir: str,
+    target_dir: str,
+    exclude: List[str],
+    compression_level: int = 6,
+    max_workers: Optional[int] = None,
+    store_only_extensions: Iterable[str] = INCOMPRESSIBLE_EXTENSIONS,
+) -> None:
     # Ensure target_dir exists
     os.makedirs(target_dir, exist_ok=True)
 
@@ -15,19 +32,82 @@ def prepare_hosting_directory(source_dir: str, target_dir: str, exclude: List[st
         if os.path.isdir(os.path.join(source_dir, name)) and name not in exclude
     ]
 
-    for folder_name in directories:
-        output_zip_path = os.path.join(target_dir, f'{folder_name}.zip')
-        folder_path = os.path.join(source_dir, folder_name)
-        create_zip_from_folder(folder_path, output_zip_path)
-
-def create_zip_from_folder(source_folder: str, output_zip_path: str) -> None:
-    with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(source_folder):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, start=source_folder)
+    # Compress the run kits concurrently in separate processes
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(
+                create_zip_from_folder,
+                os.path.join(source_dir, folder_name),
+                os.path.join(target_dir, f'{folder_name}.zip'),
+                compression_level,
+                store_only_extensions,
+            )
+            for folder_name in directories
+        ]
+        rewritten = sum(future.result() for future in futures)
+    logger.info(f'Prepared {len(directories)} archives in {target_dir} ({rewritten} rewritten)')
+
+def create_zip_from_folder(
+    source_folder: str,
+    output_zip_path: str,
+    compression_level: int = 6,
+    store_only_extensions: Iterable[str] = INCOMPRESSIBLE_EXTENSIONS,
+) -> bool:
+    """
+    Zip a folder, unless the existing archive was built from identical content.
+
+    The fingerprint of the source tree (relative paths and content hashes) and
+    of the compression settings is kept in the archive comment and compared
+    before compressing anything. Files with an incompressible extension, and
+    every file when `compression_level` is 0, are stored without compression.
+
+    :return: Whether the archive was (re)written.
+    """
+    store_only_extensions = frozenset(store_only_extensions)
+    settings = f'{compression_level}:{",".join(sorted(store_only_extensions))}:'
+    fingerprint = _FINGERPRINT_PREFIX + (settings + fingerprint_folder(source_folder)).encode()
+    if _read_archive_comment(output_zip_path) == fingerprint:
+        logger.info(f'Zip up to date: {output_zip_path}')
+        return False
+
+    temporary_zip_path = f'{output_zip_path}.tmp'
+    with zipfile.ZipFile(temporary_zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compression_level) as zipf:
+        for file_path, arcname in _walk_files(source_folder):
+            if compression_level == 0 or os.path.splitext(file_path)[1].lower() in store_only_extensions:
+                zipf.write(file_path, arcname, compress_type=zipfile.ZIP_STORED)
+            else:
                 zipf.write(file_path, arcname)
+        zipf.comment = fingerprint
+    os.replace(temporary_zip_path, output_zip_path)
     logger.info(f'Created zip: {output_zip_path}')
+    return True
+
+def fingerprint_folder(source_folder: str) -> str:
+    """Hash the relative paths and contents of all files in a folder."""
+    digest = hashlib.sha256()
+    for file_path, arcname in _walk_files(source_folder):
+        digest.update(arcname.encode())
+        digest.update(b'\0')
+        digest.update(file_digest(file_path).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _walk_files(source_folder: str):
+    """Yield (path, archive name) of every file in a folder, in a stable order."""
+    for root, dirs, files in os.walk(source_folder):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            yield file_path, os.path.relpath(file_path, start=source_folder)
+
+def _read_archive_comment(zip_path: str) -> Optional[bytes]:
+    if not os.path.exists(zip_path):
+        return None
+    try:
+        with zipfile.ZipFile(zip_path) as zipf:
+            return zipf.comment
+    except zipfile.BadZipFile:
+        return None
 
 # Example usage:
 # prepare_hosting_directory('/path/to/sourceDir', '/path/to/targetDir', ['exclude_folder1', 'exclude_folder2'])
@@ -0,0 +1,96 @@
+import ctypes
+import os
+import signal
+import time
+import logging
+from typing import Iterable, List
+from .run_process import LineHandler, start_logged_process
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# prctl option (linux/prctl.h): orphaned descendants are re-parented to this process instead of init
+PR_SET_CHILD_SUBREAPER = 36
+# Poll interval used only when the process group cannot be waited on directly
+_FALLBACK_POLL_SECONDS = 1.0
+
+def become_subreaper() -> bool:
+    """Make this process the subreaper of its descendants. Returns False where unsupported."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+def supervise_process_tree(
+    command: List[str],
+    stdout_handler: LineHandler = logger.info,
+    stderr_handler: LineHandler = logger.error,
+    forwarded_signals: Iterable[int] = (signal.SIGTERM, signal.SIGINT),
+) -> int:
+    """
+    Run a command and supervise the whole process tree it spawns until every process has exited.
+
+    Launchers such as start.sh exit right after backgrounding the real worker. The
+    supervisor becomes the subreaper of its descendants, so the backgrounded workers
+    stay its children and their exits are observed by a blocking waitpid, without
+    scanning the process table. The tree runs in its own process group, to which the
+    forwarded signals are delivered.
+
+    :param command: The command to run.
+    :param stdout_handler: Called with every stdout line of the tree.
+    :param stderr_handler: Called with every stderr line of the tree.
+    :param forwarded_signals: Signals received by this process that are forwarded to the tree.
+    :return: The exit status of the last process of the tree to exit; the negated
+             signal number if it was killed by a signal.
+    """
+    if not become_subreaper():
+        logger.warning('Cannot become a subreaper; orphaned descendants are tracked by process group')
+
+    process, _ = start_logged_process(command, stdout_handler=stdout_handler,
+                                      stderr_handler=stderr_handler, start_new_session=True)
+    process_group = process.pid
+
+    def forward_signal(signum, frame):
+        logger.info(f'Forwarding signal {signal.Signals(signum).name} to process group {process_group}')
+        try:
+            os.killpg(process_group, signum)
+        except ProcessLookupError:
+            pass
+
+    previous_handlers = {signum: signal.signal(signum, forward_signal) for signum in forwarded_signals}
+    exit_status = 0
+    try:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break  # No children left
+            exit_status = _exit_status(status)
+            if pid == process.pid:
+                process.returncode = exit_status
+            logger.info(f'Process {pid} exited with status {exit_status}')
+
+        # Without a subreaper, orphaned members of the group are not our children
+        while _process_group_alive(process_group):
+            time.sleep(_FALLBACK_POLL_SECONDS)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+    logger.info(f'Process tree of {command} exited with status {exit_status}')
+    return exit_status
+
+def _exit_status(wait_status: int) -> int:
+    if os.WIFSIGNALED(wait_status):
+        return -os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
+def _process_group_alive(process_group: int) -> bool:
+    try:
+        os.killpg(process_group, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
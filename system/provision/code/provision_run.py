@@ -3,6 +3,7 @@ import logging
 from .generate_project_file import generate_project_file
 from .create_startup_kits import create_startup_kits
 from .create_run_kits import create_run_kits
+from .sync_directory import file_digest
 from typing import List
 
 
@@ -30,24 +31,34 @@ def provision_run(
     ensure_directory_exists(path_startup_kits)
     ensure_directory_exists(path_run_kits)
 
+    project_file_path = os.path.join(path_run, 'Project.yml')
+    startup_kits_path = os.path.join(path_startup_kits, 'project', 'prod_00')
+    previous_project_digest = file_digest(project_file_path) if os.path.exists(project_file_path) else None
+
     generate_project_file(
         project_name='project',
         host_identifier=host_identifier,
         fed_learn_port=fed_learn_port,
         admin_port=admin_port,
-        output_file_path=os.path.join(path_run, 'Project.yml'),
+        output_file_path=project_file_path,
         site_names=user_ids,
     )
 
-    create_startup_kits(
-        project_file_path=os.path.join(path_run, 'Project.yml'),
-        output_directory=path_startup_kits,
-    )
+    # Provisioning issues new certificates, which would force every run kit to be
+    # rebuilt, so it is skipped when the project (participants, ports) is unchanged,
+    # e.g. when only the computation parameters changed
+    if previous_project_digest == file_digest(project_file_path) and os.path.isdir(startup_kits_path):
+        logger.info('Project file unchanged; reusing existing startup kits.')
+    else:
+        create_startup_kits(
+            project_file_path=project_file_path,
+            output_directory=path_startup_kits,
+        )
 
     create_run_kits(
         path_app=path_app,
         user_ids=user_ids,
-        startup_kits_path=os.path.join(path_startup_kits, 'project', 'prod_00'),
+        startup_kits_path=startup_kits_path,
         output_directory=path_run_kits,
         computation_parameters=computation_parameters,
         host_identifier=host_identifier,
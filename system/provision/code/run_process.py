@@ -0,0 +1,86 @@
+import subprocess
+import threading
+import logging
+from typing import Callable, IO, List, Optional, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+LineHandler = Callable[[str], None]
+
+def start_logged_process(
+    command: List[str],
+    cwd: Optional[str] = None,
+    stdout_handler: LineHandler = logger.info,
+    stderr_handler: LineHandler = logger.error,
+    start_new_session: bool = False,
+) -> Tuple[subprocess.Popen, List[threading.Thread]]:
+    """
+    Start a process and pump its stdout and stderr concurrently, one thread per stream.
+
+    Each stream is drained independently, so a quiet stream never delays the other
+    and a chatty stream can never fill its pipe and block the process.
+
+    :param command: The command to run.
+    :param cwd: Working directory of the process.
+    :param stdout_handler: Called with every stdout line (without the trailing newline).
+    :param stderr_handler: Called with every stderr line (without the trailing newline).
+    :param start_new_session: Start the process in its own session and process group.
+    :return: The process and its pump threads.
+    """
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        start_new_session=start_new_session,
+    )
+    pumps = [
+        threading.Thread(target=_pump_stream, args=(process.stdout, stdout_handler), daemon=True),
+        threading.Thread(target=_pump_stream, args=(process.stderr, stderr_handler), daemon=True),
+    ]
+    for pump in pumps:
+        pump.start()
+    return process, pumps
+
+def run_logged_process(
+    command: List[str],
+    cwd: Optional[str] = None,
+    timeout: Optional[float] = None,
+    stdout_handler: LineHandler = logger.info,
+    stderr_handler: LineHandler = logger.error,
+    drain_after_exit: bool = True,
+) -> int:
+    """
+    Run a process to completion while pumping its output, with an overall timeout.
+
+    :param command: The command to run.
+    :param cwd: Working directory of the process.
+    :param timeout: Seconds to wait for the process before killing it. None waits forever.
+    :param stdout_handler: Called with every stdout line.
+    :param stderr_handler: Called with every stderr line.
+    :param drain_after_exit: Wait until both streams are closed before returning. Disable this
+                             for launcher scripts (such as start.sh) that leave background
+                             processes holding the streams; their output keeps being pumped.
+    :return: The return code of the process.
+    :raises subprocess.TimeoutExpired: If the process did not finish within the timeout.
+    """
+    process, pumps = start_logged_process(command, cwd, stdout_handler, stderr_handler)
+    try:
+        return_code = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.error(f'Process {command} did not finish within {timeout} s; killing it')
+        process.kill()
+        process.wait()
+        raise
+
+    if drain_after_exit:
+        for pump in pumps:
+            pump.join()
+    return return_code
+
+def _pump_stream(stream: IO[str], handler: LineHandler) -> None:
+    with stream:
+        for line in stream:
+            handler(line.rstrip('\n'))
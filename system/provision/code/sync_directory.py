@@ -0,0 +1,95 @@
+import hashlib
+import os
+import shutil
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sync_directory(src: str, dest: str, use_hardlinks: bool = False) -> int:
+    """
+    Make `dest` an exact copy of `src`, touching only what changed.
+
+    Files are skipped when the destination already has the same content: the
+    size and modification time are compared first (copies keep the source
+    mtime), and the content hash only when those differ. Files and directories
+    that no longer exist in `src` are removed from `dest`.
+
+    :param src: Source directory.
+    :param dest: Destination directory.
+    :param use_hardlinks: Hardlink changed files instead of copying them. Only use this
+                          when the destination files are never modified in place.
+    :return: Number of files copied or linked.
+    """
+    if not os.path.isdir(src):
+        raise FileNotFoundError(f"Source directory '{src}' does not exist.")
+    dest = os.path.normpath(dest)
+
+    updated = 0
+    expected_paths = set()
+    for root, dirs, files in os.walk(src):
+        relative_root = os.path.relpath(root, src)
+        dest_root = os.path.normpath(os.path.join(dest, relative_root))
+        os.makedirs(dest_root, exist_ok=True)
+        expected_paths.add(dest_root)
+        for name in files:
+            source_file = os.path.join(root, name)
+            dest_file = os.path.join(dest_root, name)
+            expected_paths.add(dest_file)
+            if not _is_up_to_date(source_file, dest_file):
+                _replace_file(source_file, dest_file, use_hardlinks)
+                updated += 1
+
+    # Remove anything that is not in the source anymore, deepest paths first
+    for root, dirs, files in os.walk(dest, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            if path not in expected_paths:
+                os.remove(path)
+        for name in dirs:
+            path = os.path.join(root, name)
+            if path in expected_paths:
+                continue
+            if os.path.islink(path):
+                os.remove(path)
+            else:
+                shutil.rmtree(path)
+
+    logger.info(f'Synced {src} to {dest} ({updated} files updated)')
+    return updated
+
+
+def _is_up_to_date(source_file: str, dest_file: str) -> bool:
+    if not os.path.isfile(dest_file) or os.path.islink(dest_file):
+        return False
+    source_stat = os.stat(source_file)
+    dest_stat = os.stat(dest_file)
+    if source_stat.st_size != dest_stat.st_size:
+        return False
+    if source_stat.st_mtime_ns == dest_stat.st_mtime_ns or os.path.samefile(source_file, dest_file):
+        return True
+    return file_digest(source_file) == file_digest(dest_file)
+
+
+def _replace_file(source_file: str, dest_file: str, use_hardlinks: bool) -> None:
+    if os.path.lexists(dest_file):
+        os.remove(dest_file)
+    if use_hardlinks:
+        try:
+            os.link(source_file, dest_file)
+            return
+        except OSError:
+            pass  # e.g. across file systems; fall back to a copy
+    shutil.copy2(source_file, dest_file)
@@ -0,0 +1,234 @@
+"""
+Correctness and speed oracle for the federated regression path.
+
+Runs the same multi-site data through
+
+- the reference engine: per dependent, sklearn's Ridge for the coefficients and
+  statsmodels' OLS for the statistics, as the computation was originally written,
+- the federated path: perform_ridge_regression at every site and
+  calculate_global_values on the server,
+- the pooled reference: one fit on the stacked site data (each site standardized
+  on its own, as in docs/non_federated_regression.py),
+
+and reports the deviation per statistic and the speedup of the site engine.
+
+The site and global deviations (federated vs reference engine) are gated by
+--rtol/--atol, so engine or precision changes can be checked before merging.
+The pooled deviation measures how far the federated averages are from a pooled
+fit; it is only gated when --pooled-rtol is given.
+
+Usage (from the repository root):
+
+    python tools/federated_oracle.py --data-dir test_data
+    python tools/federated_oracle.py --sites 10 --subjects 200 --dependents 100
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from sklearn.linear_model import Ridge
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "code"))
+
+from aggregator.calculate_global_values import calculate_global_values  # noqa: E402
+from executor.perform_ridge_regression import perform_ridge_regression, RIDGE_ALPHA  # noqa: E402
+
+STATISTICS = ["Coefficients", "t-Statistics", "P-Values", "R-Squared", "Degrees of Freedom", "Sum of Squared Errors"]
+
+
+def reference_site_regression(covariates_path, data_path, covariates_headers, data_headers):
+    """The reference engine at one site."""
+    X = reference_design(covariates_path, covariates_headers)
+    return reference_regression(X, pd.read_csv(data_path), covariates_headers, data_headers)
+
+
+def pooled_regression(sites, covariates_headers, data_headers):
+    """The pooled reference: the site designs and dependents stacked into one fit per dependent."""
+    X = np.vstack([reference_design(covariates_path, covariates_headers) for covariates_path, _ in sites.values()])
+    data = pd.concat([pd.read_csv(data_path)[data_headers] for _, data_path in sites.values()], ignore_index=True)
+    return reference_regression(X, data, covariates_headers, data_headers)
+
+
+def reference_design(covariates_path, covariates_headers):
+    """Standardized covariates of a site with a constant column for the intercept."""
+    covariates = StandardScaler().fit_transform(pd.read_csv(covariates_path)[covariates_headers])
+    return sm.add_constant(covariates, has_constant='add')
+
+
+def reference_regression(X, data, covariates_headers, data_headers):
+    """One sklearn Ridge and one statsmodels OLS fit per dependent, as the computation was originally written."""
+    results = {}
+    constant = np.all(X == 0, axis=0)
+    for dependent_var in data_headers:
+        y = data[dependent_var].to_numpy()
+        ridge_model = Ridge(alpha=RIDGE_ALPHA).fit(X, y)
+        with warnings.catch_warnings():
+            # A covariate that is constant at a site makes the design rank deficient
+            warnings.simplefilter("ignore")
+            ols_model = sm.OLS(y, X).fit()
+        # statsmodels reports pinv artefacts for a constant (standardized to zero) covariate;
+        # its statistics are undefined, as in the site engine
+        t_values, p_values = np.array(ols_model.tvalues), np.array(ols_model.pvalues)
+        t_values[constant], p_values[constant] = np.nan, np.nan
+        results[dependent_var] = {
+            "Variables": ['Intercept'] + covariates_headers,
+            "Coefficients": ridge_model.coef_.tolist(),
+            "t-Statistics": t_values.tolist(),
+            "P-Values": p_values.tolist(),
+            "R-Squared": ols_model.rsquared,
+            "Degrees of Freedom": ols_model.df_resid,
+            "Sum of Squared Errors": float(np.sum((y - ridge_model.predict(X)) ** 2)),
+        }
+    return results
+
+
+def deviations(actual, expected, atol):
+    """
+    Maximum relative deviation per statistic over all dependents, with |expected| floored at
+    `atol`. Values that are NaN in either result (statistics that are undefined, e.g. for a
+    covariate that is constant at a site) are excluded and counted.
+    """
+    report = {}
+    for key in STATISTICS:
+        a = np.concatenate([np.atleast_1d(np.asarray(actual[d][key], dtype=float)) for d in expected])
+        e = np.concatenate([np.atleast_1d(np.asarray(expected[d][key], dtype=float)) for d in expected])
+        defined = ~(np.isnan(a) | np.isnan(e))
+        relative = np.abs(a[defined] - e[defined]) / np.maximum(np.abs(e[defined]), atol)
+        report[key] = (float(relative.max()) if relative.size else 0.0, int((~defined).sum()))
+    return report
+
+
+def undefined_global_statistics(site_results, global_results):
+    """
+    Number of global t-statistics and p-values that are undefined (NaN) although at least
+    one site defines them; the global statistics average over the sites that define them.
+    """
+    count = 0
+    for key in ["t-Statistics", "P-Values"]:
+        for dependent_var, stats in global_results.items():
+            defined_at_a_site = np.any(
+                [~np.isnan(np.asarray(results[dependent_var][key], dtype=float)) for results in site_results.values()],
+                axis=0)
+            count += int(np.sum(np.isnan(np.asarray(stats[key], dtype=float)) & defined_at_a_site))
+    return count
+
+
+def generate_sites(directory, n_sites, n_subjects, n_covariates, n_dependents, seed):
+    """Write synthetic sites with shared effects and site-specific offsets; return their file paths."""
+    rng = np.random.default_rng(seed)
+    covariates_headers = [f"covariate{i}" for i in range(n_covariates)]
+    data_headers = [f"dependent{i}" for i in range(n_dependents)]
+    effects = rng.normal(size=(n_covariates, n_dependents))
+    sites = {}
+    for site in range(n_sites):
+        site_directory = os.path.join(directory, f"site{site + 1}")
+        os.makedirs(site_directory, exist_ok=True)
+        covariates = rng.normal(loc=rng.normal(), size=(n_subjects, n_covariates))
+        data = covariates @ effects + rng.normal(size=n_dependents) + rng.normal(size=(n_subjects, n_dependents))
+        paths = (os.path.join(site_directory, "covariates.csv"), os.path.join(site_directory, "data.csv"))
+        pd.DataFrame(covariates, columns=covariates_headers).to_csv(paths[0], index=False)
+        pd.DataFrame(data, columns=data_headers).to_csv(paths[1], index=False)
+        sites[f"site{site + 1}"] = paths
+    return sites, covariates_headers, data_headers
+
+
+def load_sites(data_directory, parameters_path):
+    """Sites are the subdirectories of the data directory that have covariates.csv and data.csv."""
+    sites = {}
+    for name in sorted(os.listdir(data_directory)):
+        paths = (os.path.join(data_directory, name, "covariates.csv"), os.path.join(data_directory, name, "data.csv"))
+        if all(os.path.exists(path) for path in paths):
+            sites[name] = paths
+    with open(parameters_path or os.path.join(data_directory, "server", "parameters.json")) as f:
+        parameters = json.load(f)
+    return sites, parameters["Covariates"], parameters["Dependents"]
+
+
+def print_report(title, report, tolerance=None):
+    print(f"\n{title}")
+    for key, (deviation, undefined) in report.items():
+        note = f" ({undefined} undefined values skipped)" if undefined else ""
+        status = "" if tolerance is None else ("  ok" if deviation <= tolerance else "  FAIL")
+        print(f"  {key:<24} {deviation:.3e}{note}{status}")
+
+
+def run(sites, covariates_headers, data_headers, args):
+    start = time.perf_counter()
+    reference_sites = {
+        site: reference_site_regression(covariates_path, data_path, covariates_headers, data_headers)
+        for site, (covariates_path, data_path) in sites.items()
+    }
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    federated_sites = {
+        site: perform_ridge_regression(covariates_path, data_path, covariates_headers, data_headers)
+        for site, (covariates_path, data_path) in sites.items()
+    }
+    federated_global = calculate_global_values(federated_sites, covariates_headers)
+    federated_seconds = time.perf_counter() - start
+    reference_global = calculate_global_values(reference_sites, covariates_headers)
+
+    print(f"{len(sites)} sites, {len(covariates_headers)} covariates, {len(data_headers)} dependents")
+    print(f"Reference engine: {reference_seconds:.3f} s")
+    print(f"Federated path:   {federated_seconds:.3f} s (speedup {reference_seconds / federated_seconds:.1f}x)")
+
+    site_report = {}
+    for site in sites:
+        for key, (deviation, undefined) in deviations(federated_sites[site], reference_sites[site], args.atol).items():
+            previous = site_report.get(key, (0.0, 0))
+            site_report[key] = (max(previous[0], deviation), previous[1] + undefined)
+    global_report = deviations(federated_global, reference_global, args.atol)
+    pooled_report = deviations(federated_global, pooled_regression(sites, covariates_headers, data_headers), args.atol)
+
+    print_report("Site results, federated vs reference engine (max relative deviation):", site_report, args.rtol)
+    print_report("Global results, federated vs reference engine:", global_report, args.rtol)
+    print_report("Global results, federated vs pooled fit:", pooled_report, args.pooled_rtol)
+
+    undefined = undefined_global_statistics(federated_sites, federated_global)
+    print(f"\nGlobal t-statistics and p-values undefined although a site defines them: {undefined}"
+          f"{'  FAIL' if undefined else '  ok'}")
+
+    failed = any(deviation > args.rtol for report in (site_report, global_report) for deviation, _ in report.values())
+    failed |= undefined > 0
+    if args.pooled_rtol is not None:
+        failed |= any(deviation > args.pooled_rtol for deviation, _ in pooled_report.values())
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", help="Load sites from this directory instead of generating them")
+    parser.add_argument("--parameters", help="parameters.json of loaded sites (default: <data-dir>/server/parameters.json)")
+    parser.add_argument("--sites", type=int, default=5, help="Number of generated sites")
+    parser.add_argument("--subjects", type=int, default=200, help="Subjects per generated site")
+    parser.add_argument("--covariates", type=int, default=4, help="Number of generated covariates")
+    parser.add_argument("--dependents", type=int, default=50, help="Number of generated dependents")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="Allowed relative deviation from the reference engine")
+    parser.add_argument("--atol", type=float, default=1e-8, help="Floor of |expected| in the relative deviation")
+    parser.add_argument("--pooled-rtol", type=float, default=None, help="Allowed relative deviation from the pooled fit")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        passed = run(*load_sites(args.data_dir, args.parameters), args)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            sites, covariates_headers, data_headers = generate_sites(
+                directory, args.sites, args.subjects, args.covariates, args.dependents, args.seed)
+            passed = run(sites, covariates_headers, data_headers, args)
+
+    print("\nOK" if passed else "\nFAILED: deviations exceed the tolerances")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Load-test harness for the server workflow (SrrController and SrrAggregator).
+
+Runs the real control flow and aggregation of the server against many stand-in
+clients instead of NVFlare sites. The stand-in clients answer every task with a
+synthetic result payload of a configurable size, after a log-normally distributed
+latency, and fail with a configurable probability (a failing site answers every
+task with EXECUTION_EXCEPTION). Payloads are delivered pickled, so the server pays
+for deserializing them as it does behind the NVFlare transport.
+
+Every combination of the varied parameters runs in a fresh process, and the tool
+reports per run:
+
+- round: end-to-end time of the control flow (all broadcasts and aggregations),
+- peak RSS: peak resident memory of the server process above its baseline,
+- accepts/s: site results accepted per second of accept callbacks,
+- aggregation: total time spent in SrrAggregator.aggregate (and spool_block with result blocks).
+
+Parameters that take comma-separated lists are varied; e.g. from the repository root:
+
+    python tools/load_test_server.py --sites 50,200,500 --payload-mb 0.5,2
+    python tools/load_test_server.py --sites 500 --payload-mb 2 --result-block-size 500 --relay-group-size 50
+    python tools/load_test_server.py --sites 100 --latency-median 0.5 --latency-sigma 1 --failure-rate 0,0.05
+"""
+import argparse
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
+import resource
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "code"))
+
+from nvflare.apis.fl_constant import ReservedKey, ReturnCode  # noqa: E402
+from nvflare.apis.fl_context import FLContext  # noqa: E402
+from nvflare.apis.shareable import Shareable, make_reply  # noqa: E402
+from nvflare.apis.signal import Signal  # noqa: E402
+
+from aggregator.aggregator import SrrAggregator  # noqa: E402
+from controller.controller import (  # noqa: E402
+    SrrController, TASK_NAME_PERFORM_REGRESSION, TASK_NAME_GET_RESULT_BLOCK,
+)
+
+
+def synthetic_result(n_dependents, n_covariates, seed=0):
+    """A site result with the structure of perform_ridge_regression and random statistics."""
+    rng = np.random.default_rng(seed)
+    variables = ["Intercept"] + [f"covariate{i}" for i in range(n_covariates)]
+    return {
+        f"dependent{j}": {
+            "Variables": variables,
+            "Coefficients": rng.normal(size=n_covariates + 1).tolist(),
+            "t-Statistics": rng.normal(size=n_covariates + 1).tolist(),
+            "P-Values": rng.uniform(size=n_covariates + 1).tolist(),
+            "R-Squared": float(rng.uniform()),
+            "Degrees of Freedom": 100.0,
+            "Sum of Squared Errors": float(rng.uniform(1, 10)),
+        }
+        for j in range(n_dependents)
+    }
+
+
+def dependents_for_payload(payload_bytes, n_covariates):
+    """Number of dependents whose pickled site result is about `payload_bytes` long."""
+    sample = 100
+    bytes_per_dependent = len(pickle.dumps(synthetic_result(sample, n_covariates))) / sample
+    return max(1, int(round(payload_bytes / bytes_per_dependent)))
+
+
+class StandInClients:
+    """
+    Simulated sites. Responses are delivered in order of their simulated arrival time from
+    the calling thread, as NVFlare delivers task results to the controller one at a time.
+    """
+
+    def __init__(self, n_sites, payload, n_dependents, latency_median, latency_sigma, failure_rate, seed):
+        self.names = [f"site{i + 1}" for i in range(n_sites)]
+        self._rng = np.random.default_rng(seed)
+        self._failed = set(name for name in self.names if self._rng.uniform() < failure_rate)
+        self._latency_median = latency_median
+        self._latency_sigma = latency_sigma
+        self._payload = payload
+        self._dependents = [f"dependent{j}" for j in range(n_dependents)]
+        self._payload_blocks = {}
+        self._block_size = 0
+        self.deliveries = 0
+
+    def respond(self, task, targets, result_cb, fl_ctx):
+        """Answer a broadcast task from every target site and pass each answer to the callback."""
+        start = time.perf_counter()
+        arrivals = [(start + self._latency(), name) for name in targets]
+        heapq.heapify(arrivals)
+        while arrivals:
+            arrival, name = heapq.heappop(arrivals)
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            reply = self._reply(name, task)
+            reply.set_peer_props({ReservedKey.IDENTITY_NAME: name})
+            self.deliveries += 1
+            if result_cb is not None:
+                result_cb(SimpleNamespace(client=SimpleNamespace(name=name), task=task, result=reply), fl_ctx)
+
+    def _latency(self):
+        if self._latency_median <= 0:
+            return 0.0
+        return float(self._latency_median * np.exp(self._latency_sigma * self._rng.standard_normal()))
+
+    def _reply(self, name, task):
+        if name in self._failed:
+            return make_reply(ReturnCode.EXECUTION_EXCEPTION)
+        if task.name not in (TASK_NAME_PERFORM_REGRESSION, TASK_NAME_GET_RESULT_BLOCK):
+            return Shareable()
+        if task.name == TASK_NAME_PERFORM_REGRESSION:
+            self._block_size = task.data.get("result_block_size", 0)
+        reply = Shareable()
+        # Each site deserializes its own copy of the payload, as the server transport does
+        reply["result"] = pickle.loads(self._block_payload(task.data.get("block", 0)))
+        return reply
+
+    def _block_payload(self, block):
+        """Pickled payload of a result block (the whole result without blocks)."""
+        if self._block_size <= 0:
+            return self._payload
+        if block not in self._payload_blocks:
+            result = pickle.loads(self._payload)
+            names = self._dependents[block * self._block_size:(block + 1) * self._block_size]
+            self._payload_blocks[block] = pickle.dumps({name: result[name] for name in names})
+        return self._payload_blocks[block]
+
+
+class LoadTestController(SrrController):
+    """SrrController whose broadcasts are answered by stand-in clients instead of NVFlare sites."""
+
+    def __init__(self, clients, aggregator, **kwargs):
+        super().__init__(wait_time_after_min_received=0, **kwargs)
+        self.clients = clients
+        self.srr_aggregator = aggregator
+
+    def broadcast_and_wait(self, task, fl_ctx, targets=None, min_responses=1, wait_time_after_min_received=0,
+                           abort_signal=None):
+        self.clients.respond(task, targets or self.clients.names, task.result_received_cb, fl_ctx)
+
+
+def run_load_test(config):
+    """Run the server workflow once for a configuration; executed in a fresh process."""
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    n_dependents = dependents_for_payload(config["payload_mb"] * 2**20, config["covariates"])
+    payload = pickle.dumps(synthetic_result(n_dependents, config["covariates"]), protocol=pickle.HIGHEST_PROTOCOL)
+    clients = StandInClients(
+        config["sites"], payload, n_dependents, config["latency_median"], config["latency_sigma"],
+        config["failure_rate"], config["seed"])
+
+    aggregator = SrrAggregator(relay_group_size=config["relay_group_size"])
+    timings = {"accept": 0.0, "aggregate": 0.0, "accepted": 0}
+    accept, aggregate, spool_block = aggregator.accept, aggregator.aggregate, aggregator.spool_block
+
+    def timed_accept(site_result, fl_ctx):
+        start = time.perf_counter()
+        accepted = accept(site_result, fl_ctx)
+        timings["accept"] += time.perf_counter() - start
+        timings["accepted"] += bool(accepted)
+        return accepted
+
+    def timed(aggregation):
+        def timed_aggregation(fl_ctx):
+            start = time.perf_counter()
+            try:
+                return aggregation(fl_ctx)
+            finally:
+                timings["aggregate"] += time.perf_counter() - start
+        return timed_aggregation
+
+    aggregator.accept, aggregator.aggregate, aggregator.spool_block = timed_accept, timed(aggregate), timed(spool_block)
+    controller = LoadTestController(
+        clients, aggregator, min_clients=config["sites"], result_block_size=config["result_block_size"])
+
+    fl_ctx = FLContext()
+    fl_ctx.set_prop("COMPUTATION_PARAMETERS", {
+        "Covariates": [f"covariate{i}" for i in range(config["covariates"])],
+        "Dependents": [f"dependent{j}" for j in range(n_dependents)],
+    }, private=False, sticky=True)
+
+    error = None
+    start = time.perf_counter()
+    try:
+        controller.control_flow(Signal(), fl_ctx)
+    except Exception as e:  # A run that breaks the server is a result of the load test
+        error = f"{type(e).__name__}: {e}"
+    round_seconds = time.perf_counter() - start
+
+    return {
+        **config,
+        "dependents": n_dependents,
+        "round_seconds": round_seconds,
+        "peak_rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024,
+        "accepts_per_second": timings["accepted"] / timings["accept"] if timings["accept"] else float("nan"),
+        "accepted": timings["accepted"],
+        "aggregate_seconds": timings["aggregate"],
+        "error": error,
+    }
+
+
+def run_in_fresh_process(context, config):
+    """
+    Run a configuration in a fresh process, so peak memory is measured per configuration.
+
+    The process is not daemonic (as pool workers are), so the relay processes of
+    hierarchical aggregation can be started. A process that exits without a result row
+    is reported as a failed run.
+    """
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_send_load_test, args=(config, sender))
+    process.start()
+    sender.close()
+    try:
+        row = receiver.recv()
+    except EOFError:
+        row = None
+    finally:
+        receiver.close()
+    process.join()
+    if row is None:
+        row = {**config, "error": f"The load test process exited with code {process.exitcode}"}
+    return row
+
+
+def _send_load_test(config, sender):
+    try:
+        sender.send(run_load_test(config))
+    finally:
+        sender.close()
+
+
+def parse_list(value, kind):
+    return [kind(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", default="10,100", help="Numbers of stand-in sites (comma-separated)")
+    parser.add_argument("--payload-mb", default="1", help="Site result payload sizes in MB (comma-separated)")
+    parser.add_argument("--latency-median", default="0", help="Median response latency in seconds (comma-separated)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal sigma of the response latency")
+    parser.add_argument("--failure-rate", default="0", help="Probability that a site fails (comma-separated)")
+    parser.add_argument("--result-block-size", default="0", help="srr_workflow result_block_size (comma-separated)")
+    parser.add_argument("--relay-group-size", default="0", help="srr_aggregator relay_group_size (comma-separated)")
+    parser.add_argument("--covariates", type=int, default=4, help="Number of covariates of the synthetic results")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latencies and failures")
+    args = parser.parse_args()
+
+    varied = {
+        "sites": parse_list(args.sites, int),
+        "payload_mb": parse_list(args.payload_mb, float),
+        "latency_median": parse_list(args.latency_median, float),
+        "failure_rate": parse_list(args.failure_rate, float),
+        "result_block_size": parse_list(args.result_block_size, int),
+        "relay_group_size": parse_list(args.relay_group_size, int),
+    }
+    fixed = {"latency_sigma": args.latency_sigma, "covariates": args.covariates, "seed": args.seed}
+
+    header = (f"{'sites':>6} {'MB/site':>8} {'latency':>8} {'fail':>5} {'block':>6} {'relay':>6} "
+              f"{'deps':>7} {'round s':>9} {'peak RSS MB':>12} {'accepts/s':>10} {'aggregate s':>12} {'accepted':>9}")
+    print(header)
+    print("-" * len(header))
+    failed_runs = 0
+    context = multiprocessing.get_context("spawn")
+    runs = list(itertools.product(*varied.values()))
+    for values in runs:
+        row = run_in_fresh_process(context, {**dict(zip(varied, values)), **fixed})
+        configuration = (f"{row['sites']:>6} {row['payload_mb']:>8g} {row['latency_median']:>8g} "
+                         f"{row['failure_rate']:>5g} {row['result_block_size']:>6} {row['relay_group_size']:>6}")
+        # The timings of a failed run only cover the work done until the failure
+        if row["error"]:
+            failed_runs += 1
+            print(f"{configuration}  server error: {row['error']}")
+            continue
+        print(f"{configuration} {row['dependents']:>7} "
+              f"{row['round_seconds']:>9.2f} {row['peak_rss_mb']:>12.1f} {row['accepts_per_second']:>10.1f} "
+              f"{row['aggregate_seconds']:>12.2f} {row['accepted']:>9}")
+    if failed_runs:
+        print(f"\n{failed_runs} of {len(runs)} runs failed")
+    sys.exit(1 if failed_runs else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Local multi-process harness for hierarchical aggregation.
+
+Simulates a federation of hundreds of sites: every site writes its own synthetic
+covariates.csv and data.csv and runs the site regression in a separate process.
+The site results are then aggregated twice, directly (as SrrAggregator does by
+default) and through a RelayTree of relay processes, and the two global results
+are compared.
+
+Usage (from the repository root):
+
+    python tools/simulate_hierarchical_aggregation.py --sites 300 --group-size 25
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "code"))
+
+from aggregator.calculate_global_values import calculate_global_values, finalize_global_values  # noqa: E402
+from aggregator.relay_aggregation import RelayTree  # noqa: E402
+from executor.perform_ridge_regression import perform_ridge_regression  # noqa: E402
+
+STATISTICS = ["Coefficients", "t-Statistics", "P-Values", "R-Squared", "Degrees of Freedom", "Sum of Squared Errors"]
+
+
+def simulate_site(site_index, directory, n_subjects, covariates_headers, data_headers):
+    """Write the data of one synthetic site and run its local regression."""
+    rng = np.random.default_rng(site_index)
+    site_directory = os.path.join(directory, f"site{site_index}")
+    os.makedirs(site_directory, exist_ok=True)
+
+    covariates = rng.normal(size=(n_subjects, len(covariates_headers)))
+    effects = rng.normal(size=(len(covariates_headers), len(data_headers)))
+    data = covariates @ effects + rng.normal(size=(n_subjects, len(data_headers)))
+    covariates_path = os.path.join(site_directory, "covariates.csv")
+    data_path = os.path.join(site_directory, "data.csv")
+    pd.DataFrame(covariates, columns=covariates_headers).to_csv(covariates_path, index=False)
+    pd.DataFrame(data, columns=data_headers).to_csv(data_path, index=False)
+
+    return f"site{site_index}", perform_ridge_regression(covariates_path, data_path, covariates_headers, data_headers)
+
+
+def max_deviation(expected, actual):
+    """Largest absolute difference between two global results over all statistics."""
+    deviation = 0.0
+    for dependent, stats in expected.items():
+        for key in STATISTICS:
+            difference = np.abs(np.asarray(stats[key], dtype=float) - np.asarray(actual[dependent][key], dtype=float))
+            deviation = max(deviation, float(np.nanmax(difference)))
+    return deviation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=300, help="Number of simulated sites")
+    parser.add_argument("--subjects", type=int, default=100, help="Subjects per site")
+    parser.add_argument("--covariates", type=int, default=4, help="Number of covariates")
+    parser.add_argument("--dependents", type=int, default=50, help="Number of dependents")
+    parser.add_argument("--group-size", type=int, default=25, help="Sites pre-combined by each relay")
+    parser.add_argument("--relays", type=int, default=None, help="Relay processes (default: one per CPU)")
+    parser.add_argument("--site-workers", type=int, default=None, help="Processes simulating sites")
+    parser.add_argument("--tolerance", type=float, default=1e-9, help="Allowed deviation from direct aggregation")
+    args = parser.parse_args()
+
+    covariates_headers = [f"covariate{i}" for i in range(args.covariates)]
+    data_headers = [f"dependent{i}" for i in range(args.dependents)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.site_workers) as pool:
+            futures = [
+                pool.submit(simulate_site, i, directory, args.subjects, covariates_headers, data_headers)
+                for i in range(args.sites)
+            ]
+            site_results = dict(future.result() for future in futures)
+        print(f"Simulated {args.sites} sites in {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    direct = calculate_global_values(site_results, covariates_headers)
+    direct_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    relay_tree = RelayTree(args.group_size, args.relays)
+    for site_name, result in site_results.items():
+        relay_tree.add(site_name, result)
+    partial, _ = relay_tree.merge()
+    hierarchical = finalize_global_values(partial, covariates_headers)
+    hierarchical_seconds = time.perf_counter() - start
+
+    deviation = max_deviation(direct, hierarchical)
+    n_groups = -(-args.sites // args.group_size)
+    print(f"Direct aggregation:       {direct_seconds:.3f} s")
+    print(f"Hierarchical aggregation: {hierarchical_seconds:.3f} s ({n_groups} relay groups of up to {args.group_size} sites)")
+    print(f"Max deviation:            {deviation:.3e}")
+    if deviation > args.tolerance:
+        print(f"FAILED: deviation exceeds the tolerance of {args.tolerance:g}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()